@@ -8,7 +8,7 @@ editing a specific value on an object.
 """
 from evennia.contrib.base_systems.building_menu import BuildingMenu
 from commands.command import MuxCommand, Command
-from commands.building.room_building import RoomSculptingMenu
+from commands.building.room_building import RoomSculptingMenu, update_zone_rooms
 from commands.building.item_building import ItemMakingMenu, ItemSculptingMenu
 from evennia import create_object, default_cmds
 from typeclasses.objects import Object
@@ -16,6 +16,12 @@ from typeclasses.items import Building
 from evennia.utils.logger import log_file
 from evennia import utils as utils
 from world.handlers.biomes import apply_biomes
+from world.handlers.map_index import ROOM_INDEX, CARDINAL_OFFSETS, DIRECTION_NAMES
+from world.handlers.coordinate_worm import CoordinateWorm
+from world.handlers.builder_jobs import JOBS, start_job, cancel_job
+from world.handlers.biome_simulation import reset_zone_biomes
+from world.handlers.zone_integrity import scan_zone, scan_world, fix_steps
+from world.handlers.room_grid import RoomGrid
 from django.conf import settings
 
 
@@ -230,32 +236,14 @@ class CmdDig(default_cmds.CmdDig, MuxCommand):
             typeclass,
         )
         # set coordinates of connected room based upon current room
-        if self.rhs_objs:
-            to_exit = self.rhs_objs[0]
-            if to_exit["name"] == "north" or to_exit["name"] =="n":
-                new_room.traits.ycord.base = self.caller.location.traits.ycord.base + 1
-                new_room.traits.xcord.base = self.caller.location.traits.xcord.base
-            if to_exit["name"] == "east" or to_exit["name"] =="e":
-                new_room.traits.ycord.base = self.caller.location.traits.ycord.base
-                new_room.traits.xcord.base = self.caller.location.traits.xcord.base + 1
-            if to_exit["name"] == "south" or to_exit["name"] =="s":
-                new_room.traits.ycord.base = self.caller.location.traits.ycord.base - 1
-                new_room.traits.xcord.base = self.caller.location.traits.xcord.base
-            if to_exit["name"] == "west" or to_exit["name"] =="w":
-                new_room.traits.ycord.base = self.caller.location.traits.ycord.base
-                new_room.traits.xcord.base = self.caller.location.traits.xcord.base - 1
-            if to_exit["name"] == "northwest" or to_exit["name"] =="nw":
-                new_room.traits.ycord.base = self.caller.location.traits.ycord.base + 1
-                new_room.traits.xcord.base = self.caller.location.traits.xcord.base - 1
-            if to_exit["name"] == "northeast" or to_exit["name"] =="ne":
-                new_room.traits.ycord.base = self.caller.location.traits.ycord.base + 1
-                new_room.traits.xcord.base = self.caller.location.traits.xcord.base + 1
-            if to_exit["name"] == "southwest" or to_exit["name"] =="sw":
-                new_room.traits.ycord.base = self.caller.location.traits.ycord.base - 1
-                new_room.traits.xcord.base = self.caller.location.traits.xcord.base - 1
-            if to_exit["name"] == "southeast" or to_exit["name"] =="se":
-                new_room.traits.ycord.base = self.caller.location.traits.ycord.base - 1
-                new_room.traits.xcord.base = self.caller.location.traits.xcord.base + 1
+        if self.rhs_objs and location:
+            direction = self.rhs_objs[0]["name"]
+            offset = CARDINAL_OFFSETS.get(DIRECTION_NAMES.get(direction, direction))
+            if offset:
+                with new_room.traits.batch():
+                    new_room.traits.xcord.base = location.traits.xcord.base + offset[0]
+                    new_room.traits.ycord.base = location.traits.ycord.base + offset[1]
+        ROOM_INDEX.update_room(new_room)
 
 
         # create exit to room
@@ -532,95 +520,251 @@ class CoordinatesWormCmd(Command):
             return
         room = self.caller.search(self.args.strip(), global_search=True)
         if room and utils.inherits_from(room, 'typeclasses.rooms.Room'):
-            worm = create_object('commands.building.building.CoordinateWorm',
-                                 key='worm',
-                                 location=room)
-            coords_reset = len(worm.has_mapped_room_ids)
-            self.msg(f"{coords_reset} rooms have been updated with fresh coordinates.")
-            worm.delete()
+            worm = CoordinateWorm(room)
+            caller, name = self.caller, f"coordworm {room.dbref}"
+
+            def save(cancelled):
+                # saving works with loaded rooms, so it runs on the reactor
+                if not cancelled:
+                    job = start_job(caller, f"{name} save", worm.save(), threaded=False)
+                    caller.msg(f"Saving as job #{job.id}. Use @jobs/cancel {job.id} to stop it.")
+
+            # walking the exits only reads the database, so it can run in a
+            # worker thread
+            job = start_job(caller, name, worm.explore(), at_finish=save)
+            self.msg(f"Coordinate worm started as job #{job.id}. Use @jobs/cancel {job.id} to stop it.")
         else:
             self.msg("Searched room not found. provide a valid room for the worm to map")
 
 
-class CoordinateWorm(Object):
+class ResetZoneBiomesCmd(Command):
     """
-    A worm that travels through a zone and sets the coordinates of the rooms.
-    Called by the 'coordworm' command.
+    Command to reset the biomes of every outdoor room in a zone back to the
+    defaults. Runs as a builder job, a chunk of rooms at a time.
+    Usage:
+        @resetbiomes <zone>
+    Examples:
+        @resetbiomes Northern Forest
     """
+    key = '@resetbiomes'
+    locks = 'cmd:id(1) or perm(Admins)'
+    help_category = 'Building'
 
-    def at_object_creation(self):
-        self.zone = self.location.db.info['zone']
-        self.outdoors = self.location.db.info['outdoor room']
-        self.has_mapped = {}
-        self.has_mapped_room_ids = []
-        self.curX = self.location.traits.xcord.current
-        self.curY = self.location.traits.ycord.current
-        self.explore_map(self.location)
+    def func(self):
+        zone = self.args.strip()
+        if not zone:
+            self.msg("|rYou should provide the zone to reset.|n")
+            return
+        if zone not in ROOM_INDEX.zones(outdoor=True):
+            self.msg(f"There are no outdoor rooms in the zone '{zone}'.")
+            return
+        job = start_job(self.caller, f"resetbiomes {zone}", reset_zone_biomes(zone),
+                        threaded=False)
+        self.msg(f"Biome reset started as job #{job.id}. Use @jobs/cancel {job.id} to stop it.")
 
 
-    def explore_map(self, room):
-        """
-        Explores the map via exits.
-        """
-        self.set_room_coordinates(room)
-        for exit in room.exits:
-            if exit.name not in ("north", "east", "west", "south", "northeast", \
-                                 "northwest", "southeast", "southwest"):
-                # we only map in the cardinal directions. Mapping up/down would be
-                # an interesting learning project for someone who wanted to try it.
-                continue
-            if exit.destination.id in self.has_mapped_room_ids:
-                # we've been to the destination already, skip ahead.
-                continue
-
-            self.update_pos(room, exit.name.lower())
-            self.explore_map(exit.destination)
-
-
-    def set_room_coordinates(self, room):
-        """
-        Sets the X and Y Coordinate traits for the room to match CurX and CurY
-        """
-        if room == self.location:
-            self.has_mapped[room] = [self.curX, self.curY]
-            self.has_mapped_room_ids.append(room.id)
+class UpdateZoneCmd(Command):
+    """
+    Command to bring every room in a zone up to its typeclass's current base
+    spec, like running update on each of them. Each room keeps its
+    coordinates, elevation, info, map symbol, tracks and biomes. Runs as a
+    builder job, a chunk of rooms at a time.
+    Usage:
+        @updatezone <zone>
+    Examples:
+        @updatezone Northern Forest
+    """
+    key = '@updatezone'
+    locks = 'cmd:id(1) or perm(Admins)'
+    help_category = 'Building'
+
+    def func(self):
+        zone = self.args.strip()
+        if not zone:
+            self.msg("|rYou should provide the zone to update.|n")
+            return
+        if zone not in ROOM_INDEX.zones():
+            self.msg(f"There are no rooms in the zone '{zone}'.")
+            return
+        job = start_job(self.caller, f"updatezone {zone}", update_zone_rooms(zone),
+                        threaded=False)
+        self.msg(f"Zone update started as job #{job.id}. Use @jobs/cancel {job.id} to stop it.")
+
+
+class ZoneCheckCmd(MuxCommand):
+    """
+    Check a zone (or the whole world) for coordinate collisions, one way
+    exits, exits that disagree with the coordinates and missing exits.
+    Usage:
+        @zonecheck [<zone>]
+        @zonecheck/all
+        @zonecheck/fix <zone>
+    Switches:
+        all - check every zone
+        fix - also create the exits in the report's fix plan (as a job)
+    With no zone, the zone of the room you are in is checked. Rooms without
+    a zone (indoor rooms and entrances) and combat rooms can't be checked.
+    """
+    key = '@zonecheck'
+    switch_options = ("all", "fix")
+    locks = 'cmd:id(1) or perm(Builders)'
+    help_category = 'Building'
+
+    def func(self):
+        if 'all' in self.switches:
+            reports = scan_world()
+            problems = [report for report in reports if report]
+            self.msg(f"Checked {len(reports)} zones, {len(problems)} with problems.")
+            for report in problems:
+                self.msg(report.format())
+            return
+        zone = self.args.strip()
+        if not zone and self.caller.location:
+            zone = self.caller.location.db.info['zone']
+        if not zone:
+            self.msg("|rYou aren't in a zone. Give the zone to check.|n")
+            return
+        try:
+            report = scan_zone(zone)
+        except ValueError as error:
+            self.msg(f"|r{error}|n")
+            return
+        if not report.room_count:
+            self.msg(f"There are no rooms in the zone '{zone}'.")
+            return
+        self.msg(report.format())
+        if 'fix' in self.switches and report.fix_plan:
+            job = start_job(self.caller, f"zonefix {report.zone}", fix_steps(report.fix_plan),
+                            threaded=False)
+            self.msg(f"Creating {len(report.fix_plan)} exits as job #{job.id}.")
+
+
+class GridCmd(MuxCommand):
+    """
+    Build a whole block of outdoor rooms at once, with coordinates, and join
+    them with exits both ways. Runs as a builder job.
+    Usage:
+        @grid[/switches] <width>x<height> [at <x>,<y>] [in <zone>] = <room name>
+        @grid/mask <row> <row> ... [at <x>,<y>] [in <zone>] = <room name>
+    Switches:
+        mask - lay the rooms out like the rows given, north row first. X marks
+               a room, anything else (like .) leaves a gap
+        samezone - the rooms will be in the same zone as your location
+        samemap - the rooms will have the same map symbol as your location
+        samebiomes - the rooms will have the same biomes as your location
+        nodiagonals - only join the rooms north, east, south and west
+    Examples:
+        @grid 100x100 at 1,0 in Northern Forest = A Dark Forest
+        @grid/mask XXX. .XXX ..XX at 10,-5 = Rolling Hills
+    The rows of the grid run south from the <x>,<y> of its north west corner,
+    which is one room east of your location if not given. The grid isn't
+    built if any of its coordinates already have a room in the zone. Use
+    @zonecheck/fix afterwards to join its edges to the rooms around it.
+    """
+    key = '@grid'
+    switch_options = ("mask", "samezone", "samemap", "samebiomes", "nodiagonals")
+    locks = 'cmd:id(1) or perm(Builders)'
+    help_category = 'Building'
+
+    # lockstring of the new rooms & exits, formatted with the {id} of the builder
+    new_room_lockstring = CmdDig.new_room_lockstring
+
+    def func(self):
+        caller = self.caller
+        location = caller.location
+        if not self.lhs or not self.rhs:
+            self.msg("Usage: @grid[/switches] <width>x<height> [at <x>,<y>] [in <zone>] "
+                     "= <room name>")
+            return
+        layout, zone = self.lhs, None
+        if ' in ' in f" {layout}":
+            layout, zone = f" {layout}".split(' in ', 1)
+            zone = zone.strip()
+        layout, x, y = layout.strip(), None, None
+        if ' at ' in f" {layout}":
+            layout, at = f" {layout}".split(' at ', 1)
+            try:
+                x, y = (int(coord) for coord in at.split(','))
+            except ValueError:
+                self.msg("|rThe coordinates should be given as <x>,<y>.|n")
+                return
+        elif location:
+            x = int(location.traits.xcord.current) + 1
+            y = int(location.traits.ycord.current)
         else:
-            self.has_mapped[room] = [self.curX, self.curY]
-            self.has_mapped_room_ids.append(room.id)
-            room.traits.xcord.base = self.curX
-            room.traits.ycord.base = self.curY
-            room.db.info['zone'] = self.zone
-            room.db.info['outdoor room'] = self.outdoors
-
-
-    def update_pos(self, room, exit_name):
-        # this ensures the pointer variables always
-        # stays up to date to where the worm is currently at.
-        self.curX, self.curY = \
-           self.has_mapped[room][0], self.has_mapped[room][1]
-
-        # now we have to actually move the pointer
-        # variables depending on which 'exit' it found
-        if exit_name == 'east':
-            self.curX += 1
-        elif exit_name == 'west':
-            self.curX -= 1
-        elif exit_name == 'north':
-            self.curY += 1
-        elif exit_name == 'south':
-            self.curY -= 1
-        elif exit_name == 'northeast':
-            self.curX += 1
-            self.curY += 1
-        elif exit_name == 'southeast':
-            self.curX += 1
-            self.curY -= 1
-        elif exit_name == 'northwest':
-            self.curX -= 1
-            self.curY += 1
-        elif exit_name == 'southwest':
-            self.curX -= 1
-            self.curY -= 1
+            x, y = 0, 0
+        borrowed = {'samezone', 'samemap', 'samebiomes'}.intersection(self.switches)
+        if borrowed and not location:
+            self.msg(f"|rYou need to be in a room to use /{', /'.join(sorted(borrowed))}.|n")
+            return
+        if not zone:
+            zone = location.db.info['zone'] if 'samezone' in self.switches else 'The Outdoors'
+        if not zone or isinstance(zone, (list, tuple)):
+            self.msg("|rYour location isn't in a zone the grid can join. Give one with 'in <zone>'.|n")
+            return
+        options = {
+            'zone': zone,
+            'name': self.rhs.strip(),
+            'diagonals': 'nodiagonals' not in self.switches,
+            'lockstring': self.new_room_lockstring.format(id=caller.id),
+        }
+        if 'samemap' in self.switches:
+            options['map_symbol'] = location.db.map_symbol
+        if 'samebiomes' in self.switches:
+            options['biome_ratios'] = dict(location.biomes.ratios)
+        if 'mask' not in self.switches:
+            try:
+                width, height = (int(size) for size in layout.lower().split('x'))
+            except ValueError:
+                self.msg("|rThe size should be given as <width>x<height>.|n")
+                return
+        try:
+            if 'mask' in self.switches:
+                grid = RoomGrid.from_mask(layout.split(), x, y, **options)
+            else:
+                grid = RoomGrid.rectangle(x, y, width, height, **options)
+        except ValueError as error:
+            self.msg(f"|r{error}|n")
+            return
+        collisions = grid.collisions()
+        if collisions:
+            taken = ", ".join(f"{x},{y}" for x, y in collisions[:10])
+            self.msg(f"|r{len(collisions)} of the grid's coordinates already have rooms in "
+                     f"{zone}: {taken}{'...' if len(collisions) > 10 else ''}|n")
+            return
+        job = start_job(caller, f"grid {len(grid)} rooms in {zone}", grid.steps(),
+                        at_finish=grid.finish, threaded=False)
+        self.msg(f"Building {len(grid)} rooms in {zone} as job #{job.id}. "
+                 f"Use @jobs/cancel {job.id} to stop it.")
+
+
+class JobsCmd(MuxCommand):
+    """
+    List or cancel the running builder jobs.
+    Usage:
+        @jobs
+        @jobs/cancel <job number>
+    """
+    key = '@jobs'
+    locks = 'cmd:id(1) or perm(Builders)'
+    help_category = 'Building'
+
+    def func(self):
+        if 'cancel' in self.switches:
+            try:
+                job = cancel_job(int(self.args.strip().lstrip('#')))
+            except ValueError:
+                self.msg("|rGive the number of the job to cancel.|n")
+                return
+            if job:
+                self.msg(f"Cancelling job #{job.id} {job.name} after its current step.")
+            else:
+                self.msg("There is no job with that number running.")
+            return
+        if not JOBS:
+            self.msg("No builder jobs are running.")
+            return
+        self.msg("\n".join(str(job) for job in JOBS.values()))
 
 
 class CreateBuildingCmd(Command):
@@ -9,6 +9,16 @@ in 2016. See:
 https://github.com/evennia/evennia/blob/main/evennia/contrib/grid/mapbuilder/mapbuilder.py
 for the original contrib.
 
+Fights no longer need these objects: the combat handler tracks the battlefield
+as an in-memory grid built from the same maps (see world/handlers/battlefield.py).
+These functions remain for when the sections are wanted as real rooms, and
+nothing in the game calls them at the moment. Code that does (a builder tool
+or a combat mode that wants players to walk between sections as rooms) should
+get its grids from call_map_funcs_and_build_battlefield_map(), which checks
+the standard sizes out of the SECTION_POOL, and hand them back with
+release_battlefield_map() when it's done, so grids are reused rather than
+built and deleted every time.
+
 Build a combat map from a 2D ASCII map. I will only be building maps using the version with
 exits. I'm going to represent the rooms using standard symbols rather than individual room
 icon types. I'll build a different function for regular rooms.
@@ -21,66 +31,16 @@ from typeclasses.rooms import CombatRoomsection
 from typeclasses import rooms, exits
 from random import randint
 import random
-from evennia.utils.logger import log_file
+from world.handlers.game_log import get_log
+from world.handlers.battlefield import SMALL_COMBAT_MAP, MEDIUM_COMBAT_MAP, LARGE_COMBAT_MAP, \
+    COMBAT_MAPS
+from collections import OrderedDict
 from django.conf import settings
 from evennia.utils import utils
 
-SMALL_COMBAT_MAP = '''
-* * * * *
-
-* X-X-X *
-  | | |
-* X-O-X *
-  | | |
-* X-X-X *
-
-* * * * *
-'''
-
-MEDIUM_COMBAT_MAP = '''
-* * * * * * *
-
-* X-X-X-X-X *
-  | | | | |
-* X-X-X-X-X *
-  | | | | |
-* X-X-O-X-X *
-  | | | | |
-* X-X-X-X-X *
-  | | | | |
-* X-X-X-X-X *
-
-* * * * * * *
-'''
-
-LARGE_COMBAT_MAP = '''
-* * * * * * * * *
-
-* X-X-X-X-X-X-X *
-  | | | | | | |
-* X-X-X-X-X-X-X *
-  | | | | | | |
-* X-X-X-X-X-X-X *
-  | | | | | | |
-* X-X-X-O-X-X-X *
-  | | | | | | |
-* X-X-X-X-X-X-X *
-  | | | | | | |
-* X-X-X-X-X-X-X *
-  | | | | | | |
-* X-X-X-X-X-X-X *
-
-* * * * * * * * *
-'''
-
-# Include your trigger characters and build functions in a legend dict.
-LEGEND = {
-    ("X", "O"): build_room_subsection_for_combat,
-    ("|"): build_verticle_exit,
-    ("-"): build_horizontal_exit,
-}
+MAP_LOG = get_log('map_debug.log')
 
-def build_room_subsection_for_combat(x, y, parent, combat_handler **kwargs):
+def build_room_subsection_for_combat(x, y, parent_room, **kwargs):
     """
     Builds a room subsection for the purposes of determining
     where players are on the battlefield and displaying the combat map.
@@ -88,28 +48,22 @@ def build_room_subsection_for_combat(x, y, parent, combat_handler **kwargs):
     Args:
         x (int): X coordinate of the room subsection
         y (int): Y coordinate of the room subsection
-        parent (Room Object): the parent room the subsections are a part of
+        parent_room (Room Object): the parent room the subsections are a part of
     """
     
     # If on anything other than the first iteration - Do nothing.
     if kwargs["iteration"] > 0:
         return None
     
-    room_section = create_object(rooms.CombatRoomsection, key=f"section of {parent.key} at {str(x)}, {str(y)}"
+    room_section = create_object(rooms.CombatRoomsection, key=f"section of {parent_room.key} at {str(x)}, {str(y)}"
                                     )
-    room_section.db.desc= f"Battlefield room subsection of {parent.name}."
-    # add the room objects to the dictionary for the handler
+    room_section.db.desc= f"Battlefield room subsection of {parent_room.name}."
     # move the room subsection into the parent room (all objects are containers)
-    room_section.move_to(parent, quiet=True)
-    if combat_handler.db.battlefield_room_section_dict:
-        combat_handler.db.battlefield_room_section_dict[str(x), str{y}] = room_section, None
-    else:
-        combat_handler.db.battlefield_room_section_dict = {}
-        combat_handler.db.battlefield_room_section_dict[str(x), str{y}] = room_section, None
+    room_section.move_to(parent_room, quiet=True)
     
     # TODO: Apply coordinates to the battlefield sections with the center being 0,0
     
-    log_file(f"Created combat room section: {room_section.key}", filename='map_debug.log')
+    MAP_LOG.debug("Created combat room section: {}", room_section.key)
     
     return room_section
 
@@ -137,8 +91,7 @@ def build_vertical_exit(x, y, ** kwargs):
     create_object(
         exits.Exit, key="north", aliases=["n"], location=south_room_section, destination=north_room_section
     )
-    log_file(f"Created combat room section exits between: {north_room_section.key} & {south_room_section.key}", \
-                filename='map_debug.log')
+    MAP_LOG.debug("Created combat room section exits between: {} & {}", north_room_section.key, south_room_section.key)
     
 
 def build_horizontal_exit(x, y, ** kwargs):
@@ -165,8 +118,7 @@ def build_horizontal_exit(x, y, ** kwargs):
     create_object(
         exits.Exit, key="west", aliases=["w"], location=east_room_section, destination=west_room_section
     )
-    log_file(f"Created combat room section exits between: {west_room_section.key} & {east_room_section.key}", \
-                filename='map_debug.log')
+    MAP_LOG.debug("Created combat room section exits between: {} & {}", west_room_section.key, east_room_section.key)
 
 
 # helper function for readability
@@ -180,6 +132,16 @@ def _map_to_list(game_map):
     """
     return game_map.split("\n")
 
+
+# Include your trigger characters and build functions in a legend dict.
+LEGEND = {
+    "X": build_room_subsection_for_combat,
+    "O": build_room_subsection_for_combat,
+    "|": build_vertical_exit,
+    "-": build_horizontal_exit,
+}
+
+
 def build_battlefield_map(combat_handler, parent_room, battlefield_map, iteralions=1, build_exists=True):
     """
     
@@ -193,8 +155,10 @@ def build_battlefield_map(combat_handler, parent_room, battlefield_map, iteralio
         battlefield_map (str): ASCII map string representing the battlefield
         iteralions (int, optional): The number of iteration passes. Defaults to 1.
         build_exists (bool, optional): Create exits between rooms (or not). Defaults to True.
-        
-        
+
+    Returns:
+        room_section_dict (dict): map (x, y) position -> the room subsection built there
+
      Notes:
         The battlefield map
         is iterated over character by character, comparing it to the trigger
@@ -205,22 +169,21 @@ def build_battlefield_map(combat_handler, parent_room, battlefield_map, iteralio
     """
     
     # Split map string to list of rows and create reference list.
-    log_file(f"Creating battlefield map for: {battlefield_map}", \
-                filename='map_debug.log')
+    MAP_LOG.debug("Creating battlefield map for: {}", battlefield_map)
     battlefield_map= _map_to_list(battlefield_map)
     
     # Create a reference dictionary which be passed to build functions and
     # will store obj returned by build functions so objs can be referenced.
     room_section_dict = {}
     
-    log_file("Iterating through map...", filename='map_debug.log')
+    MAP_LOG.debug("Iterating through map...")
     for iteration in range(iteralions):
         for y in range(len(battlefield_map)):
             for x in range(len(battlefield_map[y])):
-                for key in legend:
+                for key in LEGEND:
                     # obs - we must use == for strings
                     if battlefield_map[y][x] == key:
-                        room_section = legend[key](
+                        room_section = LEGEND[key](
                             x, y, iteration=iteration, room_section_dict=room_section_dict, \
                                 combat_handler=combat_handler, parent_room=parent_room
                         )
@@ -229,14 +192,13 @@ def build_battlefield_map(combat_handler, parent_room, battlefield_map, iteralio
                             
     if build_exists:
         # Creating exits. Assumes single room section object in dict entry
-        log_file("Connecting room subsections with exits", \
-                filename='map_debug.log')
+        MAP_LOG.debug("Connecting room subsections with exits")
         for loc_key, location in room_section_dict.items():
             x = loc_key[0]
             y = loc_key[1]
 
             # north
-             if (x, y - 1) in room_section_dict:
+            if (x, y - 1) in room_section_dict:
                 if room_section_dict[(x, y - 1)]:
                     create_object(
                         exits.Exit,
@@ -278,14 +240,154 @@ def build_battlefield_map(combat_handler, parent_room, battlefield_map, iteralio
                         destination=room_section_dict[(x - 1, y)],
                     )        
         
-    log_file("Map created!", \
-                filename='map_debug.log')                
+    MAP_LOG.debug("Map created!")
+    return room_section_dict
+
+
+# tag category marking room subsections that belong to the SECTION_POOL
+POOL_TAG_CATEGORY = 'battlefield_pool'
+
+
+def reset_room_subsection(room_section, parent_room, position):
+    """
+    Readies a pooled room subsection for a new fight in parent_room. Anything
+    left in the subsection from the last fight (other than its exits) is put
+    into the parent room.
+    """
+    x, y = position
+    room_section.key = f"section of {parent_room.key} at {str(x)}, {str(y)}"
+    room_section.db.desc = f"Battlefield room subsection of {parent_room.name}."
+    for obj in room_section.contents:
+        if not obj.destination:
+            obj.move_to(parent_room, quiet=True)
+    room_section.move_to(parent_room, quiet=True)
+
+
+class BattlefieldSectionPool(object):
+    """
+    Keeps built battlefields (grids of CombatRoomsection objects and their
+    exits) between fights, so starting a fight can reuse a grid instead of
+    creating and deleting dozens of objects.
+    A grid is checked out for a fight and returned to the pool afterwards.
+    Up to `cap` idle grids are kept, and when there are more the least
+    recently used grid is deleted. A fight prefers the grid last used in the
+    same room, which then doesn't need its sections renamed.
+    Pooled sections are tagged, so the pool picks its idle grids back up
+    from the database after a server restart.
+    Args:
+        cap (int): the most idle grids to keep, across all sizes
+    """
+    def __init__(self, cap=None):
+        self.cap = cap if cap is not None else getattr(settings, 'COMBAT_SECTION_POOL_SIZE', 20)
+        # (size, grid id) -> (parent room id, room_section_dict), oldest first
+        self.idle = OrderedDict()
+        self.next_grid = 1
+        self.is_loaded = False
+
+    def load(self):
+        """ Picks up the idle grids left in the database from the last run. """
+        from evennia import search_tag
+        grids = {}
+        for room_section in search_tag(category=POOL_TAG_CATEGORY):
+            size = room_section.tags.get(category=POOL_TAG_CATEGORY)
+            grid, position = room_section.db.battlefield_grid, room_section.db.battlefield_position
+            if grid is None or position is None:
+                continue
+            grids.setdefault((size, grid), {})[tuple(position)] = room_section
+        for key, room_section_dict in sorted(grids.items(), key=lambda item: item[0][1]):
+            self.idle[key] = (None, room_section_dict)
+            self.next_grid = max(self.next_grid, key[1] + 1)
+        self.is_loaded = True
+        MAP_LOG.info("Battlefield pool loaded {} idle grids.", len(self.idle))
+        self._evict()
+
+    def checkout(self, combat_handler, parent_room, map_size='Small'):
+        """
+        Returns a room_section_dict ((x, y) -> room subsection) for a fight
+        in parent_room, reusing an idle grid of the same size if there is
+        one and building a new one otherwise.
+        """
+        if not self.is_loaded:
+            self.load()
+        match = None
+        for key, (room_id, room_section_dict) in reversed(self.idle.items()):
+            if key[0] != map_size:
+                continue
+            if room_id == parent_room.id:
+                match = key
+                break
+            if match is None:
+                match = key
+        if match is None:
+            return self._build(combat_handler, parent_room, map_size)
+        room_id, room_section_dict = self.idle.pop(match)
+        for position, room_section in room_section_dict.items():
+            if room_id == parent_room.id:
+                room_section.move_to(parent_room, quiet=True)
+            else:
+                reset_room_subsection(room_section, parent_room, position)
+        MAP_LOG.debug("Reusing {} battlefield grid {} in {}", map_size, match[1], parent_room.key)
+        return room_section_dict
+
+    def release(self, room_section_dict, parent_room):
+        """
+        Returns a grid from checkout() to the pool once the fight is over.
+        Anything left in its sections is moved out to parent_room (or home,
+        if the room is gone), then the sections are taken off the map until
+        they are used again.
+        """
+        room_sections = list(room_section_dict.values())
+        if not room_sections:
+            return
+        first = room_sections[0]
+        size = first.tags.get(category=POOL_TAG_CATEGORY)
+        grid = first.db.battlefield_grid
+        if size is None or grid is None:
+            # not a pooled grid (a custom map), so just get rid of it
+            for room_section in room_sections:
+                room_section.delete()
+            return
+        for room_section in room_sections:
+            for obj in room_section.contents:
+                if not obj.destination:
+                    obj.move_to(parent_room or obj.home, quiet=True)
+            room_section.location = None
+        self.idle[(size, grid)] = (parent_room.id if parent_room else None, room_section_dict)
+        self._evict()
+
+    def _build(self, combat_handler, parent_room, map_size):
+        grid = self.next_grid
+        self.next_grid += 1
+        room_section_dict = {position: room_section for position, room_section in
+                             build_battlefield_map(combat_handler, parent_room,
+                                                   COMBAT_MAPS[map_size], 2, False).items()
+                             if room_section}
+        for position, room_section in room_section_dict.items():
+            room_section.tags.add(map_size, category=POOL_TAG_CATEGORY)
+            room_section.db.battlefield_grid = grid
+            room_section.db.battlefield_position = position
+        MAP_LOG.debug("Built {} battlefield grid {} for the pool", map_size, grid)
+        return room_section_dict
+
+    def _evict(self):
+        """ Deletes the least recently used idle grids over the cap. """
+        while len(self.idle) > self.cap:
+            key, (room_id, room_section_dict) = self.idle.popitem(last=False)
+            for room_section in room_section_dict.values():
+                room_section.delete()
+            MAP_LOG.debug("Evicted {} battlefield grid {} from the pool", key[0], key[1])
+
+
+# the pool shared by everything in this process
+SECTION_POOL = BattlefieldSectionPool()
+
 
 def call_map_funcs_and_build_battlefield_map(combat_handler, parent_room, battlefield_map, map_size='Small'):
     """
     
     Replaces original command in map builder. This function will be called by the combat handler
-    to create the battlefield map
+    to create the battlefield map. Small, Medium and Large maps are checked out of the SECTION_POOL;
+    hand them back with release_battlefield_map() when the fight is over.
 
     Args:
         combat_handler (_type_): _description_
@@ -296,20 +398,20 @@ def call_map_funcs_and_build_battlefield_map(combat_handler, parent_room, battle
         build_exists (bool, optional): _description_. Defaults to True.
     """
     
-    # set up map & legend variables
+    # the standard sizes come out of the pool of prebuilt battlefields
+    if map_size in COMBAT_MAPS:
+        return SECTION_POOL.checkout(combat_handler, parent_room, map_size)
     # TODO: augment this for situations where we might want to send in a custom map
-    if map_size == 'Large':
-        battlefield_map = LARGE_COMBAT_MAP
-    elif map_size == 'Medium':
-        battlefield_map = MEDIUM_COMBAT_MAP
-    elif map_size -- 'Small':
-        battlefield_map = SMALL_COMBAT_MAP
-    else:
-        log_file(f"Custom map inputted by combat handler", filename='map_debug.log')
-    legend = LEGEND
-    
-    iterations= 2
-    build_exists= False
-    
+    MAP_LOG.debug("Custom map inputted by combat handler")
+    iteralions = 2
+    build_exists = False
+
     # pass map & legend to the battlefield map builder function
-    build_battlefield_map(combat_handler, parent_room, battlefield_map, iteralions, build_exists)
\ No newline at end of file
+    return build_battlefield_map(combat_handler, parent_room, battlefield_map, iteralions, build_exists)
+
+def release_battlefield_map(room_section_dict, parent_room):
+    """
+    Hands a battlefield from call_map_funcs_and_build_battlefield_map back once
+    the fight in parent_room is over, so the next fight can reuse it.
+    """
+    SECTION_POOL.release(room_section_dict, parent_room)
@@ -5,7 +5,17 @@ Menus for editing room objects.
 from evennia.contrib.base_systems.building_menu import BuildingMenu
 from evennia.utils import lazy_property
 from world.handlers.traits import TraitHandler
-from evennia.utils.logger import log_file
+from world.handlers.game_log import get_log
+from world.handlers.map_index import ROOM_INDEX, OFFSET_DIRECTIONS, make_cell
+from world.handlers.db_utils import QUERY_CHUNK_SIZE, chunks
+
+BUILD_LOG = get_log('room_build_debug.log')
+
+# what updating a whole zone keeps from each room: where it is, and what has
+# been built or has grown there since it was created
+_KEPT_TRAITS = ('xcord', 'ycord', 'elev')
+_KEPT_ATTRIBUTES = ('info', 'map_symbol', 'sector_type', 'tracks',
+                    'biome_ratios', 'biome_extras', 'vegetation')
 
 MAP_SYMBOLS = {
     'Crossroads' : ['|155╬|n','|255╬|n','|355╬|n','|455╬|n','|555╬|n'],
@@ -133,9 +143,8 @@ def glance_biomes(room):
     """Show the room biomes"""
     glance = ""
     if room.biomes:
-        for biome, data in room.biomes.all_dict.items():
-            if data['base'] != 0:
-                glance += f"\n|y  {biome}|n: |y{data['base']}"
+        for biome, data in room.biomes.top(nonzero=True).items():
+            glance += f"\n|y  {biome}|n: |y{data['base']}"
     if len(glance) == 0:
         glance += "|y  None|n"
     return glance
@@ -283,6 +292,7 @@ def nomatch_map_symbol(menu, caller, room, string):
         caller.msg(f"You typed in {string}. Checking against dictionary of map symbols.")
         if string in MAP_SYMBOLS.keys():
             room.db.map_symbol = MAP_SYMBOLS[string]
+            ROOM_INDEX.update_room(room)
             caller.msg(f"Map Symbol set to: {MAP_SYMBOLS[string]}")
 
 
@@ -311,6 +321,7 @@ def nomatch_traits(menu, caller, room, string):
         else:
             caller.msg("Unknown Command")
             return False
+        ROOM_INDEX.update_room(room)
     return
 
 
@@ -329,6 +340,7 @@ def nomatch_info(menu, caller, room, string):
         else:
             caller.msg("Unknown Command")
             return False
+        ROOM_INDEX.update_room(room)
     return
 
 
@@ -337,7 +349,7 @@ def nomatch_exits(menu, caller, room, string):
     The user typed something in the list of exits.  Maybe an exit name?
     """
     # check first if we're trying to open exits to a new adjacent room
-    log_file(f"Before 11 is: {string[:11]}", filename='room_build_debug.log')
+    BUILD_LOG.debug("Before 11 is: {}", string[:11])
     if string[:11] == 'connect_to_':
         cmd_string = string[11:]
         # get adjcent rooms
@@ -372,52 +384,73 @@ def update_on_enter(caller):
     return
 
 
+def update_zone_rooms(zone, chunk_size=QUERY_CHUNK_SIZE):
+    """
+    Brings every room in a zone up to its typeclass's current base spec, like
+    running update on each of them, but keeps each room's coordinates,
+    elevation, info, map symbol, tracks and biomes. A generator that yields
+    ('updating', rooms done) after every chunk of rooms, for running as a
+    builder job. The rooms are loaded to update them, so it must run on the
+    reactor (threaded=False).
+    """
+    from evennia.objects.models import ObjectDB
+    room_ids = sorted(ROOM_INDEX.room_ids_in_zone(zone))
+    done = 0
+    for chunk in chunks(room_ids, chunk_size):
+        for room in ObjectDB.objects.filter(id__in=chunk):
+            update_room(room)
+        done += len(chunk)
+        yield 'updating', done
+    BUILD_LOG.info("Updated {} rooms in zone {}.", done, zone)
+
+
+def update_room(room):
+    """ Re-runs a room's at_object_creation, keeping where it is. """
+    from evennia.utils.dbserialize import deserialize
+    bases = {key: room.traits[key].base for key in _KEPT_TRAITS if room.traits[key]}
+    kept = {key: deserialize(room.attributes.get(key)) for key in _KEPT_ATTRIBUTES
+            if room.attributes.has(key)}
+    with room.traits.batch():
+        room.at_object_creation()
+        for key, base in bases.items():
+            if room.traits[key]:
+                room.traits[key].base = base
+    for key, value in kept.items():
+        room.attributes.add(key, value)
+    room.biomes.reload()
+    ROOM_INDEX.update_room(room)
+
+
 def find_adjacent_room_ids(room, caller):
     """
-    This func uses the temp variable nearby_rooms on the caller and compares
-    the X,Y Coordinates of the rooms in the nearby room list to find rooms
-    that are adjecent. This will be used with other functions to create linked
-    exits between adjacent rooms if the builder chooses to do so.
+    This func looks up the rooms on the eight coordinates around the room in
+    the room index, to find rooms that are adjacent. This will be used with
+    other functions to create linked exits between adjacent rooms if the
+    builder chooses to do so.
+    Rooms without a zone (indoor rooms, entrances) don't share a grid, so for
+    those only the rooms the map worm reached through the exits (the
+    nearby_rooms the overhead map leaves on the room) are compared.
     """
-    log_file(f"Checking for adjacent rooms for: {room.id}", filename='room_build_debug.log')
-    if room.ndb.nearby_rooms:
+    BUILD_LOG.debug("Checking for adjacent rooms for: {}", room.id)
+    cell = ROOM_INDEX.get_cell(room.id)
+    if cell is None:
+        # not indexed (a combat section, say), so go by the room itself
+        cell = make_cell(room)
+    if cell.zone is None:
         adjacent_rooms = []
-        for room_id in room.ndb.nearby_rooms:
-            search_string = f"#{room_id}"
-            adj_room_candidate = caller.search(search_string)
-            if adj_room_candidate:
-                if adj_room_candidate.traits.xcord.current == room.traits.xcord.current:
-                    # matching X coordinate, check to north and south
-                    if int(adj_room_candidate.traits.ycord.current) == int(room.traits.ycord.current) + 1:
-                        # X matches, Y is 1 room north of room we're editing
-                        adjacent_rooms.append([adj_room_candidate.id, 'north'])
-                    if int(adj_room_candidate.traits.ycord.current) == int(room.traits.ycord.current) - 1:
-                        # X matches, Y is 1 room south of room we're editing
-                        adjacent_rooms.append([adj_room_candidate.id, 'south'])
-                elif adj_room_candidate.traits.ycord.current == room.traits.ycord.current:
-                    # matching Y coordinate, check to west and east
-                    if int(adj_room_candidate.traits.xcord.current) == int(room.traits.xcord.current) + 1:
-                        # Y matches, X is 1 room east of room we're editing
-                        adjacent_rooms.append([adj_room_candidate.id, 'east'])
-                    if int(adj_room_candidate.traits.xcord.current) == int(room.traits.xcord.current) - 1:
-                        # Y matches, X is 1 room west of room we're editing
-                        adjacent_rooms.append([adj_room_candidate.id, 'west'])
-                elif int(adj_room_candidate.traits.ycord.current) == int(room.traits.ycord.current) + 1  and \
-                    int(adj_room_candidate.traits.xcord.current) == int(room.traits.xcord.current) + 1:
-                    adjacent_rooms.append([adj_room_candidate.id, 'northeast'])
-                elif int(adj_room_candidate.traits.ycord.current) == int(room.traits.ycord.current) + 1  and \
-                    int(adj_room_candidate.traits.xcord.current) == int(room.traits.xcord.current) - 1:
-                    adjacent_rooms.append([adj_room_candidate.id, 'northwest'])
-                elif int(adj_room_candidate.traits.ycord.current) == int(room.traits.ycord.current) - 1  and \
-                    int(adj_room_candidate.traits.xcord.current) == int(room.traits.xcord.current) + 1:
-                    adjacent_rooms.append([adj_room_candidate.id, 'southeast'])
-                elif int(adj_room_candidate.traits.ycord.current) == int(room.traits.ycord.current) - 1  and \
-                    int(adj_room_candidate.traits.xcord.current) == int(room.traits.xcord.current) - 1:
-                    adjacent_rooms.append([adj_room_candidate.id, 'southwest'])
-        log_file(f"List of adjacent rooms: {adjacent_rooms}", filename='room_build_debug.log' )
-        return adjacent_rooms
+        for room_id in room.ndb.nearby_rooms or ():
+            nearby = ROOM_INDEX.get_cell(room_id)
+            if room_id == room.id or nearby is None:
+                continue
+            cardinal = OFFSET_DIRECTIONS.get((nearby.x - cell.x, nearby.y - cell.y))
+            if cardinal:
+                adjacent_rooms.append([room_id, cardinal])
     else:
-        return None
+        adjacent_rooms = [[room_id, cardinal] for room_id, cardinal
+                          in ROOM_INDEX.neighbors(cell.zone, cell.x, cell.y)
+                          if room_id != room.id]
+    BUILD_LOG.debug("List of adjacent rooms: {}", adjacent_rooms)
+    return adjacent_rooms or None
 
 
 def check_adjacent_rooms_for_missing_exits(room, adjacent_rooms):
@@ -429,12 +462,12 @@ def check_adjacent_rooms_for_missing_exits(room, adjacent_rooms):
     exit_keys = []
     missing_exits_to = []
     if room.exits:
-        log_file(f"Checking Exits: {room.exits}", filename='room_build_debug.log' )
+        BUILD_LOG.debug("Checking Exits: {}", room.exits)
         for exit in room.exits:
             exit_keys.append(exit.key)
-            log_file(f"Exit Keys: {exit_keys}", filename='room_build_debug.log')
+            BUILD_LOG.debug("Exit Keys: {}", exit_keys)
     for room_id, cardinal in adjacent_rooms:
-        log_file(f"Checking if {room_id} that is {cardinal} of this room has an exit", filename='room_build_debug.log')
+        BUILD_LOG.debug("Checking if {} that is {} of this room has an exit", room_id, cardinal)
         if cardinal not in exit_keys:
             # we're missing an exit to the adjacent room
             missing_exits_to.append([room_id, cardinal])
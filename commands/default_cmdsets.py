@@ -18,7 +18,8 @@ own cmdsets by inheriting from them or directly from `evennia.CmdSet`.
 from evennia import default_cmds
 from commands.building.building import SculptCmd, CoordinatesWormCmd, \
     CreateBuildingCmd, FormItemCmd, CmdDig, CmdTunnel, CreateTownCmd, \
-    CmdDestroy, CmdCreate
+    CmdDestroy, CmdCreate, ResetZoneBiomesCmd, UpdateZoneCmd, JobsCmd, \
+    ZoneCheckCmd, GridCmd
 
 
 class CharacterCmdSet(default_cmds.CharacterCmdSet):
@@ -41,6 +42,11 @@ class CharacterCmdSet(default_cmds.CharacterCmdSet):
         ## BUILDER COMMANDS
         self.add(SculptCmd())
         self.add(CoordinatesWormCmd())
+        self.add(ResetZoneBiomesCmd())
+        self.add(UpdateZoneCmd())
+        self.add(JobsCmd())
+        self.add(ZoneCheckCmd())
+        self.add(GridCmd())
         self.add(CreateBuildingCmd())
         self.add(CreateTownCmd())
         self.add(FormItemCmd())
@@ -16,6 +16,9 @@ at_server_cold_start()
 at_server_cold_stop()
 
 """
+from django.conf import settings
+from world.handlers import game_log
+from world.handlers import randomness_handler
 
 
 def at_server_init():
@@ -30,7 +33,10 @@ def at_server_start():
     This is called every time the server starts up, regardless of
     how it was shut down.
     """
-    pass
+    # a fixed seed makes every roll repeat between runs (for replaying tests)
+    random_seed = getattr(settings, 'GAME_RANDOM_SEED', None)
+    if random_seed is not None:
+        randomness_handler.seed(random_seed)
 
 
 def at_server_stop():
@@ -38,7 +44,8 @@ def at_server_stop():
     This is called just before the server is shut down, regardless
     of it is for a reload, reset or shutdown.
     """
-    pass
+    # write out any queued log messages before the process goes away
+    game_log.flush()
 
 
 def at_server_reload_start():
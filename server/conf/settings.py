@@ -34,6 +34,56 @@ from evennia.settings_default import *
 # This is the name of your game. Make it catchy!
 SERVERNAME = "DOG"
 
+# Levels for the game's log channels (see world/handlers/game_log.py). Each
+# key is a log file name. Debug output on the map, combat, building, item and
+# dice channels is written on every look/round/move/roll (the map channel dumps
+# the whole rendered map), so they run at info in production. Set a channel to
+# "debug" here, or with game_log.set_level() on a running server, when you need
+# its debug output.
+GAME_LOG_DEFAULT_LEVEL = "info"
+GAME_LOG_LEVELS = {
+    "map_debug.log": "info",
+    "combat_step.log": "info",
+    "combat.log": "info",
+    "room_build_debug.log": "info",
+    "item_moves.log": "info",
+    "dice.log": "info",
+    "biome_sim.log": "info",
+}
+# Log channel files are rotated once they grow past GAME_LOG_ROTATE_SIZE bytes,
+# keeping GAME_LOG_ROTATE_COUNT old files (map_debug.log.1, .2, ...).
+GAME_LOG_ROTATE_SIZE = 1000000
+GAME_LOG_ROTATE_COUNT = 5
+
+# Seed for the shared random number generator (see
+# world/handlers/randomness_handler.py). Leave as None for normal play; set an
+# integer to make dice and distribution rolls repeat exactly between runs.
+GAME_RANDOM_SEED = None
+
+# How often (in seconds) the biome simulation advances vegetation and road
+# wear for every outdoor room (see world/handlers/biome_simulation.py).
+BIOME_SIMULATION_INTERVAL = 3600
+# Every fight runs off one shared combat tick (see
+# world/handlers/combat_scheduler.py). Each fight resolves a round every
+# COMBAT_ROUND_INTERVAL seconds, spread over the ticks of the round.
+COMBAT_TICK_INTERVAL = 1
+COMBAT_ROUND_INTERVAL = 5
+# How many idle battlefields of room subsection objects are kept for reuse
+# (see commands/building/combat_map_builder.py).
+COMBAT_SECTION_POOL_SIZE = 20
+GLOBAL_SCRIPTS = {
+    "biome_simulation": {
+        "typeclass": "typeclasses.scripts.BiomeSimulationScript",
+        "interval": BIOME_SIMULATION_INTERVAL,
+        "persistent": True,
+    },
+    "combat_scheduler": {
+        "typeclass": "typeclasses.scripts.CombatSchedulerScript",
+        "interval": COMBAT_TICK_INTERVAL,
+        "persistent": False,
+    },
+}
+
 
 ######################################################################
 # Settings given in secret_settings.py override those in this file.
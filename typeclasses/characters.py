@@ -13,7 +13,7 @@ from .objects import ObjectParent
 from evennia.utils import utils as utils
 from world.handlers.traits import TraitHandler
 from evennia.utils.logger import log_file
-from world.handlers.randomness_handler import distro_return_a_roll_sans_crit as distroll
+from world.handlers.randomness_handler import distro_return_rolls_sans_crit as distrolls
 
 
 class Character(ObjectParent, DefaultCharacter):
@@ -56,20 +56,22 @@ class Character(ObjectParent, DefaultCharacter):
     
     def at_object_creation(self):
         "Called only at object creation and with update command."
-        # clear traits and trait-like containers
-        self.traits.clear()
-        self.talents.clear()
-        self.status_effects.clear()
-        
-        # set primary attribute scores
-        self.traits.add(key='Dex', name='Dexterity', type='static', \
-                        base=distroll(100), extra={'learn' : 0})
-        self.traits.add(key='Str', name='Strength', type='static', \
-                        base=distroll(100), extra={'learn' : 0})
-        self.traits.add(key='Vit', name='Vitality', type='static', \
-                        base=distroll(100), extra={'learn' : 0})
-        self.traits.add(key='Per', name='Perception', type='static', \
-                        base=distroll(100), extra={'learn' : 0})
-        self.traits.add(key='FOP', name='Force of Personality', type='static', \
-                        base=distroll(100), extra={'learn' : 0})
+        with self.traits.batch():
+            # clear traits and trait-like containers
+            self.traits.clear()
+            self.talents.clear()
+            self.status_effects.clear()
+
+            # set primary attribute scores, rolled together
+            dexterity, strength, vitality, perception, personality = distrolls([100] * 5)
+            self.traits.add(key='Dex', name='Dexterity', type='static', \
+                            base=dexterity, extra={'learn' : 0})
+            self.traits.add(key='Str', name='Strength', type='static', \
+                            base=strength, extra={'learn' : 0})
+            self.traits.add(key='Vit', name='Vitality', type='static', \
+                            base=vitality, extra={'learn' : 0})
+            self.traits.add(key='Per', name='Perception', type='static', \
+                            base=perception, extra={'learn' : 0})
+            self.traits.add(key='FOP', name='Force of Personality', type='static', \
+                            base=personality, extra={'learn' : 0})
     
@@ -9,6 +9,7 @@ for allowing Characters to traverse the exit to its destination.
 from evennia.objects.objects import DefaultExit
 
 from .objects import ObjectParent
+from world.handlers.map_index import ROOM_INDEX
 
 
 class Exit(ObjectParent, DefaultExit):
@@ -37,4 +38,17 @@ class Exit(ObjectParent, DefaultExit):
                                         defined, in which case that will simply be echoed.
     """
 
-    pass
+    def at_object_creation(self):
+        "Called only at object creation and with update command."
+        super().at_object_creation()
+        if self.location:
+            # keep the overhead map's copy of the room's exits current
+            exits = [exit.key for exit in self.location.exits if exit != self]
+            ROOM_INDEX.set_exits(self.location.id, exits + [self.key])
+
+    def at_object_delete(self):
+        "Called just before the exit is deleted."
+        if self.location:
+            exits = [exit.key for exit in self.location.exits if exit != self]
+            ROOM_INDEX.set_exits(self.location.id, exits)
+        return True
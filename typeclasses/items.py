@@ -7,11 +7,14 @@ from typeclasses.objects import Object
 from typeclasses.rooms import BuildingEntrance
 from evennia import create_object
 from evennia.prototypes.spawner import spawn
-from evennia.utils.logger import log_file
+from world.handlers.game_log import get_log
 from evennia.utils import lazy_property
 from world.handlers.traits import TraitHandler
+from world.handlers.map_index import ROOM_INDEX
 from evennia import utils as utils
 
+ITEM_LOG = get_log('item_moves.log')
+
 class Item(Object):
     """
     Typeclass for Items.
@@ -42,29 +45,30 @@ class Item(Object):
     def at_object_creation(self):
         "Only called at creation and forced update"
         super().at_object_creation()
-        self.traits.clear()
-        self.locks.add(";".join(("puppet:perm(Builder)",
-                                 "equip:false()",
-                                 "get:all()"
-                                 )))
-        self.traits.add(key='val', name='Monetary Value', type='static', \
-                        base=self.value)
-        self.traits.add(key='mass', name='Mass (in Kilograms)', type='static', \
-                        base=float(self.mass))
-        self.traits.add(key="hp", name="Health Points", type="gauge", \
-                        base=10, extra={'learn' : 0})
-        # Add a measure of quality of the item from 0.01 (basically trash) to 1
-        # (superbly master crafted item)
-        self.traits.add(key="qual", name="Quality", type="static", \
-                        base=0.25, extra={'learn' : 0})
-        # Add a trait that measures the condition of the item. This can and will
-        # degrade over time for most items. Scale is from 0 (broken) to 1 (new)
-        self.traits.add(key="cond", name="Condition", type="static", \
-                        base=1, extra={'learn' : 0})
-        # carrying capacity of the item. Useful for chairs, quivers, or any
-        # item that might have another item in its inventory
-        self.traits.add(key="cap", name="Container Capacity", type="static", \
-                        base=10, extra={'learn' : 0})
+        with self.traits.batch():
+            self.traits.clear()
+            self.locks.add(";".join(("puppet:perm(Builder)",
+                                     "equip:false()",
+                                     "get:all()"
+                                     )))
+            self.traits.add(key='val', name='Monetary Value', type='static', \
+                            base=self.value)
+            self.traits.add(key='mass', name='Mass (in Kilograms)', type='static', \
+                            base=float(self.mass))
+            self.traits.add(key="hp", name="Health Points", type="gauge", \
+                            base=10, extra={'learn' : 0})
+            # Add a measure of quality of the item from 0.01 (basically trash) to 1
+            # (superbly master crafted item)
+            self.traits.add(key="qual", name="Quality", type="static", \
+                            base=0.25, extra={'learn' : 0})
+            # Add a trait that measures the condition of the item. This can and will
+            # degrade over time for most items. Scale is from 0 (broken) to 1 (new)
+            self.traits.add(key="cond", name="Condition", type="static", \
+                            base=1, extra={'learn' : 0})
+            # carrying capacity of the item. Useful for chairs, quivers, or any
+            # item that might have another item in its inventory
+            self.traits.add(key="cap", name="Container Capacity", type="static", \
+                            base=10, extra={'learn' : 0})
         # attribute that stores which items in this item's inventory are 'parts'
         # or components of this item. Ex. a chair might have legs, seat, and
         # a back. Or it may just be a single object. This is entirely up to the
@@ -77,26 +81,23 @@ class Item(Object):
         Called when a character or NPC tries to get the item. Checks to see if
         adding this amount of weight will make the character/NPC overencumbered.
         """
-        log_file(f"trying to move {self.key} to {getter.name}", filename='item_moves.log')
+        ITEM_LOG.debug("trying to move {} to {}", self.key, getter.name)
         if getter.traits.enc.current + self.traits.mass.current > getter.traits.enc.max:
             if utils.inherits_from(obj, 'typeclasses.npcs.NPC') or utils.inherits_from(obj, 'typeclasses.characters.Character'):
                 # this item is too heavy for the getter to pick up, cancel move
-                log_file(f"{self.name} is too heavy for {getter.name} to pick up.", \
-                         filename='item_moves.log')
+                ITEM_LOG.info("{} is too heavy for {} to pick up.", self.name, getter.name)
                 getter.msg(f"{self.name} is too heavy for you to pick up.")
                 return False
             # getter is a non-character. We're trying to put something in something else
             else:
-                log_file(f"{getter.name} is a non character/NPC and doesn't have room to fit {self.name}.", \
-                         filename='item_moves.log')
+                ITEM_LOG.info("{} is a non character/NPC and doesn't have room to fit {}.", \
+                              getter.name, self.name)
                 return False
 
         else:
-            log_file(f"{getter.name} calculating new enc value.", \
-                     filename='item_moves.log')
+            ITEM_LOG.debug("{} calculating new enc value.", getter.name)
             getter.calculate_encumberance()
-            log_file(f"{getter.name} Enc: {getter.traits.enc.current}", \
-                     filename='item_moves.log')
+            ITEM_LOG.debug("{} Enc: {}", getter.name, getter.traits.enc.current)
             return True
 
     def at_get(self, getter):
@@ -402,12 +403,13 @@ class Building(Item):
     """
     def at_object_creation(self):
         "Only called at creation and forced update"
-        super().at_object_creation()
-        # set several of the traits to match a building
-        self.traits.mass.base = 100000
-        self.traits.hp.base = 1000000
-        self.traits.val.base = 25000
-        self.traits.cap.base = 50000
+        with self.traits.batch():
+            super().at_object_creation()
+            # set several of the traits to match a building
+            self.traits.mass.base = 100000
+            self.traits.hp.base = 1000000
+            self.traits.val.base = 25000
+            self.traits.cap.base = 50000
         # make the first room inside the building
         self.make_building_entry_room()
 
@@ -428,6 +430,7 @@ class Building(Item):
                     home=self)
         # set the zone name to match the name of the building
         entryway_room.db.info['zone'] = str(self.key)
+        ROOM_INDEX.update_room(entryway_room)
         self.db.entryway = entryway_room
 
 
@@ -439,12 +442,13 @@ class Town(Item):
     """
     def at_object_creation(self):
         "Only called at creation and forced update"
-        super().at_object_creation()
-        # set several of the traits to match a building
-        self.traits.mass.base = 1000000
-        self.traits.hp.base = 10000000
-        self.traits.val.base = 250000
-        self.traits.cap.base = 5000000
+        with self.traits.batch():
+            super().at_object_creation()
+            # set several of the traits to match a building
+            self.traits.mass.base = 1000000
+            self.traits.hp.base = 10000000
+            self.traits.val.base = 250000
+            self.traits.cap.base = 5000000
         # make the first room inside the building
         self.make_building_entry_room()
 
@@ -459,6 +463,7 @@ class Town(Item):
                     home=self)
         # set the zone name to match the name of the building
         entryway_room.db.info['zone'] = str(self.key)
+        ROOM_INDEX.update_room(entryway_room)
         self.db.entryway = entryway_room
 
 
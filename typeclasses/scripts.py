@@ -13,7 +13,10 @@ just overloads its hooks to have it perform its function.
 
 """
 
+from django.conf import settings
 from evennia.scripts.scripts import DefaultScript
+from world.handlers.biome_simulation import simulate_world
+from world.handlers.combat_scheduler import COMBAT_SCHEDULER
 
 
 class Script(DefaultScript):
@@ -91,3 +94,37 @@ class Script(DefaultScript):
     """
 
     pass
+
+
+class BiomeSimulationScript(Script):
+    """
+    Global script that advances the biome simulation (vegetation growth and
+    road/trail wear) for the whole world every interval. Set up through
+    GLOBAL_SCRIPTS in settings.py.
+    """
+    def at_script_creation(self):
+        self.key = "biome_simulation"
+        self.desc = "advances vegetation & road wear in outdoor rooms"
+        self.interval = settings.BIOME_SIMULATION_INTERVAL
+        self.persistent = True
+
+    def at_repeat(self):
+        # one simulated day per real day
+        simulate_world(days=self.interval / 86400)
+
+
+class CombatSchedulerScript(Script):
+    """
+    Global script that drives the shared combat tick. Every interval it
+    resolves the rounds of the fights scheduled on that tick (see
+    world/handlers/combat_scheduler.py). Set up through GLOBAL_SCRIPTS in
+    settings.py.
+    """
+    def at_script_creation(self):
+        self.key = "combat_scheduler"
+        self.desc = "runs the combat rounds of every fight"
+        self.interval = settings.COMBAT_TICK_INTERVAL
+        self.persistent = False
+
+    def at_repeat(self):
+        COMBAT_SCHEDULER.tick()
@@ -0,0 +1,292 @@
+# coding=utf-8
+"""
+Benchmarks
+Micro-benchmarks for the hot paths of the game. These are not run by the
+server; run them by hand from the game directory with `evennia shell`:
+    >>> from world.benchmarks import benchmark_map_draw
+    >>> benchmark_map_draw()
+    >>> benchmark_map_cell_lookups()
+    >>> benchmark_biome_tick()
+    >>> benchmark_biome_tick_db('Northern Forest')
+    >>> benchmark_combat_round()
+Each benchmark returns its timings as a dict and also prints a short report.
+"""
+import timeit
+import numpy as np
+from world.handlers import map as overhead_map
+from world.handlers.map_index import CARDINAL_OFFSETS, MapCell
+from world.handlers import biome_simulation
+from world.handlers import combat_round
+from world.handlers.combat_handler import ActionQueue, CombatState
+
+
+def _report(title, rows, unit='ns'):
+    print(title)
+    for label, values in rows.items():
+        print(f"  {label:>12}: " + ", ".join(f"{key} {value:8.1f} {unit}"
+                                             for key, value in values.items()))
+
+
+def _bench_map():
+    """
+    Returns a Map set up to draw the base 21x21 map, without a caller or a
+    database, and a full window of outdoor rooms around the center to draw
+    onto it: each with exits in every direction and an elevation graded map
+    symbol.
+    """
+    bench = overhead_map.Map.__new__(overhead_map.Map)
+    bench.max_width = bench.max_length = 21
+    bench.map_grid = overhead_map.BASE_MAP_GRID
+    bench.mappable_cells = overhead_map.MAPPABLE_ROOM_CELLS
+    bench.exit_positions = overhead_map.exit_positions(bench.mappable_cells, 21, 21)
+    symbols = ('|043¡|n', '|143¡|n', '|243¡|n', '|343¡|n', '|443¡|n')
+    cells = []
+    radius = 5
+    for dx in range(-radius, radius + 1):
+        for dy in range(-radius, radius + 1):
+            if dx or dy:
+                cells.append((10 - 2 * dy, 10 + 2 * dx, MapCell(
+                    room_id=len(cells) + 2, zone='Bench', x=dx, y=dy, elev=100 + 10 * dx,
+                    outdoor=True, map_symbol=symbols, sector_type=None,
+                    exits=tuple(CARDINAL_OFFSETS))))
+    return bench, cells
+
+
+def _draw_cell_from_list(bench, cell):
+    """
+    Draws a cell the way the map did before the cell sets and exit position
+    tables: the position is looked up in the coordinate list, once for the
+    room and again for every exit.
+    """
+    coords = overhead_map.MAPPABLE_ROOM_COORDS
+    if [bench.curX, bench.curY] in coords:
+        for exit_name in cell.exits:
+            row_step, col_step, glyph = overhead_map.EXIT_GLYPHS[exit_name]
+            if [bench.curX, bench.curY] in coords:
+                exit_row, exit_col = bench.curX + row_step, bench.curY + col_step
+                if 0 < exit_row < bench.max_width and 0 < exit_col < bench.max_length:
+                    bench.grid.set(exit_row, exit_col, glyph)
+        bench.worm_has_mapped_room_ids.append(cell.room_id)
+        bench.grid.set_graded(bench.curX, bench.curY, cell.map_symbol, cell.elev)
+
+
+def benchmark_map_draw(number=500):
+    """
+    Times drawing and rendering a full base map (the 120 rooms around the
+    looker, each with eight exits) the way a look does when the map isn't
+    cached: drawing every room onto a fresh grid, coloring it by elevation and
+    rendering it. 'before' finds each position in the coordinate lists like
+    the map used to, 'after' uses Map.draw_cell. Both draw onto the same grid,
+    so the difference is the lookups.
+    """
+    bench, cells = _bench_map()
+
+    def draw(draw_cell):
+        def run():
+            bench.grid = bench.create_grid()
+            bench.worm_has_mapped_room_ids = []
+            for row, col, cell in cells:
+                bench.curX, bench.curY = row, col
+                draw_cell(cell)
+            bench.grid.resolve_elevations(100)
+            return bench.grid.render()
+        return run
+
+    before, after = draw(lambda cell: _draw_cell_from_list(bench, cell)), draw(bench.draw_cell)
+    assert before() == after()
+    results = {'base map': {
+        'before': timeit.timeit(before, number=number) / number * 1e9 / 1000,
+        'after': timeit.timeit(after, number=number) / number * 1e9 / 1000,
+    }}
+    _report("Base map draw and render, per map:", results, unit='us')
+    return results
+
+
+def benchmark_map_cell_lookups(number=200000):
+    """
+    Times the 'is this grid cell mappable' check the map draw loop makes for
+    every room it draws, against each map mode's table. The list lookups grow
+    with the size of the table, the precomputed cell sets and exit position
+    tables stay flat.
+    """
+    tables = {
+        'small': (overhead_map.MAPPABLE_SMALL_COMBAT_ROOM_COORDS,
+                  overhead_map.MAPPABLE_SMALL_COMBAT_ROOM_CELLS),
+        'medium': (overhead_map.MAPPABLE_MEDIUM_COMBAT_ROOM_COORDS,
+                   overhead_map.MAPPABLE_MEDIUM_COMBAT_ROOM_CELLS),
+        'base': (overhead_map.MAPPABLE_ROOM_COORDS,
+                 overhead_map.MAPPABLE_ROOM_CELLS),
+        'large': (overhead_map.MAPPABLE_LARGE_COMBAT_ROOM_COORDS,
+                  overhead_map.MAPPABLE_LARGE_COMBAT_ROOM_CELLS),
+    }
+    results = {}
+    for mode, (coords, cells) in tables.items():
+        # the last entry in the list is the slowest one to find
+        row, col = coords[-1]
+        positions = overhead_map.exit_positions(cells, 21, 21)
+        list_time = timeit.timeit(lambda: [row, col] in coords, number=number)
+        set_time = timeit.timeit(lambda: (row, col) in cells, number=number)
+        table_time = timeit.timeit(lambda: 'north' in positions[(row, col)], number=number)
+        results[f"{mode} ({len(coords)})"] = {
+            'list': list_time / number * 1e9,
+            'set': set_time / number * 1e9,
+            'exit table': table_time / number * 1e9,
+        }
+    _report("Mappable cell lookup, per check:", results)
+    return results
+
+
+def _random_biome_state(rooms, seed=0):
+    """ Builds a BiomeState of random rooms with a few biomes each. """
+    rng = np.random.default_rng(seed)
+    biome_count = len(biome_simulation.BIOME_KEYS)
+    ratios = rng.random((rooms, biome_count)) * (rng.random((rooms, biome_count)) < 0.2)
+    ratios[ratios.sum(axis=1) == 0, biome_simulation.FIELDS] = 1
+    ratios /= ratios.sum(axis=1, keepdims=True)
+    return biome_simulation.BiomeState(
+        np.arange(rooms), ratios, rng.random(rooms), rng.random(rooms),
+        rng.random(rooms), rng.random(rooms), rng.random(rooms))
+
+
+def _encoded_biome_rows(state):
+    """
+    Returns the biome Attributes of a BiomeState's rooms the way
+    _read_attributes() gets them from the database: (attribute id, room id,
+    key, encoded value) rows.
+    """
+    from evennia.utils.dbserialize import to_pickle
+    from evennia.utils.picklefield import dbsafe_encode
+    rows = []
+    for row, room_id in enumerate(state.room_ids.tolist()):
+        ratios = {biome_simulation.BIOME_KEYS[column]: float(state.ratios[row, column])
+                  for column in np.flatnonzero(state.ratios[row])}
+        extras = {'road': {'condition': float(state.road_condition[row]),
+                           'quality': float(state.road_quality[row])},
+                  'trail': {'condition': float(state.trail_condition[row]),
+                            'quality': float(state.trail_quality[row])}}
+        for column, (key, value) in enumerate((
+                ('biome_ratios', ratios), ('biome_extras', extras),
+                ('vegetation', float(state.vegetation[row])))):
+            rows.append((3 * row + column, room_id, key, dbsafe_encode(to_pickle(value))))
+    return rows
+
+
+def benchmark_biome_tick(sizes=(10000, 100000), ticks=5):
+    """
+    Times a whole biome simulation tick on 10k and 100k rooms of random data,
+    per room: unpacking the rooms' Attributes into a BiomeState (load), the
+    array maths (advance) and finding and packing the changed Attributes
+    (save). Decoding and encoding the Attribute values like the database
+    field does is included, the queries themselves aren't; time those on a
+    real zone with benchmark_biome_tick_db().
+    """
+    from evennia.utils.dbserialize import from_pickle, to_pickle
+    from evennia.utils.picklefield import dbsafe_decode, dbsafe_encode
+    results = {}
+    for rooms in sizes:
+        rows = _encoded_biome_rows(_random_biome_state(rooms))
+        room_ids = list(range(rooms))
+        timings = {'load': 0.0, 'advance': 0.0, 'save': 0.0}
+        for _ in range(ticks):
+            start = timeit.default_timer()
+            stored = {}
+            for attribute_id, room_id, key, value in rows:
+                stored.setdefault(room_id, {})[key] = (attribute_id,
+                                                       from_pickle(dbsafe_decode(value)))
+            state = biome_simulation.state_from_attributes(room_ids, stored)
+            loaded = timeit.default_timer()
+            biome_simulation.advance(state, days=1)
+            advanced = timeit.default_timer()
+            changed = state.changed()
+            encoded = [dbsafe_encode(to_pickle(value)) for value in
+                       biome_simulation.changed_attributes(state, changed).values()]
+            state.mark_saved(changed)
+            saved = timeit.default_timer()
+            timings['load'] += loaded - start
+            timings['advance'] += advanced - loaded
+            timings['save'] += saved - advanced
+        results[f"{rooms} rooms"] = {stage: total * 1e9 / ticks / rooms
+                                     for stage, total in timings.items()}
+    _report("Biome simulation tick (without the queries), per room:", results)
+    return results
+
+
+def benchmark_biome_tick_db(zone, days=1.0):
+    """
+    Times a real biome simulation tick on a zone in the database: reading its
+    rooms (load), advancing them and writing back the changed ones (save).
+    Everything runs in a transaction that is rolled back afterwards, so the
+    zone is left as it was.
+    """
+    from django.db import transaction
+    results = {}
+    with transaction.atomic():
+        start = timeit.default_timer()
+        state = biome_simulation.load_zone_state(zone)
+        loaded = timeit.default_timer()
+        biome_simulation.advance(state, days)
+        advanced = timeit.default_timer()
+        written = biome_simulation.save_zone_state(state)
+        saved = timeit.default_timer()
+        transaction.set_rollback(True)
+    rooms = max(len(state), 1)
+    results[f"{len(state)} rooms"] = {
+        'load': (loaded - start) * 1e9 / rooms,
+        'advance': (advanced - loaded) * 1e9 / rooms,
+        'save': (saved - advanced) * 1e9 / rooms,
+    }
+    _report(f"Biome simulation tick on {zone} ({written} rooms written), per room:", results)
+    return results
+
+
+class _BenchTraits(object):
+    """ Stands in for a loaded character's TraitHandler. """
+    def __init__(self, scores):
+        self.traits = {key: _BenchTrait(value) for key, value in scores.items()}
+
+    def get(self, key):
+        return self.traits.get(key)
+
+
+class _BenchTrait(object):
+    __slots__ = ('actual',)
+
+    def __init__(self, actual):
+        self.actual = actual
+
+
+class _BenchCombatant(object):
+    def __init__(self, dbref, scores):
+        self.id = dbref
+        self.name = f"combatant {dbref}"
+        self.traits = _BenchTraits(scores)
+
+
+def _random_combat_state(combatants, seed=0):
+    rng = np.random.default_rng(seed)
+    state = CombatState()
+    for dbref in range(1, combatants + 1):
+        scores = dict(zip(('Dex', 'Str', 'Vit', 'Per'), rng.normal(100, 10, 4)))
+        state.characters[dbref] = _BenchCombatant(dbref, scores)
+        state.turn_actions[dbref] = ActionQueue('punch')
+        state.char_temp_vars[dbref] = {}
+    return state
+
+
+def benchmark_combat_round(sizes=(2, 20, 200), rounds=200):
+    """
+    Times one combat round (every stage of combat_round.run_round) for fights
+    of 2, 20 and 200 combatants in a room, per combatant. Sending the
+    round's messages isn't included.
+    """
+    results = {}
+    for combatants in sizes:
+        state = _random_combat_state(combatants)
+
+        def run():
+            combat_round.run_round(state)
+            state.messages.clear()
+        round_time = timeit.timeit(run, number=rounds) / rounds
+        results[f"{combatants} fighters"] = {'round': round_time * 1e9 / combatants}
+    _report("Combat round, per combatant:", results)
+    return results
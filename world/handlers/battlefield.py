@@ -0,0 +1,266 @@
+# coding=utf-8
+"""
+Battlefield
+This file contains the in-memory battlefield grid a CombatHandler uses to
+track where combatants are within the room they are fighting in.
+A battlefield is built from one of the ASCII combat maps below, the same
+maps the combat map builder uses: every X (or O, the centre) is a section of
+the room, and a - or | between two sections means combatants can move
+between them. Sections are given coordinates with the centre at 0, 0, north
+as +Y and east as +X, like the rest of the game's coordinates.
+Each map is only parsed once per process. Starting a fight copies the
+parsed template, so no objects are created or deleted for the battlefield.
+    battlefield = Battlefield.for_room(room)
+    battlefield.place(character)              # at the centre
+    battlefield.move(character, 'north')      # new coordinates, or None
+    battlefield.occupants((0, 1))             # ids of the characters there
+"""
+from world.handlers.game_log import get_log
+
+MAP_LOG = get_log('map_debug.log')
+
+SMALL_COMBAT_MAP = '''
+* * * * *
+
+* X-X-X *
+  | | |
+* X-O-X *
+  | | |
+* X-X-X *
+
+* * * * *
+'''
+
+MEDIUM_COMBAT_MAP = '''
+* * * * * * *
+
+* X-X-X-X-X *
+  | | | | |
+* X-X-X-X-X *
+  | | | | |
+* X-X-O-X-X *
+  | | | | |
+* X-X-X-X-X *
+  | | | | |
+* X-X-X-X-X *
+
+* * * * * * *
+'''
+
+LARGE_COMBAT_MAP = '''
+* * * * * * * * *
+
+* X-X-X-X-X-X-X *
+  | | | | | | |
+* X-X-X-X-X-X-X *
+  | | | | | | |
+* X-X-X-X-X-X-X *
+  | | | | | | |
+* X-X-X-O-X-X-X *
+  | | | | | | |
+* X-X-X-X-X-X-X *
+  | | | | | | |
+* X-X-X-X-X-X-X *
+  | | | | | | |
+* X-X-X-X-X-X-X *
+
+* * * * * * * * *
+'''
+
+COMBAT_MAPS = {
+    'Small': SMALL_COMBAT_MAP,
+    'Medium': MEDIUM_COMBAT_MAP,
+    'Large': LARGE_COMBAT_MAP,
+}
+
+# map characters
+SECTION_SYMBOLS = ('X', 'O')
+CENTRE_SYMBOL = 'O'
+HORIZONTAL_LINK = '-'
+VERTICAL_LINK = '|'
+
+# the directions combatants can move between sections, with their offsets
+BATTLEFIELD_DIRECTIONS = {
+    'north': (0, 1),
+    'east': (1, 0),
+    'south': (0, -1),
+    'west': (-1, 0),
+}
+
+# parsed maps, keyed by the map string
+_TEMPLATES = {}
+
+
+def battlefield_size(room):
+    """
+    Returns the size of battlefield (Small, Medium or Large) for a room,
+    from the room's size trait. Matches the combat map the overhead map
+    draws for the room.
+    """
+    size = room.traits.size.current if room.traits.size else 0
+    if size >= 2500:
+        # room is large or larger 50m squared plus
+        return 'Large'
+    if size >= 225:
+        # room is medium or larger 15m squared plus
+        return 'Medium'
+    return 'Small'
+
+
+def parse_combat_map(battlefield_map):
+    """
+    Parses an ASCII combat map. Returns a dict of section coordinates ->
+    dict of direction -> the coordinates of the section in that direction.
+    Parsed maps are cached, so don't change the dicts returned.
+    """
+    template = _TEMPLATES.get(battlefield_map)
+    if template is not None:
+        return template
+    rows = battlefield_map.split("\n")
+
+    def char_at(column, row):
+        if 0 <= row < len(rows) and 0 <= column < len(rows[row]):
+            return rows[row][column]
+        return ' '
+
+    positions = [(column, row) for row, line in enumerate(rows)
+                 for column, char in enumerate(line) if char in SECTION_SYMBOLS]
+    centre = next(((column, row) for column, row in positions
+                   if char_at(column, row) == CENTRE_SYMBOL), positions[0])
+
+    def coords(column, row):
+        # sections are two characters apart both ways, and rows run south
+        return (column - centre[0]) // 2, (centre[1] - row) // 2
+
+    template = {coords(column, row): {} for column, row in positions}
+    for column, row in positions:
+        here = coords(column, row)
+        if (char_at(column + 1, row) == HORIZONTAL_LINK
+                and char_at(column + 2, row) in SECTION_SYMBOLS):
+            there = coords(column + 2, row)
+            template[here]['east'] = there
+            template[there]['west'] = here
+        if (char_at(column, row + 1) == VERTICAL_LINK
+                and char_at(column, row + 2) in SECTION_SYMBOLS):
+            there = coords(column, row + 2)
+            template[here]['south'] = there
+            template[there]['north'] = here
+    _TEMPLATES[battlefield_map] = template
+    MAP_LOG.debug("Parsed combat map with {} sections.", len(template))
+    return template
+
+
+class Battlefield(object):
+    """
+    The sections of a room during a fight and who is standing in each.
+    Args:
+        battlefield_map (str): ASCII combat map to build the battlefield from
+        size (str): the name of the map, for snapshots
+    """
+    __slots__ = ('size', 'battlefield_map', 'links', 'sections', 'positions')
+
+    def __init__(self, battlefield_map, size=None):
+        self.size = size
+        self.battlefield_map = battlefield_map
+        # shared with every battlefield built from the same map
+        self.links = parse_combat_map(battlefield_map)
+        self.sections = {coords: set() for coords in self.links}
+        self.positions = {}
+
+    @classmethod
+    def from_size(cls, size='Small'):
+        """ Returns a battlefield of the named size (Small, Medium or Large). """
+        return cls(COMBAT_MAPS[size], size=size)
+
+    @classmethod
+    def for_room(cls, room):
+        """ Returns a battlefield sized for the room. """
+        return cls.from_size(battlefield_size(room))
+
+    def __len__(self):
+        return len(self.sections)
+
+    def __contains__(self, character):
+        return _id(character) in self.positions
+
+    def place(self, character, coords=(0, 0)):
+        """
+        Puts the character in the section at coords (the centre by default),
+        taking them out of any section they were in.
+        """
+        if coords not in self.sections:
+            raise KeyError(f"No battlefield section at {coords}.")
+        self.remove(character)
+        dbref = _id(character)
+        self.sections[coords].add(dbref)
+        self.positions[dbref] = coords
+
+    def remove(self, character):
+        """ Takes the character off the battlefield. """
+        coords = self.positions.pop(_id(character), None)
+        if coords is not None:
+            self.sections[coords].discard(_id(character))
+        return coords
+
+    def position(self, character):
+        """ Returns the coordinates of the character's section, or None. """
+        return self.positions.get(_id(character))
+
+    def exits(self, coords):
+        """ Returns a dict of direction -> coordinates leading out of a section. """
+        return self.links.get(coords, {})
+
+    def can_move(self, character, direction):
+        """ Returns True if the character can move in the direction. """
+        coords = self.positions.get(_id(character))
+        return coords is not None and direction in self.links[coords]
+
+    def move(self, character, direction):
+        """
+        Moves the character one section in the direction. Returns their new
+        coordinates, or None if they can't move that way.
+        """
+        coords = self.positions.get(_id(character))
+        if coords is None:
+            return None
+        destination = self.links[coords].get(direction)
+        if destination is None:
+            return None
+        self.place(character, destination)
+        return destination
+
+    def occupants(self, coords):
+        """ Returns the set of ids of the characters in the section. """
+        return self.sections.get(coords, set())
+
+    def distance(self, first, second):
+        """
+        Returns how many moves apart two characters are, or None if either
+        isn't on the battlefield.
+        """
+        first = self.positions.get(_id(first))
+        second = self.positions.get(_id(second))
+        if first is None or second is None:
+            return None
+        return abs(first[0] - second[0]) + abs(first[1] - second[1])
+
+    def snapshot(self):
+        """ Returns the battlefield as plain data for CombatHandler.snapshot(). """
+        return {'size': self.size,
+                'battlefield_map': None if self.size else self.battlefield_map,
+                'positions': dict(self.positions)}
+
+    @classmethod
+    def from_snapshot(cls, data):
+        if data['size']:
+            battlefield = cls.from_size(data['size'])
+        else:
+            battlefield = cls(data['battlefield_map'])
+        for dbref, coords in data['positions'].items():
+            battlefield.place(dbref, tuple(coords))
+        return battlefield
+
+
+def _id(character):
+    """ Battlefields track characters by id; accept either. """
+    return character if isinstance(character, int) else character.id
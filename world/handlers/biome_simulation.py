@@ -0,0 +1,382 @@
+# coding=utf-8
+"""
+Biome Simulation
+This file contains the simulation stage that slowly changes the outdoor world:
+vegetation grows back toward what a room's biomes can support, and roads and
+trails wear out (roads wear down into trails, trails are reclaimed by the
+room's main natural biome).
+Rather than loading every room, a zone (or the whole world) is read into NumPy
+arrays, one row per room and one column per biome in BIOME_CATALOG, and
+advanced in one vectorized step:
+    state = load_zone_state(zone)
+    advance(state, days=1)
+    save_zone_state(state)
+The state keeps full precision floats. save_zone_state() only writes the
+Attributes of rooms whose values have changed once rounded (to
+VEGETATION_DECIMALS and CONDITION_DECIMALS), so rooms that have settled
+aren't rewritten every tick. simulate_world() does all three for every zone
+with outdoor rooms and is run on a timer by
+typeclasses.scripts.BiomeSimulationScript. The hourly steps are often too
+small to show once rounded, so simulate_world() carries each zone's state
+over to the next tick rather than losing the unsaved progress when the zone
+is read again (see carry_over()).
+"""
+import numpy as np
+from world.handlers.biomes import BIOME_CATALOG, BIOME_KEYS, apply_biomes
+from world.handlers.map_index import ROOM_INDEX
+from world.handlers.db_utils import QUERY_CHUNK_SIZE, chunks
+from world.handlers.game_log import get_log
+
+SIM_LOG = get_log('biome_sim.log')
+
+# how much of the gap between a room's vegetation and the most its biomes can
+# support grows back per day
+VEGETATION_GROWTH = 0.05
+# condition lost per day by a road or trail of quality 0. Better built roads
+# wear out slower (a quality 1 road at half this rate).
+ROAD_WEAR = 0.002
+TRAIL_WEAR = 0.004
+# rooms are only rewritten once their values change at these decimals, so
+# they stop being rewritten once they settle
+VEGETATION_DECIMALS = 3
+CONDITION_DECIMALS = 4
+
+_ATTRIBUTE_KEYS = ('biome_ratios', 'biome_extras', 'vegetation')
+
+ROAD = BIOME_KEYS.index('road')
+TRAIL = BIOME_KEYS.index('trail')
+FIELDS = BIOME_KEYS.index('fields')
+# biomes that can reclaim a worn out trail
+NATURAL_BIOMES = np.array([index for index, key in enumerate(BIOME_KEYS)
+                           if key not in ('road', 'trail', 'city')])
+VEGETATION_MIN = np.array([BIOME_CATALOG[key].vegetation_min for key in BIOME_KEYS])
+VEGETATION_MAX = np.array([BIOME_CATALOG[key].vegetation_max for key in BIOME_KEYS])
+
+
+class BiomeState(object):
+    """
+    The biome values of a set of rooms, as arrays with one row per room.
+    Args:
+        room_ids (array): the room ids, one per row
+        ratios (array): rooms x biomes array of biome ratios
+        vegetation (array): the vegetation of each room, 0 to 1
+        road_condition, trail_condition (array): condition of each room's
+            road & trail, 0 to 1
+        road_quality, trail_quality (array): quality of each room's road &
+            trail, 0 to 1
+    """
+    def __init__(self, room_ids, ratios, vegetation, road_condition,
+                 trail_condition, road_quality, trail_quality):
+        self.room_ids = np.asarray(room_ids, dtype=np.int64)
+        self.ratios = np.asarray(ratios, dtype=float)
+        self.vegetation = np.asarray(vegetation, dtype=float)
+        self.road_condition = np.asarray(road_condition, dtype=float)
+        self.trail_condition = np.asarray(trail_condition, dtype=float)
+        self.road_quality = np.asarray(road_quality, dtype=float)
+        self.trail_quality = np.asarray(trail_quality, dtype=float)
+        # attribute ids & stored extras of the rows, filled in by
+        # load_zone_state()
+        self.attribute_ids = {}
+        self.stored_extras = {}
+        self.mark_saved()
+
+    def __len__(self):
+        return len(self.room_ids)
+
+    def mark_saved(self, changed=None):
+        """
+        Remembers the current values as the ones in the database, to compare
+        against when saving. changed is what changed() returned before a
+        save, to only remember the values that were written.
+        """
+        if changed is None:
+            self.saved = (self.ratios.copy(), self.vegetation.copy(),
+                          self.road_condition.copy(), self.trail_condition.copy())
+            return
+        ratios_changed, vegetation_changed, extras_changed = changed
+        ratios, vegetation, road_condition, trail_condition = self.saved
+        ratios[ratios_changed] = self.ratios[ratios_changed]
+        vegetation[vegetation_changed] = self.vegetation[vegetation_changed]
+        road_condition[extras_changed] = self.road_condition[extras_changed]
+        trail_condition[extras_changed] = self.trail_condition[extras_changed]
+
+    def changed(self):
+        """
+        Returns boolean arrays of the rows whose ratios, vegetation and
+        road/trail extras differ from the database once rounded.
+        """
+        ratios, vegetation, road_condition, trail_condition = self.saved
+
+        def differs(current, saved, decimals):
+            return np.round(current, decimals) != np.round(saved, decimals)
+
+        return ((self.ratios != ratios).any(axis=1),
+                differs(self.vegetation, vegetation, VEGETATION_DECIMALS),
+                differs(self.road_condition, road_condition, CONDITION_DECIMALS) |
+                differs(self.trail_condition, trail_condition, CONDITION_DECIMALS))
+
+
+def carry_over(state, previous):
+    """
+    Copies the unsaved, full precision values of the rooms in the previous
+    tick's state into a freshly loaded one. Only rooms whose database values
+    are still the ones the previous state saw are carried over, so anything
+    changed in between (by a builder, say) wins.
+    """
+    if previous is None or not len(state) or not len(previous):
+        return state
+    rows = np.searchsorted(previous.room_ids, state.room_ids)
+    rows = np.minimum(rows, len(previous) - 1)
+    same = previous.room_ids[rows] == state.room_ids
+    for loaded, saved in zip((state.ratios, state.vegetation, state.road_condition,
+                              state.trail_condition), previous.saved):
+        matches = loaded == saved[rows]
+        same &= matches.all(axis=1) if matches.ndim > 1 else matches
+    same &= (state.road_quality == previous.road_quality[rows]) & \
+        (state.trail_quality == previous.trail_quality[rows])
+    ours, theirs = np.flatnonzero(same), rows[same]
+    state.ratios[ours] = previous.ratios[theirs]
+    state.vegetation[ours] = previous.vegetation[theirs]
+    state.road_condition[ours] = previous.road_condition[theirs]
+    state.trail_condition[ours] = previous.trail_condition[theirs]
+    return state
+
+
+def advance(state, days=1.0):
+    """
+    Advances the biome simulation for every room in the state by a number of
+    days, in place.
+    """
+    ratios = state.ratios
+    # vegetation grows back toward the most the room's biomes support
+    vegetation_min = ratios @ VEGETATION_MIN
+    vegetation_max = ratios @ VEGETATION_MAX
+    growth = min(VEGETATION_GROWTH * days, 1.0)
+    vegetation = state.vegetation + growth * (vegetation_max - state.vegetation)
+    state.vegetation = np.clip(vegetation, vegetation_min, vegetation_max)
+
+    # roads and trails wear out, faster the worse they were built
+    has_road = ratios[:, ROAD] > 0
+    has_trail = ratios[:, TRAIL] > 0
+    road_wear = ROAD_WEAR * days * (1 - state.road_quality / 2)
+    trail_wear = TRAIL_WEAR * days * (1 - state.trail_quality / 2)
+    state.road_condition = np.where(
+        has_road, np.clip(state.road_condition - road_wear, 0, 1), state.road_condition)
+    state.trail_condition = np.where(
+        has_trail, np.clip(state.trail_condition - trail_wear, 0, 1), state.trail_condition)
+
+    # worn out trails are reclaimed by the room's main natural biome, or by
+    # fields if the room has none
+    worn_trails = np.flatnonzero(has_trail & (state.trail_condition <= 0))
+    if len(worn_trails):
+        natural = ratios[np.ix_(worn_trails, NATURAL_BIOMES)]
+        reclaimed_by = np.where(natural.max(axis=1) > 0,
+                                NATURAL_BIOMES[natural.argmax(axis=1)], FIELDS)
+        ratios[worn_trails, reclaimed_by] += ratios[worn_trails, TRAIL]
+        ratios[worn_trails, TRAIL] = 0
+        state.trail_condition[worn_trails] = 1
+
+    # worn out roads become fresh trails
+    worn_roads = np.flatnonzero(has_road & (state.road_condition <= 0))
+    if len(worn_roads):
+        ratios[worn_roads, TRAIL] += ratios[worn_roads, ROAD]
+        ratios[worn_roads, ROAD] = 0
+        state.road_condition[worn_roads] = 1
+        state.trail_condition[worn_roads] = 1
+    return state
+
+
+def _read_attributes(room_ids):
+    """
+    Returns {room id: {attribute key: (attribute id, value)}} for the biome
+    Attributes of the rooms.
+    """
+    from evennia.typeclasses.attributes import Attribute
+    from evennia.utils.dbserialize import from_pickle
+    stored = {}
+    for chunk in chunks(room_ids):
+        rows = Attribute.objects.filter(
+            objectdb__id__in=chunk, db_key__in=_ATTRIBUTE_KEYS,
+            db_category__isnull=True).values_list('id', 'objectdb__id', 'db_key', 'db_value')
+        for attribute_id, room_id, key, value in rows:
+            stored.setdefault(room_id, {})[key] = (attribute_id, from_pickle(value))
+    return stored
+
+
+def _migrate_rooms(room_ids):
+    """
+    Loads rooms that don't have the sparse biome Attributes yet, so their
+    BiomeHandler converts (or creates) them.
+    """
+    from evennia.objects.models import ObjectDB
+    for chunk in chunks(room_ids):
+        for room in ObjectDB.objects.filter(id__in=chunk):
+            # loading the handler converts or creates the Attributes
+            getattr(room, 'biomes', None)
+
+
+def zone_room_ids(zone):
+    """ Returns the ids of the outdoor rooms in a zone, from the room index. """
+    return ROOM_INDEX.room_ids_in_zone(zone, outdoor=True)
+
+
+def load_zone_state(zone=None, room_ids=None):
+    """
+    Reads the biome values of every outdoor room in a zone (or of the given
+    room ids) into a BiomeState.
+    """
+    if room_ids is None:
+        room_ids = zone_room_ids(zone)
+    room_ids = sorted(room_ids)
+    stored = _read_attributes(room_ids)
+    missing = [room_id for room_id in room_ids
+               if set(stored.get(room_id, {})) != set(_ATTRIBUTE_KEYS)]
+    if missing:
+        _migrate_rooms(missing)
+        stored.update(_read_attributes(missing))
+    return state_from_attributes(room_ids, stored)
+
+
+def state_from_attributes(room_ids, stored):
+    """
+    Builds a BiomeState from the rooms' biome Attributes, as read by
+    _read_attributes(). Rooms missing any of them are left out.
+    """
+    room_ids = [room_id for room_id in room_ids
+                if set(stored.get(room_id, {})) == set(_ATTRIBUTE_KEYS)]
+    columns = {key: index for index, key in enumerate(BIOME_KEYS)}
+    road_defaults = BIOME_CATALOG['road'].extra
+    trail_defaults = BIOME_CATALOG['trail'].extra
+    count = len(room_ids)
+    ratios = np.zeros((count, len(BIOME_KEYS)))
+    vegetation = np.zeros(count)
+    road = np.zeros((count, 2))
+    trail = np.zeros((count, 2))
+    attribute_ids = {key: np.zeros(count, dtype=np.int64) for key in _ATTRIBUTE_KEYS}
+    for row, room_id in enumerate(room_ids):
+        room = stored[room_id]
+        for key in _ATTRIBUTE_KEYS:
+            attribute_ids[key][row] = room[key][0]
+        for biome, ratio in room['biome_ratios'][1].items():
+            if biome in columns:
+                ratios[row, columns[biome]] = ratio
+        vegetation[row] = room['vegetation'][1] or 0
+        extras = room['biome_extras'][1]
+        road_extras = extras.get('road', {})
+        trail_extras = extras.get('trail', {})
+        road[row] = (road_extras.get('condition', road_defaults['condition']),
+                     road_extras.get('quality', road_defaults['quality']))
+        trail[row] = (trail_extras.get('condition', trail_defaults['condition']),
+                      trail_extras.get('quality', trail_defaults['quality']))
+    state = BiomeState(room_ids, ratios, vegetation, road[:, 0], trail[:, 0],
+                       road[:, 1], trail[:, 1])
+    state.attribute_ids = attribute_ids
+    state.stored_extras = {room_id: stored[room_id]['biome_extras'][1]
+                           for room_id in room_ids}
+    return state
+
+
+def save_zone_state(state):
+    """
+    Writes back the Attributes of the rooms in the state whose values have
+    changed since it was loaded. Returns the number of rooms written.
+    """
+    from evennia.typeclasses.attributes import Attribute
+    from evennia.objects.models import ObjectDB
+    from evennia.utils.dbserialize import to_pickle
+    changed = state.changed()
+    ratios_changed, vegetation_changed, extras_changed = changed
+    new_values = changed_attributes(state, changed)
+
+    attribute_ids = [int(attribute_id) for attribute_id in new_values]
+    for chunk in chunks(attribute_ids):
+        attributes = list(Attribute.objects.filter(id__in=chunk))
+        for attribute in attributes:
+            attribute.db_value = to_pickle(new_values[attribute.id])
+        Attribute.objects.bulk_update(attributes, ['db_value'])
+
+    changed_rows = np.flatnonzero(ratios_changed | vegetation_changed | extras_changed)
+    for room_id in state.room_ids[changed_rows].tolist():
+        # rooms already loaded in memory have to re-read their biomes
+        room = ObjectDB.get_cached_instance(room_id)
+        if room is not None and 'biomes' in room.__dict__:
+            room.biomes.reload()
+    # the other rooms keep their unsaved progress until it shows
+    state.mark_saved(changed)
+    return len(changed_rows)
+
+
+def changed_attributes(state, changed):
+    """
+    Returns {attribute id: new value} for the Attributes of the rows that
+    changed() says have changed.
+    """
+    ratios_changed, vegetation_changed, extras_changed = changed
+    new_values = {}
+    for row in np.flatnonzero(ratios_changed):
+        new_values[state.attribute_ids['biome_ratios'][row]] = {
+            BIOME_KEYS[column]: float(state.ratios[row, column])
+            for column in np.flatnonzero(state.ratios[row])}
+    for row in np.flatnonzero(vegetation_changed):
+        new_values[state.attribute_ids['vegetation'][row]] = float(state.vegetation[row])
+    road_defaults = BIOME_CATALOG['road'].extra
+    trail_defaults = BIOME_CATALOG['trail'].extra
+    for row in np.flatnonzero(extras_changed):
+        extras = {key: dict(value) for key, value in
+                  state.stored_extras[int(state.room_ids[row])].items()}
+        for biome, condition, defaults in (
+                ('road', state.road_condition[row], road_defaults),
+                ('trail', state.trail_condition[row], trail_defaults)):
+            biome_extras = extras.setdefault(biome, {})
+            if condition == defaults['condition']:
+                biome_extras.pop('condition', None)
+            else:
+                biome_extras['condition'] = float(condition)
+            if not biome_extras:
+                del extras[biome]
+        state.stored_extras[int(state.room_ids[row])] = extras
+        new_values[state.attribute_ids['biome_extras'][row]] = extras
+    return new_values
+
+
+# each zone's state from the last tick, with the progress too small to save yet
+_CARRIED_STATES = {}
+
+
+def simulate_world(days=1.0, zones=None):
+    """
+    Advances the biome simulation by a number of days for every outdoor room
+    in the given zones (every zone with outdoor rooms if None).
+    """
+    if zones is None:
+        zones = ROOM_INDEX.zones(outdoor=True)
+    written = 0
+    for zone in zones:
+        state = carry_over(load_zone_state(zone), _CARRIED_STATES.get(zone))
+        if not len(state):
+            _CARRIED_STATES.pop(zone, None)
+            continue
+        advance(state, days)
+        written += save_zone_state(state)
+        _CARRIED_STATES[zone] = state
+        SIM_LOG.debug("Advanced {} rooms in zone {}.", len(state), zone)
+    SIM_LOG.info("Biome simulation advanced {} days. {} rooms changed.", days, written)
+    return written
+
+
+def reset_zone_biomes(zone, chunk_size=QUERY_CHUNK_SIZE):
+    """
+    Puts every outdoor room in the zone back to the catalog's default
+    biomes. A generator that yields ('resetting', rooms done) after every
+    chunk of rooms, for running as a builder job. The rooms are loaded to
+    reset them, so it must run on the reactor (threaded=False).
+    """
+    from evennia.objects.models import ObjectDB
+    room_ids = sorted(zone_room_ids(zone))
+    done = 0
+    for chunk in chunks(room_ids, chunk_size):
+        for room in ObjectDB.objects.filter(id__in=chunk):
+            apply_biomes(room)
+        done += len(chunk)
+        yield 'resetting', done
+    SIM_LOG.info("Reset the biomes of {} rooms in zone {}.", done, zone)
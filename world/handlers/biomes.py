@@ -10,7 +10,18 @@ factors such as elevation, time of year, climate/weather, the actions of
 mobile characters & NPCs, etc.
 Biomes are for use in outdoor rooms. Indoor rooms will just have objects
 and status effects.
+The biome definitions are held once, in BIOME_CATALOG. Rooms only store the
+ratio of each biome they actually have (biome_ratios), any extra values
+that differ from the catalog's (biome_extras), e.g. the condition of a road,
+and how much vegetation the room has (vegetation). The last is grown and
+worn down over time by world/handlers/biome_simulation.py.
+room.biomes is a BiomeHandler that reads and writes those, and still works
+like the TraitHandler rooms used to use for biomes: room.biomes.forest.base,
+room.biomes.all_dict, etc.
 """
+from collections import namedtuple
+from types import MappingProxyType
+from world.handlers.traits import TraitException
 
 
 # map symbols for overhead mapping. This is here as a reference.
@@ -269,21 +280,303 @@ _BIOME_DATA = {
 }
 
 
+Biome = namedtuple('Biome', ['key', 'name', 'type', 'desc', 'vegetation_min',
+                             'vegetation_max', 'climate', 'biome_ratio', 'extra'])
+
+
+def _make_catalog():
+    """ Freezes _BIOME_DATA into the shared, read-only biome catalog. """
+    catalog = {}
+    for key, data in _BIOME_DATA.items():
+        catalog[key] = Biome(key=key,
+                             name=data['name'],
+                             type=data['type'],
+                             desc=data.get('desc', ''),
+                             vegetation_min=data['vegetation_min'],
+                             vegetation_max=data['vegetation_max'],
+                             climate=tuple(data['climate']),
+                             biome_ratio=data['biome_ratio'],
+                             extra=MappingProxyType(dict(data['extra'])))
+    return MappingProxyType(catalog)
+
+
+# every biome in the game, in display order. Shared by all rooms.
+BIOME_CATALOG = _make_catalog()
+BIOME_KEYS = tuple(BIOME_CATALOG.keys())
+
+
 def apply_biomes(room):
     """
     Initializes a room with the full list of biomes.
     The biomes will have to be edited later on the individual rooms.
     """
     room.biomes.clear()
-    for biome, data in _BIOME_DATA.items():
-        room.biomes.add(
-            key=biome,
-            type='static',
-            base=data['biome_ratio'],
-            mod=0,
-            name=data['name'],
-            extra=data['extra']
-        )
+    for biome in BIOME_CATALOG.values():
+        if biome.biome_ratio:
+            room.biomes.get(biome.key).base = biome.biome_ratio
+
+
+class RoomBiome(object):
+    """
+    A room's share of one catalog biome. Looks like the static Trait biomes
+    used to be stored as: `base`, `actual` and `current` are the room's ratio
+    of the biome (`mod` is always 0), and the catalog's extra values can be
+    read and overridden as attributes or dict keys.
+    """
+    __slots__ = ('handler', 'key')
+
+    def __init__(self, handler, key):
+        object.__setattr__(self, 'handler', handler)
+        object.__setattr__(self, 'key', key)
+
+    def __repr__(self):
+        return "RoomBiome({!r}, {})".format(self.key, self.base)
+
+    def __str__(self):
+        return "{name:12} {actual:11} ({mod:+3})".format(
+            name=self.name, actual=self.actual, mod=self.mod)
+
+    @property
+    def catalog(self):
+        """ The shared catalog entry for the biome. """
+        return BIOME_CATALOG[self.key]
+
+    @property
+    def name(self):
+        return self.catalog.name
+
+    @property
+    def base(self):
+        """ The ratio of the room that is this biome, from 0 to 1. """
+        return self.handler.ratio(self.key)
+
+    @base.setter
+    def base(self, amount):
+        if type(amount) in (int, float):
+            self.handler.set_ratio(self.key, amount)
+
+    @property
+    def mod(self):
+        return 0
+
+    actual = base
+    current = base
+
+    @property
+    def extra(self):
+        """ Returns a list containing available extra data keys. """
+        return list(self.handler.extras(self.key).keys())
+
+    def __getattr__(self, key):
+        if key in RoomBiome.__slots__:
+            raise AttributeError(key)
+        extras = self.handler.extras(self.key)
+        if key in extras:
+            return extras[key]
+        raise AttributeError(
+            "RoomBiome '{}' has no attribute {!r}".format(self.key, key))
+
+    def __setattr__(self, key, value):
+        propobj = getattr(self.__class__, key, None)
+        if isinstance(propobj, property):
+            if propobj.fset is None:
+                raise AttributeError("can't set attribute")
+            propobj.fset(self, value)
+        elif key in RoomBiome.__slots__:
+            raise AttributeError("can't set attribute")
+        else:
+            self.handler.set_extra(self.key, key, value)
+
+    def __getitem__(self, key):
+        try:
+            return self.__getattr__(key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        self.__setattr__(key, value)
+
+    def __pos__(self):
+        return self.actual
+
+
+class BiomeHandler(object):
+    """
+    Handler for a room's biomes. Stores only the non-zero biome ratios and the
+    extra values that differ from the catalog, in the biome_ratios and
+    biome_extras Attributes.
+    Args:
+        obj (Room): the room the biomes belong to
+    """
+    def __init__(self, obj):
+        self.obj = obj
+        if not obj.attributes.has('biome_ratios'):
+            self._migrate()
+        if not obj.attributes.has('vegetation'):
+            obj.attributes.add('vegetation', 0)
+        self.reload()
+
+    def reload(self):
+        """
+        Re-reads the room's biome Attributes. Called after the biome
+        simulation writes to them directly.
+        """
+        self.ratios = self.obj.attributes.get('biome_ratios')
+        self.extra_values = self.obj.attributes.get('biome_extras')
+        self.sorted_keys = None
+
+    def _migrate(self):
+        """
+        Converts the biome traits rooms used to store (every biome in full, in
+        the 'biome' Attribute) into the sparse form.
+        """
+        ratios, extra_values = {}, {}
+        for key, data in (self.obj.attributes.get('biome') or {}).items():
+            if key not in BIOME_CATALOG:
+                continue
+            ratio = data.get('base', 0) + data.get('mod', 0)
+            if ratio:
+                ratios[key] = ratio
+            changed = {name: value for name, value in (data.get('extra') or {}).items()
+                       if BIOME_CATALOG[key].extra.get(name) != value}
+            if changed:
+                extra_values[key] = changed
+        self.obj.attributes.add('biome_ratios', ratios)
+        self.obj.attributes.add('biome_extras', extra_values)
+        self.obj.attributes.remove('biome')
+
+    def __len__(self):
+        return len(BIOME_CATALOG)
+
+    def __getattr__(self, key):
+        return self.get(key)
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def get(self, key):
+        """ Returns the RoomBiome for a catalog biome key, or None. """
+        if key not in BIOME_CATALOG:
+            return None
+        return RoomBiome(self, key)
+
+    def ratio(self, key):
+        """ Returns the room's ratio of a biome. """
+        return self.ratios.get(key, 0)
+
+    def set_ratio(self, key, amount):
+        """ Sets the room's ratio of a biome. Zero ratios aren't stored. """
+        if amount:
+            self.ratios[key] = amount
+        elif key in self.ratios:
+            del self.ratios[key]
+        self.sorted_keys = None
+
+    @property
+    def vegetation(self):
+        """ How much of the room is covered in vegetation, from 0 to 1. """
+        return self.obj.attributes.get('vegetation') or 0
+
+    @vegetation.setter
+    def vegetation(self, amount):
+        self.obj.attributes.add('vegetation', amount)
+
+    def extras(self, key):
+        """ Returns the biome's extra values, with the room's overrides. """
+        extras = dict(BIOME_CATALOG[key].extra)
+        extras.update(self.extra_values.get(key, {}))
+        return extras
+
+    def set_extra(self, key, name, value):
+        """ Overrides one of a biome's extra values for this room. """
+        if key in self.extra_values:
+            self.extra_values[key][name] = value
+        else:
+            self.extra_values[key] = {name: value}
+
+    def add(self, key, name=None, type='static', base=0, mod=0, min=None,
+            max=None, extra={}):
+        """ TraitHandler style add. Sets the ratio & extras of a catalog biome. """
+        if key not in BIOME_CATALOG:
+            raise TraitException("Unknown biome: {}".format(key))
+        self.set_ratio(key, base + mod)
+        for extra_name, value in extra.items():
+            if BIOME_CATALOG[key].extra.get(extra_name) != value:
+                self.set_extra(key, extra_name, value)
+
+    def remove(self, key):
+        """ Clears the room's ratio and extra values for a biome. """
+        if key not in BIOME_CATALOG:
+            raise TraitException("Biome not found: {}".format(key))
+        self.set_ratio(key, 0)
+        if key in self.extra_values:
+            del self.extra_values[key]
+
+    def clear(self):
+        """ Clears all of the room's biomes. """
+        self.obj.attributes.add('biome_ratios', {})
+        self.obj.attributes.add('biome_extras', {})
+        self.obj.attributes.add('vegetation', 0)
+        self.reload()
+
+    @property
+    def all(self):
+        """ Return a list of all biome keys. """
+        return list(BIOME_KEYS)
+
+    @property
+    def all_dict(self):
+        """
+        Return a dict of every biome in the same form as TraitHandler.all_dict,
+        with the largest ratios first.
+        """
+        return {key: self._data(key) for key in self._sorted_keys()}
+
+    def top(self, count=None, nonzero=False):
+        """
+        Returns a dict, in all_dict form, of the biomes with the largest
+        ratios, largest first.
+        Args:
+            count (int): how many biomes to return, all of them if None
+            nonzero (bool): only return biomes the room actually has
+        """
+        keys = self._sorted_keys()
+        if nonzero:
+            keys = [key for key in keys if self.ratio(key)]
+        if count is not None:
+            keys = keys[:count]
+        return {key: self._data(key) for key in keys}
+
+    def filter(self, predicate):
+        """
+        Returns a dict, in all_dict order, of the biomes whose data dict the
+        predicate returns True for.
+        """
+        biomes = {}
+        for key in self._sorted_keys():
+            data = self._data(key)
+            if predicate(data):
+                biomes[key] = data
+        return biomes
+
+    def _data(self, key):
+        """ Returns a biome in the data dict form biome traits used to have. """
+        return {'name': BIOME_CATALOG[key].name,
+                'type': 'static',
+                'base': self.ratio(key),
+                'mod': 0,
+                'extra': self.extras(key)}
+
+    def _sorted_keys(self):
+        """
+        Returns the biome keys sorted by ratio, largest first (catalog order
+        for ties). Cached until a ratio changes.
+        """
+        if self.sorted_keys is None:
+            ratios = self.ratios
+            self.sorted_keys = sorted(BIOME_KEYS, key=lambda key: ratios.get(key, 0),
+                                      reverse=True)
+        return self.sorted_keys
 
 
 class BIOME(object):
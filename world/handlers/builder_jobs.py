@@ -0,0 +1,151 @@
+# coding=utf-8
+"""
+Builder Jobs
+This file contains the background job runner for long builder operations
+that work across a whole zone, like the coordinate worm, resetting a zone's
+biomes or updating every room in a zone, so they don't hold up the rest of the
+game while they run.
+A job is a generator of steps. Each step does one chunk of the work (and
+commits it) and yields (stage, amount done), which the job reports back to the
+builder who started it every PROGRESS_INTERVAL seconds:
+    job = start_job(caller, "coordworm #123", worm.explore(), at_finish=mapped)
+Threaded jobs run each step in a worker thread (one step at a time, so a job
+never races itself), and come back to the reactor between steps to report
+progress and check for cancellation. Steps that work with loaded game objects
+aren't safe in a thread, so those jobs are run with threaded=False: each step
+then runs on the reactor in its own turn, letting everything else run in
+between chunks.
+at_finish(cancelled) is always called on the reactor once the job stops, so
+it is the place to update anything held in memory (loaded objects, the room
+index) from the job's results, or to start a follow-on job: the coordinate
+worm walks the exits in a thread, then saves in a second job on the reactor.
+Jobs can be listed and cancelled with the @jobs command.
+"""
+import itertools
+import time
+from world.handlers.game_log import get_log
+
+BUILD_LOG = get_log('room_build_debug.log')
+
+# how often (in seconds) a job tells its builder how it is getting on
+PROGRESS_INTERVAL = 2.0
+
+_DONE = object()
+
+
+class BuilderJob(object):
+    """
+    A long running builder operation.
+    Args:
+        job_id (int): the job's number in the @jobs list
+        caller (Object): the builder that started the job, who gets its messages
+        name (str): what to call the job in messages and the @jobs list
+        steps (generator): yields (stage, done) after every chunk of work
+        at_finish (callable): called with cancelled=True/False when the job stops
+        threaded (bool): run the steps in a worker thread
+    """
+    def __init__(self, job_id, caller, name, steps, at_finish=None, threaded=True):
+        self.id = job_id
+        self.caller = caller
+        self.name = name
+        self.steps = steps
+        self.at_finish = at_finish
+        self.threaded = threaded
+        self.stage = 'starting'
+        self.done = 0
+        self.status = 'running'
+        self.started = time.time()
+        self.last_report = self.started
+
+    def __str__(self):
+        return f"#{self.id} {self.name}: {self.stage} {self.done} ({self.status}, " \
+               f"{time.time() - self.started:.0f}s)"
+
+    def start(self):
+        self._next()
+
+    def cancel(self):
+        """ Stops the job once the step it is on has finished. """
+        if self.status == 'running':
+            self.status = 'cancelling'
+
+    def _step(self):
+        try:
+            return next(self.steps)
+        except StopIteration:
+            return _DONE
+
+    def _next(self):
+        from twisted.internet import reactor, threads
+        if self.status != 'running':
+            self._finish(cancelled=True)
+        elif self.threaded:
+            deferred = threads.deferToThread(self._step)
+            deferred.addCallbacks(self._stepped, self._failed)
+        else:
+            reactor.callLater(0, self._run_step)
+
+    def _run_step(self):
+        try:
+            result = self._step()
+        except Exception as error:
+            self._failed(error)
+            return
+        self._stepped(result)
+
+    def _stepped(self, result):
+        if result is _DONE:
+            self._finish(cancelled=False)
+            return
+        stage, done = result
+        now = time.time()
+        if stage != self.stage or now - self.last_report >= PROGRESS_INTERVAL:
+            self.last_report = now
+            self._msg(f"Job #{self.id} {self.name}: {stage} {done}...")
+        self.stage, self.done = stage, done
+        self._next()
+
+    def _failed(self, failure):
+        error = getattr(failure, 'value', failure)
+        BUILD_LOG.error("Builder job {} failed: {!r}", self.name, error)
+        self._msg(f"|rJob #{self.id} {self.name} failed: {error}|n")
+        self._finish(cancelled=True, status='failed')
+
+    def _finish(self, cancelled, status=None):
+        self.steps.close()
+        self.status = status or ('cancelled' if cancelled else 'done')
+        JOBS.pop(self.id, None)
+        if self.at_finish:
+            try:
+                self.at_finish(cancelled=cancelled)
+            except Exception as error:
+                BUILD_LOG.error("Finishing builder job {} failed: {!r}", self.name, error)
+        BUILD_LOG.info("Builder job {} {} after {} {}.", self.name, self.status,
+                       self.stage, self.done)
+        self._msg(f"Job #{self.id} {self.name} {self.status}: {self.stage} {self.done}.")
+
+    def _msg(self, text):
+        if self.caller:
+            self.caller.msg(text)
+
+
+# the running jobs, by id
+JOBS = {}
+_JOB_IDS = itertools.count(1)
+
+
+def start_job(caller, name, steps, at_finish=None, threaded=True):
+    """ Starts a BuilderJob running and returns it. """
+    job = BuilderJob(next(_JOB_IDS), caller, name, steps, at_finish=at_finish, threaded=threaded)
+    JOBS[job.id] = job
+    BUILD_LOG.info("Builder job {} started by {}.", name, caller.key if caller else None)
+    job.start()
+    return job
+
+
+def cancel_job(job_id):
+    """ Cancels a running job. Returns the job, or None if there isn't one. """
+    job = JOBS.get(job_id)
+    if job:
+        job.cancel()
+    return job
@@ -4,12 +4,136 @@ This script file will contain the combat handler that will orchestrate combat th
 room. This will include generating the room's battlefield map of subroom sections at the start of combat,
 adding combtants, spawn actionhandlers for indivuduals' single round of actions, and then cleaning up after
 combat has ceased.
+The state of a fight (combatants, queued actions, temp vars, the battlefield
+and the round count) is held in memory in a CombatState on the handler's ndb,
+so queueing actions and running rounds never touches the database. The
+handler isn't persistent, but snapshot() and restore() can carry a fight over
+a server reload if it is made persistent.
+Handlers don't run their own timers. Each one registers with the shared
+COMBAT_SCHEDULER (see combat_scheduler.py) when it starts, and the scheduler
+calls resolve_round() once every combat round, which runs the round pipeline
+in combat_round.py.
 """
 import random
+from collections import deque
 from evennia import DefaultScript
-from evennia.utils.logger import log_file
 from evennia import create_object, create_script
 from evennia import utils
+from world.handlers.game_log import get_log
+from world.handlers.combat_scheduler import COMBAT_SCHEDULER
+from world.handlers.combat_round import run_round
+from world.handlers.combat_messages import CombatMessageBuffer
+from world.handlers.battlefield import Battlefield
+
+COMBAT_LOG = get_log('combat_step.log')
+ROUND_LOG = get_log('combat.log')
+
+
+# actions that stay at the front of a combatant's queue, round after round,
+# until they succeed (or the combatant cancels them)
+PRIORITY_ACTIONS = ('flee', 'yield', 'disengage')
+# how many actions a combatant can have queued. Older actions fall off the
+# end of the queue when newer ones are added
+MAX_QUEUED_ACTIONS = 2
+
+
+class ActionQueue(object):
+    """
+    A single combatant's queued actions. The newest action is used first,
+    and when nothing is queued the combatant falls back on their default
+    attack. A priority action (flee, yield or disengage) jumps ahead of
+    everything else and isn't used up, so it is tried every round until
+    clear_priority() is called.
+    Args:
+        default (str): the action to use when nothing is queued
+        maxlen (int): how many actions can be queued
+    """
+    __slots__ = ('actions', 'default', 'priority')
+
+    def __init__(self, default, maxlen=MAX_QUEUED_ACTIONS, actions=(), priority=None):
+        self.actions = deque(actions, maxlen=maxlen)
+        self.default = default
+        self.priority = priority
+
+    def __len__(self):
+        return len(self.actions) + (1 if self.priority else 0)
+
+    def __iter__(self):
+        if self.priority:
+            yield self.priority
+        for action in self.actions:
+            yield action
+
+    def push(self, action):
+        """ Queues an action in front of the others. """
+        if action in PRIORITY_ACTIONS:
+            self.priority = action
+        else:
+            self.actions.appendleft(action)
+
+    def peek(self):
+        """ Returns the action that will be used next, without using it. """
+        if self.priority:
+            return self.priority
+        if self.actions:
+            return self.actions[0]
+        return self.default
+
+    def pop(self):
+        """ Returns the action for this round, using it up if it's queued. """
+        if self.priority:
+            return self.priority
+        if self.actions:
+            return self.actions.popleft()
+        return self.default
+
+    def replace(self, action):
+        """ Throws away everything queued and queues the action instead. """
+        self.clear()
+        self.push(action)
+
+    def clear_priority(self):
+        """ Cancels the priority action (once a flee has worked, say). """
+        self.priority = None
+
+    def clear(self):
+        """ Empties the queue, priority action included. """
+        self.actions.clear()
+        self.priority = None
+
+    def snapshot(self):
+        """ Returns the queue as plain data for CombatHandler.snapshot(). """
+        return {'actions': list(self.actions), 'default': self.default,
+                'priority': self.priority}
+
+    @classmethod
+    def from_snapshot(cls, data):
+        return cls(data['default'], actions=data['actions'], priority=data['priority'])
+
+
+class CombatState(object):
+    """
+    The in-memory state of a single fight.
+    Attributes:
+        characters (dict): character id -> combatant
+        turn_actions (dict): character id -> ActionQueue
+        char_temp_vars (dict): character id -> dict of temp combat variables
+        battlefield_map (Battlefield): the in-memory grid of room sections
+            making up the battlefield, and the combatants in them
+        round_count (int): the current round, to make debugging easier
+        messages (CombatMessageBuffer): the events of the current round
+    """
+    __slots__ = ('characters', 'turn_actions', 'char_temp_vars',
+                 'battlefield_map', 'round_count', 'messages')
+
+    def __init__(self):
+        self.characters = {}
+        self.turn_actions = {}
+        self.char_temp_vars = {}
+        self.battlefield_map = None
+        self.round_count = 1
+        self.messages = CombatMessageBuffer()
+
 
 class CombatHandler(DefaultScript):
     """
@@ -18,28 +142,70 @@ class CombatHandler(DefaultScript):
     # standard script hooks
     def at_script_creation(self):
         "Called when script is first created"
-        
+
         self.key = "combat_handler_%i" % random.randint(1, 1000000)
         self.desc = "handles combat"
-        self.interval = 5  # five second timeout
+        # rounds are run by the COMBAT_SCHEDULER, not a timer of our own
+        self.interval = 0
         self.start_delay = False
         self.persistent = False
-        
-        # store all combatants
-        self.db.characters = {}
-        # store all room subsections for the room's battlefield. This will be a named dictionary of all
-        # subroom section objects, the combatants in those subroom sections (if any)
-        self.db.battlefield_map = {}
-        # store all actions for each turn
-        self.db.turn_actions = {}
-        # store all temp vars for the characters
-        # NOTE: to begin with, these will be stored on the character, but
-        # later we will move these to the handler or to the mini-script
-        # for carrying out each attack.
-        self.db.char_temp_vars = {}
-        # keep track of round # so it is easier to debug
-        self.db.round_count = 1
-        
+
+    @property
+    def state(self):
+        """ The in-memory CombatState of this fight. """
+        state = self.ndb.state
+        if state is None:
+            state = self.ndb.state = CombatState()
+        return state
+
+    @property
+    def room(self):
+        """ The room the fight is in; the handler's object, if it has one. """
+        if self.obj:
+            return self.obj
+        for character in self.state.characters.values():
+            return character.location
+        return None
+
+    def snapshot(self):
+        """
+        Returns the fight's state as plain data (character ids rather than
+        characters) that can be stored in an Attribute.
+        """
+        state = self.state
+        return {'characters': list(state.characters.keys()),
+                'turn_actions': {dbref: actions.snapshot()
+                                 for dbref, actions in state.turn_actions.items()},
+                'char_temp_vars': {dbref: dict(temp_vars)
+                                   for dbref, temp_vars in state.char_temp_vars.items()},
+                'battlefield_map': (state.battlefield_map.snapshot()
+                                    if state.battlefield_map else None),
+                'round_count': state.round_count}
+
+    def restore(self, snapshot):
+        """ Rebuilds the fight's state from a snapshot(). """
+        from evennia.objects.models import ObjectDB
+        state = self.ndb.state = CombatState()
+        for character in ObjectDB.objects.filter(id__in=snapshot['characters']):
+            state.characters[character.id] = character
+        state.turn_actions = {dbref: ActionQueue.from_snapshot(actions)
+                              for dbref, actions in snapshot['turn_actions'].items()
+                              if dbref in state.characters}
+        state.char_temp_vars = {dbref: dict(temp_vars)
+                                for dbref, temp_vars in snapshot['char_temp_vars'].items()
+                                if dbref in state.characters}
+        if snapshot.get('battlefield_map'):
+            state.battlefield_map = Battlefield.from_snapshot(snapshot['battlefield_map'])
+            for dbref in list(state.battlefield_map.positions):
+                if dbref not in state.characters:
+                    state.battlefield_map.remove(dbref)
+        state.round_count = snapshot['round_count']
+
+    def at_server_reload(self):
+        "Keep the fight going over a reload if this handler is persistent."
+        if self.persistent:
+            self.db.snapshot = self.snapshot()
+
     def _init_character(self, character):
         """
         This initializes handler back-reference
@@ -47,133 +213,167 @@ class CombatHandler(DefaultScript):
         """
         character.ndb.combat_handler = self
         character.cmdset.add("commands.combat_commands.CombatCmdSet")
-        log_file(f"Added backref for {self.name} to {character.name}.", \
-                 filename='combat_step.log')
-        
+        COMBAT_LOG.debug("Added backref for {} to {}.", self.name, character.name)
+
     def _cleanup_character(self, character):
         """
         Remove character from handler and clean
         it of the back-reference and cmdset
         """
-        log_file(f"Starting cleanup for {character.name}.", \
-                 filename='combat_step.log')
+        COMBAT_LOG.debug("Starting cleanup for {}.", character.name)
+        dbref = character.id
+        state = self.state
+        state.characters.pop(dbref, None)
+        state.turn_actions.pop(dbref, None)
+        state.char_temp_vars.pop(dbref, None)
+        if state.battlefield_map:
+            state.battlefield_map.remove(character)
+        del character.ndb.combat_handler
         character.cmdset.delete("commands.combat_commands.CombatCmdSet")
         character.db.info['In Combat'] = False
         character.db.info['Position'] = 'standing'
-        
+
     def at_start(self):
         """
         This is called on first start but also when the script is restarted
         after a server reboot. We need to re-assign this combat handler to
         all characters as well as re-assign the cmdset.
         """
-        for character in self.db.characters.values():
+        if self.db.snapshot:
+            self.restore(self.db.snapshot)
+            del self.db.snapshot
+        for character in self.state.characters.values():
             self._init_character(character)
-    
+        COMBAT_SCHEDULER.register(self)
+
     def at_stop(self):
         "Called just before the script is stopped/destroyed."
-        log_file("start of char cleanup func", filename='combat_step.log')
-        for character in list(self.db.characters.values()):
-            # note: the list() call above disconnects list from database
+        COMBAT_SCHEDULER.unregister(self)
+        COMBAT_LOG.debug("start of char cleanup func")
+        for character in list(self.state.characters.values()):
+            # note: the list() call above copies the values so we can
+            # remove characters while looping
             self._cleanup_character(character)
-        del self.db.characters[dbref]
-        del self.db.turn_actions[dbref]
-        del self.db.char_temp_vars[dbref]
-        
-     def at_repeat(self):
-        """
-        This is called every self.interval seconds (turn timeout) or
-        when force_repeat is called.
-        At repeat, the plan is to use up an action from the queue of actions
-        for each character. The action will then be converted into a smaller
-        script for that action of a type related to the action type. For example,
-        a character wanting to grapple will create a grapple action script,
-        which will then carry out the action and self delete.
-        """
-        for character in self.db.characters.values():
-            dbref = character.id
-            # update the char variables
-            log_file("*********************************************************************", \
-                     filename='combat.log')
-            log_file(f"START OF ROUND: {self.db.round_count} FOR {character.name}", \
-                     filename='combat_step.log')
-            # TODO: Implement overhead map updates
-            # TODO: Implenment range checks
-            # TODO: Implement character position checks
-            # TODO: Implement character death, yield, flee, & mercy checks
-            # TODO: Implement refresh of temporary combat variables
-            # TODO: Implement footwork checks
-            # TODO: Implement other combat validity checks
-            # TODO: Implement combat action picker
-            # TODO: Implement combat action handler for individual character actions
-            # TODO: Implement communication of combat outcomes for the round to all parties in the room
-            log_file(f"END OF AT_REPEAT FOR {character.name}.", filename='combat_step.log')
-        self.db.round_count += 1
-        
+
+    def at_repeat(self):
+        "Called when force_repeat is called. Runs a round straight away."
+        self.resolve_round()
+
+    def resolve_round(self):
+        """
+        This is called by the COMBAT_SCHEDULER once every combat round.
+        The round runs as a pipeline over the whole room at once (see
+        combat_round.py): gather everyone's action and target, roll every
+        attack and defense in one batch, resolve the hits, dodges and blocks
+        together, then send each observer the round in a single message.
+        """
+        state = self.state
+        ROUND_LOG.debug("*********************************************************************")
+        COMBAT_LOG.debug("START OF ROUND: {} FOR {} ({} combatants)", state.round_count,
+                         self.key, len(state.characters))
+        # TODO: Implement overhead map updates
+        # TODO: Implenment range checks
+        # TODO: Implement character position checks
+        # TODO: Implement character death, yield, flee, & mercy checks
+        # TODO: Implement refresh of temporary combat variables
+        # TODO: Implement footwork checks
+        # TODO: Implement other combat validity checks
+        batch = run_round(state)
+        # everyone watching gets the whole round in one message
+        try:
+            state.messages.flush(self.room, state.round_count)
+        finally:
+            # a failed flush mustn't leave the round's events piling up
+            state.messages.clear()
+        COMBAT_LOG.debug("END OF ROUND: {} FOR {}.", state.round_count, self.key)
+        state.round_count += 1
+        return batch
+
     # combat handler methods
+    def setup_battlefield(self, size=None):
+        """
+        Returns the fight's battlefield, laying it out first if there isn't
+        one yet. The size (Small, Medium or Large) defaults to the one that
+        fits the room.
+        """
+        state = self.state
+        if state.battlefield_map is None:
+            if size:
+                state.battlefield_map = Battlefield.from_size(size)
+            elif self.room:
+                state.battlefield_map = Battlefield.for_room(self.room)
+            else:
+                return None
+            COMBAT_LOG.debug("Laid out {} battlefield for {}", state.battlefield_map.size,
+                             self.key)
+        return state.battlefield_map
+
+    def move_character(self, character, direction):
+        """
+        Moves a combatant one section of the battlefield in the direction.
+        Returns their new coordinates, or None if they can't go that way.
+        """
+        battlefield = self.state.battlefield_map
+        if not battlefield:
+            return None
+        return battlefield.move(character, direction)
+
     def add_character(self, character):
         "Add combatant to handler"
         dbref = character.id
-        self.db.characters[dbref] = character
-        self.db.turn_actions[dbref] = [(character.db.info['Default Attack'])]
-        log_file(f"Added {character.name} to {self.name}", \
-                 filename='combat_step.log')
+        state = self.state
+        state.characters[dbref] = character
+        state.turn_actions[dbref] = ActionQueue(character.db.info['Default Attack'])
+        state.char_temp_vars[dbref] = {}
+        battlefield = self.setup_battlefield()
+        if battlefield and character not in battlefield:
+            battlefield.place(character)
+        COMBAT_LOG.debug("Added {} to {}", character.name, self.name)
         # set up back-reference
         self._init_character(character)
         # set character to be in combat
         character.db.info['In Combat'] = True
-        
+
     def remove_character(self, character):
         "Remove combatant from handler"
-        if character.id in self.db.characters:
+        characters = self.state.characters
+        if character.id in characters:
             self._cleanup_character(character)
-        if not self.db.characters:
+        if not characters:
             # if no more characters in battle, kill this handler
             self.stop()
-        elif len(self.db.characters) < 2:
+        elif len(characters) < 2:
             # less than 2 chars in combat, ending combat
-            log_file("less than 2 characters in combat. killing handler", \
-                      filename='combat_step.log')
+            COMBAT_LOG.debug("less than 2 characters in combat. killing handler")
             self.stop()
-            
+
     def add_action(self, action, character):
         """
         Called by combat commands to register an action with the handler.
          action - string identifying the action, like "hit" or "parry"
          character - the character performing the action
-         target - the target character or None
-        actions are stored in a dictionary keyed to each character, each
-        of which holds a list of max 2 actions. An action is stored as
-        a tuple (character, action, target).
+        actions are stored in an ActionQueue keyed to each character, which
+        holds up to MAX_QUEUED_ACTIONS actions, newest first.
         """
-        log_file(f"{self.key} - Start of add_action method for {character.name}.",
-                 filename='combat_step.log')
-        dbref = character.id
-        self.db.turn_actions[dbref].insert(0, action)
-        log_file(f"Added action: {action} for {character.name}", \
-                 filename='combat_step.log')
-        return
+        COMBAT_LOG.debug("{} - Start of add_action method for {}.", self.key, character.name)
+        self.state.turn_actions[character.id].push(action)
+        COMBAT_LOG.debug("Added action: {} for {}", action, character.name)
+
+    def replace_action(self, action, character):
+        "Replaces everything the character has queued with the action."
+        self.state.turn_actions[character.id].replace(action)
+        COMBAT_LOG.debug("Replaced actions with: {} for {}", action, character.name)
+
+    def peek_action(self, character):
+        "Returns the action the character will use next round."
+        return self.state.turn_actions[character.id].peek()
 
     def remove_action(self, character):
         """
-        Pops off the action in the zero position if appropriate.
-        Returns the desired action for the round.
+        Pops off the action at the front of the queue if appropriate.
+        Returns the desired action for the round. Flee type actions aren't
+        popped off; we keep trying them until they succeed.
         """
-        log_file("start of remove action func", filename='combat_step.log')
-        dbref = character.id
-        if len(self.db.turn_actions[dbref]) > 0:
-            log_file(f"Action at top of queue: {self.db.turn_actions[dbref][0]}", \
-                 filename='combat_step.log')
-        else:
-            log_file(f"No Actions in queue: {self.db.turn_actions[dbref]}", \
-                 filename='combat_step.log')
-            return character.db.info['Default Attack']
-        if self.db.turn_actions[dbref][0] == character.db.info['Default Attack']:
-            return character.db.info['Default Attack']
-        elif self.db.turn_actions[dbref][0] in ['flee', 'yield', 'disengage']:
-            # for flee type actions, we won't pop it off. keep trying until we succeed
-            return self.db.turn_actions[dbref][0]
-        else:
-            popped_action = self.db.turn_actions[dbref].pop(0)
-            log_file(f"Returning action: {popped_action}", filename='combat_step.log')
-            return popped_action
\ No newline at end of file
+        action = self.state.turn_actions[character.id].pop()
+        COMBAT_LOG.debug("Returning action: {}", action)
+        return action
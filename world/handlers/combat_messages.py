@@ -0,0 +1,123 @@
+# coding=utf-8
+"""
+Combat Messages
+This file contains the per-round message buffer for combat. Everything that
+happens in a round is added to the fight's buffer as a CombatEvent, and at the
+end of the round flush() sends each observer in the room one message holding
+the whole round, written from their point of view ("You hit Bob!" for the
+attacker, "Alice hits you!" for Bob and "Alice hits Bob!" for everyone else).
+Web clients get the round's events as structured OOB data alongside the text
+(the `combat_round` outputfunc), so they can draw the fight without parsing
+the text.
+Sending the round this way makes one write per observer per round, rather
+than one per event per observer.
+"""
+from collections import namedtuple
+from world.handlers.game_log import get_log
+
+ROUND_LOG = get_log('combat.log')
+
+# something that happened in a round. target is None for actions that
+# don't have one. outcome is one of the names in OUTCOME_NAMES.
+CombatEvent = namedtuple('CombatEvent', ['actor', 'action', 'target', 'outcome'])
+
+# outcome code -> name, matching the codes in combat_round.py
+OUTCOME_NAMES = {0: 'action', 1: 'hit', 2: 'dodged', 3: 'blocked'}
+
+# text for each outcome, filled in with the names as the observer sees them.
+# {actor_s} is the possessive form of the actor's name.
+_TEMPLATES = {
+    'action': "{actor} {tries} to {action}.",
+    'hit': "{actor_s} {action} hits {target}!",
+    'dodged': "{target} {dodges} {actor_s} {action}.",
+    'blocked': "{target} {blocks} {actor_s} {action}.",
+}
+
+
+def _name(character, viewer):
+    return "you" if character == viewer else character.name
+
+
+def _possessive(character, viewer):
+    return "your" if character == viewer else f"{character.name}'s"
+
+
+def render_event(event, viewer):
+    """ Returns the line describing the event, as the viewer sees it. """
+    actor, target = event.actor, event.target
+    line = _TEMPLATES[event.outcome].format(
+        actor=_name(actor, viewer),
+        actor_s=_possessive(actor, viewer),
+        target=_name(target, viewer) if target else '',
+        action=event.action,
+        tries="try" if actor == viewer else "tries",
+        dodges="dodge" if target == viewer else "dodges",
+        blocks="block" if target == viewer else "blocks",
+    )
+    return line[0].upper() + line[1:]
+
+
+def event_data(event):
+    """ Returns the event as plain data for the OOB payload. """
+    return {'actor': event.actor.name, 'actor_id': event.actor.id,
+            'action': event.action,
+            'target': event.target.name if event.target else None,
+            'target_id': event.target.id if event.target else None,
+            'outcome': event.outcome}
+
+
+class CombatMessageBuffer(object):
+    """
+    Collects a fight's events for the current round.
+    """
+    __slots__ = ('events',)
+
+    def __init__(self):
+        self.events = []
+
+    def __len__(self):
+        return len(self.events)
+
+    def add(self, actor, action, target=None, outcome='action'):
+        """ Adds an event to the round. """
+        self.events.append(CombatEvent(actor, action, target, outcome))
+
+    def extend(self, events):
+        """ Adds several CombatEvents to the round. """
+        self.events.extend(events)
+
+    def clear(self):
+        """ Throws away the round's events without sending them. """
+        self.events = []
+
+    def observers(self, room):
+        """
+        Returns the objects in the room that someone is watching through,
+        the only ones worth sending the round to.
+        """
+        return [obj for obj in room.contents if obj.sessions.count()]
+
+    def flush(self, room, round_count=None):
+        """
+        Sends every observer in the room the round's events in one message,
+        then empties the buffer. Returns the number of messages sent.
+        """
+        events, self.events = self.events, []
+        if not events or not room:
+            return 0
+        payload = {'round': round_count, 'events': [event_data(event) for event in events]}
+        observers = self.observers(room)
+        # everyone who isn't in any of the events reads the same text
+        involved = {event.actor for event in events} | {event.target for event in events}
+        bystander_text = None
+        for viewer in observers:
+            if viewer in involved:
+                text = "\n".join(render_event(event, viewer) for event in events)
+            else:
+                if bystander_text is None:
+                    bystander_text = "\n".join(render_event(event, None) for event in events)
+                text = bystander_text
+            viewer.msg(text=(text, {'type': 'combat'}), combat_round=((), payload))
+        ROUND_LOG.debug("Sent {} events to {} observers in {}.", len(events),
+                        len(observers), room.key)
+        return len(observers)
@@ -0,0 +1,190 @@
+# coding=utf-8
+"""
+Combat Round
+This file contains the staged pipeline a CombatHandler runs every round.
+Rather than working through the combatants one at a time, each stage works on
+the whole room at once:
+    1. gather_actions() takes every combatant's action for the round (from
+       their ActionQueue) and picks their target.
+    2. roll_attacks() reads the traits the round needs into arrays and draws
+       every attack and defense roll in a single call to the shared RNG.
+    3. resolve_attacks() compares the rolls with array maths and decides every
+       hit, dodge and block together.
+    4. outcome_events() turns the outcomes into CombatEvents for the fight's
+       message buffer (see combat_messages.py).
+The stages pass a RoundBatch between them, which holds one array entry per
+combatant in the order they were gathered.
+"""
+import numpy as np
+from world.handlers.game_log import get_log
+from world.handlers.randomness_handler import get_rng
+from world.handlers.combat_messages import CombatEvent, OUTCOME_NAMES
+
+ROUND_LOG = get_log('combat.log')
+
+# actions that aren't attacks. Defensive actions make the combatant harder to
+# hit for the round, the others (flee and the like) are resolved elsewhere.
+DEFENSIVE_ACTIONS = ('parry', 'block', 'dodge')
+BLOCKING_ACTIONS = ('parry', 'block')
+PASSIVE_ACTIONS = ('flee', 'yield', 'disengage')
+
+# what a combatant's score is when they are missing one of the traits below
+DEFAULT_TRAIT_SCORE = 100.0
+# the traits each roll averages
+ATTACK_TRAITS = ('Dex', 'Str')
+DODGE_TRAITS = ('Dex', 'Per')
+BLOCK_TRAITS = ('Str', 'Vit')
+# how much harder a combatant that spends the round defending is to hit
+DEFENSIVE_BONUS = 1.25
+
+# outcome codes
+NO_ATTACK = 0
+HIT = 1
+DODGED = 2
+BLOCKED = 3
+
+
+class RoundBatch(object):
+    """
+    A combat round's worth of data for every combatant in a fight.
+    Attributes:
+        combatants (list): the characters, in gather order
+        actions (list): each combatant's action for the round
+        targets (ndarray): index of each combatant's target, -1 for none
+        attacking (ndarray): True for combatants attacking this round
+        attack_rolls, defense_rolls (ndarray): the rolls for the round
+        blocking (ndarray): True for defenders blocking rather than dodging
+        outcomes (ndarray): outcome code of each combatant's attack
+        margins (ndarray): attack roll less the target's defense roll
+    """
+    __slots__ = ('combatants', 'actions', 'targets', 'attacking',
+                 'attack_rolls', 'defense_rolls', 'blocking',
+                 'outcomes', 'margins')
+
+    def __init__(self, combatants, actions, targets):
+        count = len(combatants)
+        self.combatants = combatants
+        self.actions = actions
+        self.targets = np.asarray(targets, dtype=np.int64)
+        self.attacking = np.array([action not in DEFENSIVE_ACTIONS + PASSIVE_ACTIONS
+                                   for action in actions], dtype=bool) & (self.targets >= 0)
+        self.attack_rolls = np.zeros(count)
+        self.defense_rolls = np.zeros(count)
+        self.blocking = np.zeros(count, dtype=bool)
+        self.outcomes = np.full(count, NO_ATTACK, dtype=np.int8)
+        self.margins = np.zeros(count)
+
+    def __len__(self):
+        return len(self.combatants)
+
+
+def trait_scores(combatants, keys):
+    """
+    Reads the `actual` value of the traits from every combatant into an
+    array (one row per combatant, one column per key). The combatants are
+    already loaded, so this reads their cached traits rather than the
+    database. Missing traits score DEFAULT_TRAIT_SCORE.
+    """
+    scores = np.full((len(combatants), len(keys)), DEFAULT_TRAIT_SCORE)
+    for row, character in enumerate(combatants):
+        traits = character.traits
+        for column, key in enumerate(keys):
+            trait = traits.get(key)
+            if trait is not None:
+                scores[row, column] = trait.actual
+    return scores
+
+
+def gather_actions(state):
+    """
+    Stage 1. Takes the round's action from every combatant's queue and
+    works out who they are attacking: the target in their temp vars if that
+    character is still in the fight, otherwise a random opponent.
+    Returns a RoundBatch.
+    """
+    combatant_ids = list(state.characters.keys())
+    combatants = [state.characters[dbref] for dbref in combatant_ids]
+    positions = {dbref: index for index, dbref in enumerate(combatant_ids)}
+    actions = [state.turn_actions[dbref].pop() for dbref in combatant_ids]
+    count = len(combatants)
+    targets = np.full(count, -1, dtype=np.int64)
+    if count > 1:
+        # a random opponent for everybody, skipping over themselves
+        picks = get_rng().integers(0, count - 1, size=count)
+        picks += picks >= np.arange(count)
+        for index, dbref in enumerate(combatant_ids):
+            chosen = state.char_temp_vars[dbref].get('target')
+            if chosen == dbref:
+                chosen = None
+            targets[index] = positions.get(chosen, picks[index])
+    return RoundBatch(combatants, actions, targets)
+
+
+def roll_attacks(batch):
+    """
+    Stage 2. Draws every attack and defense roll for the round in one go.
+    Each roll is taken from a normal distribution around the combatant's
+    score, like distro_return_a_roll_sans_crit.
+    """
+    if not len(batch):
+        return batch
+    scores = trait_scores(batch.combatants, ATTACK_TRAITS + DODGE_TRAITS + BLOCK_TRAITS)
+    split = len(ATTACK_TRAITS)
+    attack = scores[:, :split].mean(axis=1)
+    dodge = scores[:, split:split + len(DODGE_TRAITS)].mean(axis=1)
+    block = scores[:, split + len(DODGE_TRAITS):].mean(axis=1)
+    batch.blocking = np.array([action in BLOCKING_ACTIONS for action in batch.actions],
+                              dtype=bool)
+    defense = np.where(batch.blocking, block, dodge)
+    defending = np.array([action in DEFENSIVE_ACTIONS for action in batch.actions],
+                         dtype=bool)
+    defense = np.where(defending, defense * DEFENSIVE_BONUS, defense)
+    means = np.concatenate((attack, defense))
+    rolls = get_rng().normal(loc=means, scale=means / 10)
+    batch.attack_rolls = rolls[:len(batch)]
+    batch.defense_rolls = rolls[len(batch):]
+    return batch
+
+
+def resolve_attacks(batch):
+    """
+    Stage 3. Decides every attack in the round at once. An attack lands if
+    it beats the target's defense roll, otherwise the target dodged or
+    blocked it.
+    """
+    if not len(batch):
+        return batch
+    attacking = batch.attacking
+    targets = np.where(attacking, batch.targets, 0)
+    batch.margins = np.where(attacking, batch.attack_rolls - batch.defense_rolls[targets], 0.0)
+    missed = np.where(batch.blocking[targets], BLOCKED, DODGED)
+    batch.outcomes = np.where(attacking, np.where(batch.margins > 0, HIT, missed),
+                              NO_ATTACK).astype(np.int8)
+    ROUND_LOG.debug("Resolved {} attacks: {} hits.", int(attacking.sum()),
+                    int((batch.outcomes == HIT).sum()))
+    return batch
+
+
+def outcome_events(batch):
+    """
+    Stage 4. Returns a CombatEvent for every combatant's action, in gather
+    order, for the fight's message buffer.
+    """
+    events = []
+    combatants = batch.combatants
+    for index, character in enumerate(combatants):
+        outcome = batch.outcomes[index]
+        target = combatants[batch.targets[index]] if outcome != NO_ATTACK else None
+        events.append(CombatEvent(character, batch.actions[index], target,
+                                  OUTCOME_NAMES[outcome]))
+    return events
+
+
+def run_round(state):
+    """
+    Runs every stage of a round for a fight's CombatState. The round's
+    events are added to the state's message buffer. Returns the RoundBatch.
+    """
+    batch = resolve_attacks(roll_attacks(gather_actions(state)))
+    state.messages.extend(outcome_events(batch))
+    return batch
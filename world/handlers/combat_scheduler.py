@@ -0,0 +1,102 @@
+# coding=utf-8
+"""
+Combat Scheduler
+This file contains the process-wide scheduler that runs every fight in the
+game off a single shared tick, instead of each CombatHandler keeping its own
+interval timer.
+The scheduler ticks every COMBAT_TICK_INTERVAL seconds (driven by the
+CombatSchedulerScript global script), and a combat round lasts
+COMBAT_ROUND_INTERVAL seconds, so a round is spread over a number of ticks.
+Each fight is given one of those ticks (its slot) when it registers, always
+the slot with the fewest fights in it, so a hundred fights that start on the
+same tick still have their rounds resolved across the whole round instead of
+all at once.
+    COMBAT_SCHEDULER.register(handler)    # in CombatHandler.at_start
+    COMBAT_SCHEDULER.unregister(handler)  # in CombatHandler.at_stop
+Every tick, the fights in the current slot have their rounds resolved
+together with handler.resolve_round().
+"""
+from django.conf import settings
+from world.handlers.game_log import get_log
+
+ROUND_LOG = get_log('combat.log')
+
+
+class CombatScheduler(object):
+    """
+    Keeps every active fight, bucketed into the ticks of a combat round.
+    Args:
+        tick_interval (float): seconds between ticks
+        round_interval (float): seconds between rounds of a single fight
+    """
+    def __init__(self, tick_interval=None, round_interval=None):
+        self.tick_interval = tick_interval or getattr(settings, 'COMBAT_TICK_INTERVAL', 1)
+        self.round_interval = round_interval or getattr(settings, 'COMBAT_ROUND_INTERVAL', 5)
+        self.slot_count = max(1, int(round(self.round_interval / self.tick_interval)))
+        self.slots = [dict() for _ in range(self.slot_count)]
+        self.battle_slots = {}
+        self.tick_count = 0
+
+    def __len__(self):
+        return len(self.battle_slots)
+
+    def __contains__(self, handler):
+        return handler.id in self.battle_slots
+
+    def register(self, handler):
+        """
+        Adds a fight to the scheduler, in the least busy slot. A fight that
+        is already registered keeps its slot.
+        """
+        if handler.id in self.battle_slots:
+            return
+        # look from the next tick on, so a fight starting on a quiet tick
+        # waits (at most) a round before it first resolves
+        start = (self.tick_count + 1) % self.slot_count
+        order = [(start + offset) % self.slot_count for offset in range(self.slot_count)]
+        slot = min(order, key=lambda index: len(self.slots[index]))
+        self.slots[slot][handler.id] = handler
+        self.battle_slots[handler.id] = slot
+        ROUND_LOG.debug("Scheduled {} in slot {} ({} fights).", handler.key, slot, len(self))
+
+    def unregister(self, handler):
+        """ Removes a fight from the scheduler. """
+        if self._drop(handler.id):
+            ROUND_LOG.debug("Unscheduled {} ({} fights).", handler.key, len(self))
+
+    def _drop(self, handler_id):
+        slot = self.battle_slots.pop(handler_id, None)
+        if slot is None:
+            return False
+        self.slots[slot].pop(handler_id, None)
+        return True
+
+    def clear(self):
+        """ Forgets every fight. """
+        self.slots = [dict() for _ in range(self.slot_count)]
+        self.battle_slots = {}
+
+    def tick(self):
+        """
+        Resolves a round for every fight in the current slot, then moves on
+        to the next slot. Returns the number of rounds resolved.
+        """
+        slot = self.tick_count % self.slot_count
+        self.tick_count += 1
+        # copied, since a round can end a fight (and unregister it)
+        battles = list(self.slots[slot].items())
+        for handler_id, handler in battles:
+            if not handler.id:
+                # the handler was deleted without stopping cleanly
+                self._drop(handler_id)
+                continue
+            try:
+                handler.resolve_round()
+            except Exception as error:
+                # one broken fight shouldn't stop every other fight
+                ROUND_LOG.error("Round for {} failed: {!r}", handler.key, error)
+        return len(battles)
+
+
+# the scheduler shared by everything in this process
+COMBAT_SCHEDULER = CombatScheduler()
@@ -0,0 +1,166 @@
+# coding=utf-8
+"""
+Coordinate Worm
+This file contains the worm the @coordworm command uses to give every room
+connected to a starting room (by the cardinal exits) coordinates relative to
+it, along with the starting room's zone and outdoor flag.
+The worm works in two passes:
+    1. explore() walks the exits breadth first, a whole layer of rooms at a
+       time, reading the exits of up to QUERY_CHUNK_SIZE rooms per query. The
+       coordinates are worked out in memory. It only reads the database (no
+       game objects), so it can run in a worker thread.
+    2. save() writes the coordinates, zone and outdoor flag. Rooms that
+       aren't loaded are updated in bulk, one transaction per chunk of rooms;
+       loaded rooms are updated through their handlers, so they don't go
+       stale. The room index is moved along with them. It works with loaded
+       objects and Evennia's object caches, so it has to run on the reactor.
+The passes are generators that yield (stage, rooms done) after every chunk,
+so a caller can report progress or spread the work out (see builder_jobs.py):
+    worm = CoordinateWorm(room)
+    worm.run(progress=lambda stage, done: caller.msg(f"{stage}: {done}"))
+If the zone isn't self-consistent, the first route the worm finds to a room
+decides its coordinates.
+"""
+from world.handlers.map_index import CARDINAL_OFFSETS, ROOM_INDEX
+from world.handlers.db_utils import QUERY_CHUNK_SIZE, chunks
+from world.handlers.game_log import get_log
+
+BUILD_LOG = get_log('room_build_debug.log')
+
+
+class CoordinateWorm(object):
+    """
+    Maps the rooms connected to a starting room and sets their coordinates.
+    Args:
+        room (Room): the room to start from. Its coordinates, zone and
+            outdoor flag are given to every room the worm reaches.
+        chunk_size (int): how many rooms to read or save at a time
+    """
+    def __init__(self, room, chunk_size=QUERY_CHUNK_SIZE):
+        self.start_id = room.id
+        self.zone = room.db.info['zone']
+        self.outdoors = room.db.info['outdoor room']
+        self.start = (int(room.traits.xcord.current), int(room.traits.ycord.current))
+        self.chunk_size = chunk_size
+        # room id -> (x, y)
+        self.coords = {}
+        self.saved = 0
+
+    @property
+    def mapped_room_ids(self):
+        """ The ids of every room the worm has reached. """
+        return self.coords.keys()
+
+    def explore(self):
+        """
+        Walks the exits out from the starting room, breadth first, working
+        out each room's coordinates. Yields ('mapping', rooms mapped) after
+        every chunk of rooms.
+        """
+        from evennia.objects.models import ObjectDB
+        coords = self.coords
+        coords[self.start_id] = self.start
+        frontier = [self.start_id]
+        while frontier:
+            next_frontier = []
+            for chunk in chunks(frontier, self.chunk_size):
+                exits = ObjectDB.objects.filter(
+                    db_location__id__in=chunk, db_destination__isnull=False).order_by(
+                    'id').values_list('db_location__id', 'db_key', 'db_destination__id')
+                for room_id, exit_name, destination_id in exits:
+                    # we only map in the cardinal directions. Mapping up/down would be
+                    # an interesting learning project for someone who wanted to try it.
+                    offset = CARDINAL_OFFSETS.get(exit_name.lower())
+                    if offset is None or destination_id in coords:
+                        continue
+                    x, y = coords[room_id]
+                    coords[destination_id] = (x + offset[0], y + offset[1])
+                    next_frontier.append(destination_id)
+                yield 'mapping', len(coords)
+            frontier = next_frontier
+        BUILD_LOG.info("Coordinate worm mapped {} rooms from #{}.", len(coords), self.start_id)
+
+    def save(self):
+        """
+        Writes the coordinates, zone and outdoor flag of every mapped room
+        but the starting one. Yields ('saving', rooms saved) after every
+        chunk. Must run on the reactor (each chunk is checked against the
+        loaded rooms and written in the same step, so nothing can load a
+        room in between).
+        """
+        from evennia.objects.models import ObjectDB
+        room_ids = sorted(room_id for room_id in self.coords if room_id != self.start_id)
+        for chunk in chunks(room_ids, self.chunk_size):
+            stored = []
+            for room_id in chunk:
+                room = ObjectDB.get_cached_instance(room_id)
+                if room is None:
+                    stored.append(room_id)
+                else:
+                    self._save_room(room)
+            self._save_stored(stored)
+            for room_id in stored:
+                x, y = self.coords[room_id]
+                ROOM_INDEX.move_room(room_id, self.zone, x, y, self.outdoors)
+            self.saved += len(chunk)
+            yield 'saving', self.saved
+        BUILD_LOG.info("Coordinate worm saved {} rooms from #{}.", self.saved, self.start_id)
+
+    def _save_room(self, room):
+        """ Updates a room that is loaded in memory, through its handlers. """
+        x, y = self.coords[room.id]
+        with room.traits.batch():
+            room.traits.xcord.base = x
+            room.traits.ycord.base = y
+        info = dict(room.db.info or {})
+        info['zone'] = self.zone
+        info['outdoor room'] = self.outdoors
+        room.db.info = info
+        ROOM_INDEX.update_room(room)
+
+    def _save_stored(self, room_ids):
+        """
+        Updates the trait & info Attributes of rooms that aren't loaded,
+        straight in the database in one transaction.
+        """
+        if not room_ids:
+            return
+        from django.db import transaction
+        from evennia.typeclasses.attributes import Attribute
+        from evennia.utils.dbserialize import from_pickle, to_pickle
+        with transaction.atomic():
+            # read and rewrite in the one transaction, so no other write to
+            # the Attributes can land in between and be lost
+            owners = dict(Attribute.objects.select_for_update().filter(
+                objectdb__id__in=room_ids, db_key__in=('traits', 'info'),
+                db_category__isnull=True).values_list('id', 'objectdb__id'))
+            attributes = list(Attribute.objects.filter(id__in=list(owners)))
+            for attribute in attributes:
+                room_id = owners[attribute.id]
+                value = from_pickle(attribute.db_value)
+                if attribute.db_key == 'traits':
+                    x, y = self.coords[room_id]
+                    for trait, coord in (('xcord', x), ('ycord', y)):
+                        if trait in value:
+                            value[trait]['base'] = coord
+                else:
+                    value['zone'] = self.zone
+                    value['outdoor room'] = self.outdoors
+                attribute.db_value = to_pickle(value)
+            Attribute.objects.bulk_update(attributes, ['db_value'])
+
+    def steps(self):
+        """ Both passes, one after the other. """
+        yield from self.explore()
+        yield from self.save()
+
+    def run(self, progress=None):
+        """
+        Maps and saves every connected room in one go, calling
+        progress(stage, rooms done) after each chunk. Returns the number of
+        rooms mapped.
+        """
+        for stage, done in self.steps():
+            if progress:
+                progress(stage, done)
+        return len(self.coords)
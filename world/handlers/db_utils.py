@@ -0,0 +1,17 @@
+# coding=utf-8
+"""
+Database Utilities
+Helpers shared by the handlers that read or write many rooms straight in the
+database (the coordinate worm, the biome simulation, the zone scanner and the
+room grid builder).
+"""
+
+# the most ids put into one database query. SQLite allows 999 variables in a
+# query, so this leaves room for the rest of the query's parameters.
+QUERY_CHUNK_SIZE = 900
+
+
+def chunks(values, size=QUERY_CHUNK_SIZE):
+    """ Yields the values (a list or other sequence) in slices of up to size. """
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
@@ -0,0 +1,255 @@
+# coding=utf-8
+"""
+Game Log Handler
+This file contains the logging channels used for the game's debug and event
+logs (map_debug.log, combat_step.log, item_moves.log, etc).
+Every log file is a channel with its own level. Messages below the channel's
+level are dropped before they are formatted, so pass the values to format as
+arguments rather than building an f-string up front:
+    MAP_LOG = get_log('map_debug.log')
+    MAP_LOG.debug("Draw... Checking X: {}, Y: {}", x, y)
+For anything that is expensive to produce even as an argument (rendering a
+table, for instance), check the channel first:
+    if MAP_LOG.is_enabled(DEBUG):
+        MAP_LOG.debug("Table: {}", str(table))
+Messages that pass the level check are put on a bounded in-memory queue and a
+background thread writes them to the log files in batches, so the game never
+waits on disk writes. If the queue is full the message is dropped and counted
+rather than blocking the caller. flush() waits until the writer has written
+everything queued before it was called.
+Log files are rotated once they grow past GAME_LOG_ROTATE_SIZE bytes, like
+Evennia's own logs: map_debug.log becomes map_debug.log.1 and so on, keeping
+GAME_LOG_ROTATE_COUNT old files.
+Channel levels are set in settings.py with GAME_LOG_DEFAULT_LEVEL and
+GAME_LOG_LEVELS (a dict of log file name -> level name), and can be changed
+while the server runs with set_level().
+"""
+import os
+import queue
+import threading
+import time
+from django.conf import settings
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+OFF = 100
+
+LEVELS = {'debug': DEBUG, 'info': INFO, 'warning': WARNING, 'error': ERROR,
+          'off': OFF}
+
+# how many messages can wait for the writer, and how many it writes at once
+QUEUE_SIZE = 10000
+BATCH_SIZE = 500
+# how long the writer waits for more messages before writing a partial batch
+FLUSH_INTERVAL = 0.5
+# how long flush() waits for the writer to catch up
+FLUSH_TIMEOUT = 5.0
+# log files are rotated once they would grow past this many bytes, keeping
+# this many old files
+ROTATE_SIZE = 1000000
+ROTATE_COUNT = 5
+
+
+def _level(value):
+    """ Turns a level name or number into a level number. """
+    if isinstance(value, str):
+        return LEVELS[value.lower()]
+    return value
+
+
+class LogWriter(object):
+    """
+    Background writer that drains the message queue and appends the messages
+    to their log files in batches.
+    """
+    def __init__(self, log_dir=None, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE,
+                 rotate_size=None, rotate_count=None):
+        self.log_dir = log_dir
+        self.rotate_size = rotate_size
+        self.rotate_count = rotate_count
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.dropped = 0
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """ Starts the writer thread if it isn't running. """
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self._run, name='game_log_writer',
+                                           daemon=True)
+            self.thread.start()
+
+    def put(self, filename, message):
+        """ Queues a message for writing. Never blocks. """
+        if not self.thread:
+            self.start()
+        stamp = time.strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            self.queue.put_nowait((filename, f"{stamp} [..] {message}\n"))
+        except queue.Full:
+            self.dropped += 1
+
+    def _next_batch(self, timeout):
+        """ Waits for a message, then takes up to a batch of queued ones. """
+        batch = [self.queue.get(timeout=timeout)]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _rotate(self, path, incoming):
+        """
+        Moves the log file to path.1 (and any older ones up a number) if
+        appending incoming bytes would take it past the rotate size.
+        """
+        rotate_size = self.rotate_size
+        if rotate_size is None:
+            rotate_size = getattr(settings, 'GAME_LOG_ROTATE_SIZE', ROTATE_SIZE)
+        rotate_count = self.rotate_count
+        if rotate_count is None:
+            rotate_count = getattr(settings, 'GAME_LOG_ROTATE_COUNT', ROTATE_COUNT)
+        if not rotate_size:
+            return
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        if not size or size + incoming <= rotate_size:
+            return
+        if rotate_count < 1:
+            os.remove(path)
+            return
+        for number in range(rotate_count - 1, 0, -1):
+            if os.path.exists(f"{path}.{number}"):
+                os.replace(f"{path}.{number}", f"{path}.{number + 1}")
+        os.replace(path, f"{path}.1")
+
+    def _write(self, batch):
+        """ Appends a batch of messages, one write per log file. """
+        lines = {}
+        for filename, line in batch:
+            lines.setdefault(filename, []).append(line)
+        log_dir = self.log_dir or settings.LOG_DIR
+        for filename, file_lines in lines.items():
+            path = os.path.join(log_dir, filename)
+            text = "".join(file_lines)
+            try:
+                self._rotate(path, len(text.encode('utf-8')))
+                with open(path, 'a', encoding='utf-8') as log:
+                    log.write(text)
+            except OSError:
+                self.dropped += len(file_lines)
+
+    def _write_batch(self, batch):
+        """
+        Writes a batch, then wakes up any flush() calls waiting on it (their
+        events are queued with a filename of None).
+        """
+        self._write([(filename, line) for filename, line in batch if filename is not None])
+        for filename, event in batch:
+            if filename is None:
+                event.set()
+        for _ in batch:
+            self.queue.task_done()
+
+    def _run(self):
+        while True:
+            try:
+                batch = self._next_batch(FLUSH_INTERVAL)
+            except queue.Empty:
+                continue
+            self._write_batch(batch)
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        """
+        Waits (up to timeout seconds) until everything queued so far has been
+        written. Called when the server stops so no messages are lost. Returns
+        False if the writer didn't catch up in time.
+        """
+        if not (self.thread and self.thread.is_alive()):
+            # no writer to wait for, so write what's queued here
+            batch = []
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+            return True
+        done = threading.Event()
+        try:
+            self.queue.put((None, done), timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+
+class LogChannel(object):
+    """
+    A single log file with its own level.
+    Args:
+        filename (str): name of the log file in the server log directory
+        writer (LogWriter): the writer the channel's messages are queued on
+    """
+    def __init__(self, filename, writer):
+        self.filename = filename
+        self.writer = writer
+        levels = getattr(settings, 'GAME_LOG_LEVELS', {})
+        self.level = _level(levels.get(
+            filename, getattr(settings, 'GAME_LOG_DEFAULT_LEVEL', 'info')))
+
+    def is_enabled(self, level):
+        """ Returns True if messages at the level will be written. """
+        return level >= self.level
+
+    def log(self, level, message, *args):
+        """
+        Queues the message if the channel is enabled for the level. Any args
+        are only formatted into the message (with str.format) if it is.
+        """
+        if level < self.level:
+            return
+        if args:
+            message = message.format(*args)
+        self.writer.put(self.filename, message)
+
+    def debug(self, message, *args):
+        self.log(DEBUG, message, *args)
+
+    def info(self, message, *args):
+        self.log(INFO, message, *args)
+
+    def warning(self, message, *args):
+        self.log(WARNING, message, *args)
+
+    def error(self, message, *args):
+        self.log(ERROR, message, *args)
+
+
+WRITER = LogWriter()
+_CHANNELS = {}
+
+
+def get_log(filename):
+    """ Returns the log channel for a log file, creating it if needed. """
+    channel = _CHANNELS.get(filename)
+    if channel is None:
+        channel = _CHANNELS[filename] = LogChannel(filename, WRITER)
+    return channel
+
+
+def set_level(filename, level):
+    """ Changes the level of a log channel while the server is running. """
+    get_log(filename).level = _level(level)
+
+
+def flush(timeout=FLUSH_TIMEOUT):
+    """ Waits until everything on the queue has been written. """
+    return WRITER.flush(timeout)
@@ -24,11 +24,17 @@ perceive in relation to where they are standing.
 """
 from evennia import create_object
 from evennia import DefaultObject
-from evennia.utils.logger import log_file
+from world.handlers.game_log import get_log
 from statistics import median
 from evennia import EvForm, EvTable
+from world.handlers.map_index import ROOM_INDEX, make_cell
+from world.handlers.map_grid import MapGrid
+from collections import OrderedDict
+from functools import lru_cache
 import random
 
+MAP_LOG = get_log('map_debug.log')
+
 # Base map info we're going to need to map a normal room
 BASE_MAP_GRID = """\
 █████████████████████
@@ -99,17 +105,17 @@ LARGE_COMBAT_MAP_GRID = """\
 █████████████████████
 """
 
+# the outer ring of the large combat map is wall, so it has no room cells
 MAPPABLE_LARGE_COMBAT_ROOM_COORDS = \
-[[10,10], [8,10], [6,10], [4,10], [2,10], [0,10], [12,10], [14,10], [16,10], [18,10], [20,10], \
-[10,8], [8,8], [6,8], [4,8], [2,8], [0,8], [12,8], [14,8], [16,8], [18,8], [20,8], \
-[10,6], [8,6], [6,6], [4,6], [2,6], [0,6], [12,6], [14,6], [16,6], [18,6], [20,6], \
-[10,4], [8,4], [6,4], [4,4], [2,4], [0,4], [12,4], [14,4], [16,4], [18,4], [20,4], \
-[10,2], [8,2], [6,2], [4,2], [2,2], [0,2], [12,2], [14,2], [16,2], [18,2], [20,2], \
-[10,12], [8,12], [6,12], [4,12], [2,12], [0,12], [12,12], [14,12], [16,12], [18,12], [20,12], \
-[10,14], [8,14], [6,14], [4,14], [2,14], [0,14], [12,14], [14,14], [16,14], [18,14], [20,14], \
-[10,16], [8,16], [6,16], [4,16], [2,16], [0,16], [12,16], [14,16], [16,16], [18,16], [20,16], \
-[10,18], [8,18], [6,18], [4,18], [2,18], [0,18], [12,18], [14,18], [16,18], [18,18], [20,18], \
-[10,20], [8,20], [6,20], [4,20], [2,20], [0,20], [12,20], [14,20], [16,20], [18,20], [20,20]]
+[[10,10], [8,10], [6,10], [4,10], [2,10], [12,10], [14,10], [16,10], [18,10], \
+[10,8], [8,8], [6,8], [4,8], [2,8], [12,8], [14,8], [16,8], [18,8], \
+[10,6], [8,6], [6,6], [4,6], [2,6], [12,6], [14,6], [16,6], [18,6],  \
+[10,4], [8,4], [6,4], [4,4], [2,4], [12,4], [14,4], [16,4], [18,4],  \
+[10,2], [8,2], [6,2], [4,2], [2,2], [12,2], [14,2], [16,2], [18,2],  \
+[10,12], [8,12], [6,12], [4,12], [2,12], [12,12], [14,12], [16,12], [18,12], \
+[10,14], [8,14], [6,14], [4,14], [2,14], [12,14], [14,14], [16,14], [18,14], \
+[10,16], [8,16], [6,16], [4,16], [2,16], [12,16], [14,16], [16,16], [18,16], \
+[10,18], [8,18], [6,18], [4,18], [2,18], [12,18], [14,18], [16,18], [18,18]]
 
 MEDIUM_COMBAT_MAP_GRID = """\
 █████████████████████
@@ -173,6 +179,84 @@ MAPPABLE_SMALL_COMBAT_ROOM_COORDS = \
 [10,8], [8,8], [12,8], \
 [10,12], [8,12], [12,12]]
 
+# constant time lookups for the tables above. Cells are (row, column) on the
+# map grid. Use these rather than checking membership in the lists.
+MAPPABLE_ROOM_CELLS = frozenset(tuple(coord) for coord in MAPPABLE_ROOM_COORDS)
+MAPPABLE_LARGE_COMBAT_ROOM_CELLS = \
+    frozenset(tuple(coord) for coord in MAPPABLE_LARGE_COMBAT_ROOM_COORDS)
+MAPPABLE_MEDIUM_COMBAT_ROOM_CELLS = \
+    frozenset(tuple(coord) for coord in MAPPABLE_MEDIUM_COMBAT_ROOM_COORDS)
+MAPPABLE_SMALL_COMBAT_ROOM_CELLS = \
+    frozenset(tuple(coord) for coord in MAPPABLE_SMALL_COMBAT_ROOM_COORDS)
+
+# where the glyph for each exit is drawn in relation to the room's cell on the
+# grid, as (row step, column step, glyph). Rooms are two characters apart, so
+# the exit sits on the character between them.
+EXIT_GLYPHS = {
+    'north': (-1, 0, '|'),
+    'south': (1, 0, '|'),
+    'east': (0, 1, '─'),
+    'west': (0, -1, '─'),
+    'northeast': (-1, 1, '/'),
+    'southwest': (1, -1, '/'),
+    'northwest': (-1, -1, '\\'),
+    'southeast': (1, 1, '\\'),
+}
+
+
+@lru_cache(maxsize=None)
+def exit_positions(mappable_cells, max_width, max_length):
+    """
+    Takes in a frozenset of mappable cells and the size of the map grid and
+    returns a table of cell -> {exit name: (row, column, glyph)} for every exit
+    glyph that fits on the grid. The table is built once per map mode.
+    """
+    table = {}
+    for row, col in mappable_cells:
+        positions = {}
+        for exit_name, (row_step, col_step, glyph) in EXIT_GLYPHS.items():
+            exit_row, exit_col = row + row_step, col + col_step
+            if 0 < exit_row < max_width and 0 < exit_col < max_length:
+                positions[exit_name] = (exit_row, exit_col, glyph)
+        table[(row, col)] = positions
+    return table
+
+
+class RenderedMapCache(object):
+    """
+    LRU cache of rendered base map grids. A base map is everything on the map
+    except the dynamic overlays (the '@' marker for the looker), so it only
+    depends on the center room, the map size, the elevation it is colored
+    against and the state of the room index for the zone. The zone version is
+    part of the key, so any change made to a room or exit through the room
+    index makes the old renders unreachable and they age out of the cache.
+    """
+    def __init__(self, max_size=2048):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        """ Returns the cached (grid, room ids) for the key, or None. """
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def set(self, key, grid, room_ids):
+        """ Stores a rendered base map, evicting the least recently used. """
+        self.entries[key] = (grid.copy(), tuple(room_ids))
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """ Empties the cache. """
+        self.entries.clear()
+
+
+# rendered base maps shared by every looker in this process
+MAP_CACHE = RenderedMapCache()
+
 
 class Map(object):
     """
@@ -184,13 +268,14 @@ class Map(object):
 
     """
     def __init__(self, caller, max_width=21, max_length=21):
-        log_file("Starting __init__ func", filename='map_debug.log')
+        MAP_LOG.debug("Starting __init__ func")
         self.caller = caller
         # check if the caller is in combat. If they are, we want to provide a combat map
         # if not, we'll display a regular overhead map
         self.in_combat_check()
         self.max_width = max_width
         self.max_length = max_length
+        self.exit_positions = exit_positions(self.map_cells, max_width, max_length)
         self.worm_has_mapped = {}
         self.worm_has_mapped_room_ids = []
         self.curX = None
@@ -198,9 +283,13 @@ class Map(object):
 
         # we actually have to store the grid into a variable
         self.grid = self.create_grid()
-        #
-        self.draw_room_on_map(caller.location,
-                             ((min(max_width, max_length) -1 ) / 2))
+        # outside of combat, read the surrounding rooms straight out of the
+        # room index. Fall back to worming through the exits if the caller's
+        # room isn't indexed or has no zone.
+        if self.in_combat or not self.draw_from_index():
+            self.draw_room_on_map(caller.location,
+                                 ((min(max_width, max_length) -1 ) / 2))
+            self.grid.resolve_elevations(caller.location.traits.elev.current)
         self.caller.ndb.nearby_rooms = self.worm_has_mapped_room_ids
         
         # for when we're in combat
@@ -258,6 +347,44 @@ class Map(object):
             self.draw_room_on_map(exit.destination, max_distance - 1)
 
 
+    def draw_from_index(self):
+        """
+        Draws the caller's location and every indexed room in the same zone
+        within the visible window around it, using the room index instead of
+        walking the exits. Returns False if the caller's location isn't in the
+        index or has no zone, in which case the worm should be used instead.
+        """
+        location = self.caller_location
+        center = ROOM_INDEX.get_cell(location.id)
+        if not center or center.zone is None:
+            # rooms without a zone (indoor rooms, entrances, fresh digs) don't
+            # share a grid, so only the rooms the exits lead to belong on the map
+            return False
+        cache_key = (location.id, self.max_width, self.max_length, center.elev,
+                     ROOM_INDEX.zone_version(center.zone))
+        cached = MAP_CACHE.get(cache_key)
+        if cached:
+            # reuse the rendered terrain, only the overlays are drawn fresh
+            grid, room_ids = cached
+            self.grid = grid.copy()
+            self.worm_has_mapped_room_ids = list(room_ids)
+            self.start_loc_on_grid()
+            return True
+        self.draw(location)
+        originX, originY = self.curX, self.curY
+        # rooms are drawn every other character on the grid
+        radius = int((min(self.max_width, self.max_length) - 1) / 4)
+        for cell, dx, dy in ROOM_INDEX.window(center.zone, center.x, center.y, radius):
+            if cell.room_id == location.id or (dx == 0 and dy == 0):
+                continue
+            # grid rows run north to south and columns run west to east
+            self.curX, self.curY = originX - 2 * dy, originY + 2 * dx
+            self.draw_cell(cell)
+        self.grid.resolve_elevations(center.elev)
+        MAP_CACHE.set(cache_key, self.grid, self.worm_has_mapped_room_ids)
+        return True
+
+
     def draw(self, room):
         # draw initial caller location on map first!
         if room == self.caller.location:
@@ -267,90 +394,42 @@ class Map(object):
         else:
             # map all other rooms
             self.worm_has_mapped[room] = [self.curX, self.curY]
-            # this will use the sector_type Attribute or None if not set.
-            if [self.curX, self.curY] in MAPPABLE_ROOM_COORDS:
-                for exit in room.exits:
-                    if exit.name == 'east':
-                        if [self.curX, self.curY] in MAPPABLE_ROOM_COORDS:
-                            self.draw_exit('horizontal', self.curX, self.curY + 1)
-                    elif exit.name == 'west':
-                        if [self.curX, self.curY] in MAPPABLE_ROOM_COORDS:
-                            self.draw_exit('horizontal', self.curX, self.curY - 1)
-                    elif exit.name == 'north':
-                        if [self.curX, self.curY] in MAPPABLE_ROOM_COORDS:
-                            self.draw_exit('vertical', self.curX - 1, self.curY)
-                    elif exit.name == 'south':
-                        if [self.curX, self.curY] in MAPPABLE_ROOM_COORDS:
-                            self.draw_exit('vertical', self.curX + 1, self.curY)
-                    elif exit.name == "northeast":
-                        if [self.curX, self.curY] in MAPPABLE_ROOM_COORDS:
-                            self.draw_exit('nesw', (self.curX - 1), (self.curY + 1))
-                    elif exit.name == "southwest":
-                        if [self.curX, self.curY] in MAPPABLE_ROOM_COORDS:
-                            self.draw_exit('nesw', (self.curX + 1), (self.curY - 1))
-                    elif exit.name == "northwest":
-                        if [self.curX, self.curY] in MAPPABLE_ROOM_COORDS:
-                            self.draw_exit('nwse', (self.curX - 1), (self.curY - 1))
-                    elif exit.name == "southeast":
-                        if [self.curX, self.curY] in MAPPABLE_ROOM_COORDS:
-                            self.draw_exit('nwse', (self.curX + 1), (self.curY + 1))
-
-                if room.db.map_symbol:
-                    log_file(f"Draw... Checking X: {self.curX}, Y: {self.curY}", filename='map_debug.log')
-                    self.worm_has_mapped_room_ids.append(room.id)
-
-                    if len(room.db.map_symbol) == 1:
-                        self.grid[self.curX][self.curY] = room.db.map_symbol
-                    else:
-                        self.grid[self.curX][self.curY] = room.db.map_symbol[self.get_elev_index(room)]
-                else:
-                    if not room.db.info['outdoor room']:
-                        # this is an indoor room. Check to see if we have exits up or down
-                        if 'up' in room.exits and 'down' in room.exits:
-                            self.grid[self.curX][self.curY] = '|w±|n'
-                        elif 'up' in room.exits:
-                            self.grid[self.curX][self.curY] = '|w+|n'
-                        elif 'down' in room.exits:
-                            self.grid[self.curX][self.curY] = '|w-|n'
-                        else:
-                            self.grid[self.curX][self.curY] = '|W:|n'
-                    self.grid[self.curX][self.curY] = SYMBOLS[room.db.sector_type]
-
-
-    def get_elev_index(self, room):
+            self.draw_cell(ROOM_INDEX.get_cell(room.id) or make_cell(room))
+
+
+    def draw_cell(self, cell):
         """
-        Returns an elevation index for the room in relation to the character's
-        current location. If the room is lower in elevation than the character's
-        current location, a map symbol lower in the index will be chosen. This
-        will have the effect of showing a color gradient on the map with
-        elevations relative to the observer.
+        Draws a room (as a MapCell snapshot from the room index) and its exits
+        at the worm's current position on the grid.
         """
-        elevation_diff = room.traits.elev.current -self.caller_location.traits.elev.current
-        if elevation_diff < -125:
-            return 0
-        elif -125 <= elevation_diff < -25:
-            return 1
-        elif -25 <= elevation_diff <= 25:
-            return 2
-        elif 25 <= elevation_diff < 125:
-            return 3
-        elif elevation_diff > 125:
-            return 4
-
-
-    def draw_exit(self, type, ExitX, ExitY):
-        if 0 < ExitX < self.max_width and 0 < ExitY < self.max_length:
-            # draw in the exits
-            if type == 'vertical':
-                self.grid[ExitX][ExitY] = '|'
-            elif type == 'horizontal':
-                self.grid[ExitX][ExitY] = '─'
-            elif type == 'nesw':
-                self.grid[ExitX][ExitY] = '/'
-            elif type == 'nwse':
-                self.grid[ExitX][ExitY] = '\\'
+        # this will use the sector_type Attribute or None if not set.
+        if (self.curX, self.curY) in self.mappable_cells:
+            positions = self.exit_positions[(self.curX, self.curY)]
+            for exit_name in cell.exits:
+                if exit_name in positions:
+                    self.grid.set(*positions[exit_name])
+
+            if cell.map_symbol:
+                MAP_LOG.debug("Draw... Checking X: {}, Y: {}", self.curX, self.curY)
+                self.worm_has_mapped_room_ids.append(cell.room_id)
+
+                if len(cell.map_symbol) == 1:
+                    self.grid.set(self.curX, self.curY, cell.map_symbol[0])
+                else:
+                    # colored by elevation once every room has been drawn
+                    self.grid.set_graded(self.curX, self.curY, cell.map_symbol, cell.elev)
             else:
-                log_file("Unknown exit type", filename='map_debug.log')
+                if not cell.outdoor:
+                    # this is an indoor room. Check to see if we have exits up or down
+                    if 'up' in cell.exits and 'down' in cell.exits:
+                        self.grid.set(self.curX, self.curY, '|w±|n')
+                    elif 'up' in cell.exits:
+                        self.grid.set(self.curX, self.curY, '|w+|n')
+                    elif 'down' in cell.exits:
+                        self.grid.set(self.curX, self.curY, '|w-|n')
+                    else:
+                        self.grid.set(self.curX, self.curY, '|W:|n')
+                self.grid.set(self.curX, self.curY, SYMBOLS[cell.sector_type])
 
 
     def median(self, num):
@@ -365,9 +444,9 @@ class Map(object):
         x, y = int(x), int(y)
 
         if self.caller_location.db.info['outdoor room']:
-            self.grid[x][y] = SYMBOLS['CHAR_OUTDOOR']
+            self.grid.set(x, y, SYMBOLS['CHAR_OUTDOOR'])
         else:
-            self.grid[x][y] = SYMBOLS['CHAR_INDOOR']
+            self.grid.set(x, y, SYMBOLS['CHAR_INDOOR'])
         self.curX, self.curY = x, y # updating worms current location
 
 
@@ -376,25 +455,13 @@ class Map(object):
 
 
     def create_grid(self):
-        # pull in base map grid and split it so the individual positions
-        # can be called by index number
-        board = self.map_grid.split('\n')
-        index = 0
-        for line in board:
-        	line = list(line)
-        	board[index] = line
-        	index += 1
-
-        return board
+        # pull in base map grid as a grid of symbol ids so the individual
+        # positions can be drawn on by row and column
+        return MapGrid(self.map_grid)
 
 
     def show_map(self):
-        map_string = ""
-        for row in self.grid:
-            map_string += " ".join(row)
-            map_string += "\n"
-
-        return map_string
+        return self.grid.render()
     
     
     def in_combat_check(self):
@@ -407,18 +474,22 @@ class Map(object):
         # want to use a combat map instead of the base map grid
         if self.caller.ndb.combat_handler and self.caller.db.info['in combat']:
             # both of these should be true if the caller is in combat
+            self.in_combat = True
             # determine room size
             if self.caller.location.traits.size.current >= 2500:
                 # room is large or larger 50m squared plus
                 self.map_grid = LARGE_COMBAT_MAP_GRID
+                self.map_cells = MAPPABLE_LARGE_COMBAT_ROOM_CELLS
                 self.mappable_coords = MAPPABLE_LARGE_COMBAT_ROOM_COORDS
             elif self.caller.location.traits.size.current >= 225:
                 # room is medium or larger 15m squared plus
                 self.map_grid = MEDIUM_COMBAT_MAP_GRID
+                self.map_cells = MAPPABLE_MEDIUM_COMBAT_ROOM_CELLS
                 self.mappable_coords = MAPPABLE_MEDIUM_COMBAT_ROOM_COORDS
             else:
                 # room is small or of an undefined size
                 self.map_grid = SMALL_COMBAT_MAP_GRID
+                self.map_cells = MAPPABLE_SMALL_COMBAT_ROOM_CELLS
                 self.mappable_coords = MAPPABLE_SMALL_COMBAT_ROOM_COORDS
             # since the caller is in combat, we don't want to use room locations
             # we're going to want to give room sub-sections instead
@@ -429,7 +500,8 @@ class Map(object):
             # than a plains room, for example). For now, we'll make 95% of them
             # usable subsections
             self.mappable_coords = random.sample(self.mappable_coords, int(len(self.mappable_coords) * .95))
-            log_file(f"Mappable coords for combat room that are accessible: {self.mappable_coords}", filename="map_debug.log")
+            self.mappable_cells = frozenset(tuple(coord) for coord in self.mappable_coords)
+            MAP_LOG.debug("Mappable coords for combat room that are accessible: {}", self.mappable_coords)
             # now that we have a the mappable coordinates, we'll go through and assign sub-sections to the grid
             # and "exits" between the accessible sections
             self.start_loc_on_grid = random.choice(self.mappable_coords)
@@ -439,82 +511,10 @@ class Map(object):
         
         else:
             # caller is not in combat. They should be getting a normal basemap grid
+            self.in_combat = False
             self.map_grid = BASE_MAP_GRID
+            self.map_cells = MAPPABLE_ROOM_CELLS
+            self.mappable_cells = MAPPABLE_ROOM_CELLS
             self.mappable_coords = MAPPABLE_ROOM_COORDS
             self.caller_location = self.caller.location
-        
-        
-            
-# code I played around with to get the exits in the room below
-MAPPABLE_LARGE_COMBAT_ROOM_COORDS = \
-[[10,10], [8,10], [6,10], [4,10], [2,10], [12,10], [14,10], [16,10], [18,10], \
-[10,8], [8,8], [6,8], [4,8], [2,8], [12,8], [14,8], [16,8], [18,8], \
-[10,6], [8,6], [6,6], [4,6], [2,6], [12,6], [14,6], [16,6], [18,6],  \
-[10,4], [8,4], [6,4], [4,4], [2,4], [12,4], [14,4], [16,4], [18,4],  \
-[10,2], [8,2], [6,2], [4,2], [2,2], [12,2], [14,2], [16,2], [18,2],  \
-[10,12], [8,12], [6,12], [4,12], [2,12], [12,12], [14,12], [16,12], [18,12], \
-[10,14], [8,14], [6,14], [4,14], [2,14], [12,14], [14,14], [16,14], [18,14], \
-[10,16], [8,16], [6,16], [4,16], [2,16], [12,16], [14,16], [16,16], [18,16], \
-[10,18], [8,18], [6,18], [4,18], [2,18], [12,18], [14,18], [16,18], [18,18]]
-
-LARGE_COMBAT_MAP_GRID = """\
-█████████████████████
-█···················█
-█···················█
-█···················█
-█···················█
-█···················█
-█···················█
-█···················█
-█···················█
-█···················█
-█·········@·········█
-█···················█
-█···················█
-█···················█
-█···················█
-█···················█
-█···················█
-█···················█
-█···················█
-█···················█
-█████████████████████
-"""
-
-sampled_mappable = random.sample(MAPPABLE_LARGE_COMBAT_ROOM_COORDS, int(len(MAPPABLE_LARGE_COMBAT_ROOM_COORDS)*.85))
-
-print(sampled_mappable)
-exit_coords = {}
-
-for coord in sampled_mappable:
-    if [coord[0], coord[1] - 2] in sampled_mappable:
-        exit_coords[coord[0], coord[1] - 1] = '|'
-    if [coord[0], coord[1] + 2] in sampled_mappable:
-        exit_coords[coord[0], coord[1] + 1] = '|'
-    if [coord[0] + 2, coord[1]] in sampled_mappable:
-        exit_coords[coord[0] + 1, coord[1]] = '─'
-    if [coord[0] - 2, coord[1]] in sampled_mappable:
-        exit_coords[coord[0] - 1, coord[1]] = '─'
-        
-print(exit_coords)
 
-board = LARGE_COMBAT_MAP_GRID.split('\n')
-print(board)
-
-
-new_board = []
-for index, row in enumerate(board):
-    row = list(row)
-    for coord in sampled_mappable:
-        if index == coord[1] and coord != [10,10]:
-            row[coord[0]] = 'X'
-    for coord, map_icon in exit_coords.items():
-        if index == coord[1]:
-            row[coord[0]] = map_icon
-
-    row = "".join(row)
-    #print(index, row)
-    new_board.append(row)
-
-            
-print(new_board)         
\ No newline at end of file
@@ -0,0 +1,139 @@
+# coding=utf-8
+"""
+Map Grid
+This file contains the grid engine the overhead map draws onto. Rather than
+splitting the map template into nested lists of characters, the grid is held as
+preallocated NumPy arrays:
+- A symbol layer of integer ids into a palette of map glyphs.
+- An elevation layer holding the elevation of every room drawn with an
+  elevation graded symbol set (NaN everywhere else), plus the id of that
+  symbol set.
+Graded rooms are colored for all visible rooms in one vectorized pass once the
+viewer's elevation is known, and the whole map is rendered to its color tagged
+string with a single join. This keeps the Python work per render bounded by the
+number of rows rather than the number of cells, so the map radius can grow past
+21x21.
+"""
+import numpy as np
+
+# elevation differences (room elevation - viewer's elevation) that separate the
+# five colors of a graded map symbol set, from much lower to much higher
+ELEVATION_BANDS = (-125, -25, 25, 125)
+ELEVATION_GRADES = len(ELEVATION_BANDS) + 1
+
+
+def elevation_grades(elevation_diffs):
+    """
+    Takes in an array of elevation differences and returns the index of the
+    map symbol to use for each of them (0 is much lower, 4 is much higher).
+    """
+    diffs = np.asarray(elevation_diffs, dtype=float)
+    return np.select([diffs < ELEVATION_BANDS[0],
+                      diffs < ELEVATION_BANDS[1],
+                      diffs <= ELEVATION_BANDS[2],
+                      diffs < ELEVATION_BANDS[3]],
+                     [0, 1, 2, 3], default=4)
+
+
+class MapGrid(object):
+    """
+    A map grid built from an ASCII template (one row of the map per line).
+    Args:
+        template (str): the base map, e.g. BASE_MAP_GRID in map.py
+    """
+    def __init__(self, template=None):
+        self.palette = []
+        self.palette_ids = {}
+        self.symbol_sets = []
+        self.symbol_set_ids = {}
+        if template is None:
+            return
+        rows = template.rstrip('\n').split('\n')
+        self.height = len(rows)
+        self.width = max(len(row) for row in rows)
+        self.symbols = np.full((self.height, self.width), self.symbol_id(' '),
+                               dtype=np.int32)
+        for row_index, row in enumerate(rows):
+            self.symbols[row_index, :len(row)] = [self.symbol_id(char) for char in row]
+        self.elevation = np.full((self.height, self.width), np.nan)
+        self.symbol_set = np.full((self.height, self.width), -1, dtype=np.int32)
+
+    def symbol_id(self, symbol):
+        """ Returns the palette id of a map glyph, adding it if needed. """
+        symbol_id = self.palette_ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = self.palette_ids[symbol] = len(self.palette)
+            self.palette.append(symbol)
+        return symbol_id
+
+    def symbol_set_id(self, symbols):
+        """
+        Returns the id of an elevation graded set of map symbols, adding it if
+        needed. Sets with fewer symbols than there are elevation grades repeat
+        their last symbol.
+        """
+        symbols = tuple(symbols)
+        set_id = self.symbol_set_ids.get(symbols)
+        if set_id is None:
+            padded = symbols + (symbols[-1],) * (ELEVATION_GRADES - len(symbols))
+            set_id = self.symbol_set_ids[symbols] = len(self.symbol_sets)
+            self.symbol_sets.append([self.symbol_id(symbol)
+                                     for symbol in padded[:ELEVATION_GRADES]])
+        return set_id
+
+    def in_bounds(self, row, col):
+        """ Returns True if the row & column are on the grid. """
+        return 0 <= row < self.height and 0 <= col < self.width
+
+    def get(self, row, col):
+        """ Returns the map glyph at the row & column. """
+        return self.palette[self.symbols[row, col]]
+
+    def set(self, row, col, symbol):
+        """ Draws a single map glyph at the row & column. """
+        self.symbols[row, col] = self.symbol_id(symbol)
+        self.symbol_set[row, col] = -1
+        self.elevation[row, col] = np.nan
+
+    def set_graded(self, row, col, symbols, elevation):
+        """
+        Marks the row & column to be drawn with one of an elevation graded set
+        of symbols. The symbol is picked by resolve_elevations().
+        """
+        self.symbol_set[row, col] = self.symbol_set_id(symbols)
+        self.elevation[row, col] = elevation
+
+    def resolve_elevations(self, reference_elevation):
+        """
+        Picks the symbol for every graded cell on the grid based upon its
+        elevation relative to the reference elevation, in one pass.
+        """
+        graded = self.symbol_set >= 0
+        if not graded.any():
+            return
+        grades = elevation_grades(self.elevation[graded] - reference_elevation)
+        set_table = np.array(self.symbol_sets, dtype=np.int32)
+        self.symbols[graded] = set_table[self.symbol_set[graded], grades]
+        self.symbol_set[graded] = -1
+        self.elevation[graded] = np.nan
+
+    def copy(self):
+        """ Returns an independent copy of the grid. """
+        grid = MapGrid()
+        grid.palette = list(self.palette)
+        grid.palette_ids = dict(self.palette_ids)
+        grid.symbol_sets = [list(symbol_set) for symbol_set in self.symbol_sets]
+        grid.symbol_set_ids = dict(self.symbol_set_ids)
+        grid.height, grid.width = self.height, self.width
+        grid.symbols = self.symbols.copy()
+        grid.elevation = self.elevation.copy()
+        grid.symbol_set = self.symbol_set.copy()
+        return grid
+
+    def render(self):
+        """
+        Returns the grid as a string, with the map glyphs on each row separated
+        by spaces.
+        """
+        glyphs = np.array(self.palette, dtype=object)[self.symbols]
+        return "\n".join([" ".join(row) for row in glyphs.tolist()]) + "\n\n"
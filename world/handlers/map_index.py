@@ -0,0 +1,283 @@
+# coding=utf-8
+"""
+Map Index
+This file contains a process-wide, in-memory index of every mappable room keyed
+by zone and the X/Y coordinate traits the CoordinateWorm (and dig) write onto
+rooms. The overhead map uses it to read the window of rooms around the looker
+directly, rather than crawling room.exits and loading each destination room's
+attributes and traits on every look.
+Each indexed room is stored as a small MapCell snapshot holding just the data
+the overhead map needs. The snapshot must be refreshed whenever one of those
+values changes; call ROOM_INDEX.update_room(room) after editing coordinates,
+elevation, map symbols, zone or the outdoor flag. Exits keep their room's cell
+up to date by themselves (see typeclasses/exits.py).
+The index is built lazily from the database the first time it is queried after
+a server start/reload.
+Every change to the index bumps a version number for the zone(s) involved, so
+anything derived from the index (like the rendered map cache in map.py) can
+tell when it has gone stale.
+"""
+from collections import namedtuple
+from world.handlers.game_log import get_log
+
+MAP_LOG = get_log('map_debug.log')
+
+# the directions the overhead map and the coordinate worm understand, with the
+# coordinate offset (dx, dy) each one represents. North is +Y, East is +X.
+CARDINAL_OFFSETS = {
+    'north': (0, 1),
+    'northeast': (1, 1),
+    'east': (1, 0),
+    'southeast': (1, -1),
+    'south': (0, -1),
+    'southwest': (-1, -1),
+    'west': (-1, 0),
+    'northwest': (-1, 1),
+}
+# (dx, dy) -> direction
+OFFSET_DIRECTIONS = {offset: direction for direction, offset in CARDINAL_OFFSETS.items()}
+# direction -> the direction leading back
+OPPOSITE_DIRECTIONS = {direction: next(other for other, back in CARDINAL_OFFSETS.items()
+                                       if back == (-offset[0], -offset[1]))
+                       for direction, offset in CARDINAL_OFFSETS.items()}
+# the alias exits in each direction are given, and alias -> direction
+DIRECTION_ALIASES = {
+    'north': 'n', 'northeast': 'ne', 'east': 'e', 'southeast': 'se',
+    'south': 's', 'southwest': 'sw', 'west': 'w', 'northwest': 'nw',
+}
+DIRECTION_NAMES = {alias: direction for direction, alias in DIRECTION_ALIASES.items()}
+
+# combat subsections are temporary and live on their own battlefield grids, so
+# we never put them into the index
+_UNINDEXED_TYPECLASSES = ('typeclasses.rooms.CombatRoomsection',)
+
+MapCell = namedtuple('MapCell', ['room_id', 'zone', 'x', 'y', 'elev',
+                                 'outdoor', 'map_symbol', 'sector_type',
+                                 'exits'])
+
+
+def zone_key(zone):
+    """
+    Returns a hashable version of a room's zone. Most zones are strings (or
+    None), but a few room types store the zone as a list.
+    """
+    if isinstance(zone, (list, tuple)):
+        return tuple(zone)
+    return zone
+
+
+def make_cell(room):
+    """
+    Takes in a room and returns a MapCell snapshot of the values the overhead
+    map needs to draw it.
+    """
+    info = room.db.info or {}
+    map_symbol = room.db.map_symbol
+    if isinstance(map_symbol, list):
+        # detach the symbols from the database so the cell is immutable
+        map_symbol = tuple(map_symbol)
+    return MapCell(room_id=room.id,
+                   zone=zone_key(info.get('zone')),
+                   x=int(room.traits.xcord.current),
+                   y=int(room.traits.ycord.current),
+                   elev=room.traits.elev.current,
+                   outdoor=info.get('outdoor room', True),
+                   map_symbol=map_symbol,
+                   sector_type=room.db.sector_type,
+                   exits=tuple(exit.key for exit in room.exits))
+
+
+class RoomIndex(object):
+    """
+    Index of (zone, x, y) -> room ids, plus room id -> MapCell.
+    More than one room can sit on the same coordinates (freshly dug rooms are
+    at 0,0 until their coordinates are set), so every coordinate holds a set of
+    room ids. Lookups that want a single room use the lowest id.
+    """
+    def __init__(self):
+        self.coords = {}
+        self.cells = {}
+        self.zone_versions = {}
+        self.builds = 0
+        self.is_built = False
+
+    def build(self):
+        """
+        (Re)builds the whole index from the rooms in the database.
+        """
+        from evennia.objects.models import ObjectDB
+        MAP_LOG.info("Building room map index")
+        self.coords = {}
+        self.cells = {}
+        rooms = ObjectDB.objects.filter(
+            db_typeclass_path__startswith='typeclasses.rooms.').exclude(
+            db_typeclass_path__in=_UNINDEXED_TYPECLASSES)
+        for room in rooms:
+            self._add(make_cell(room))
+        self.zone_versions = {}
+        self.builds += 1
+        self.is_built = True
+        MAP_LOG.info("Room map index built with {} rooms.", len(self.cells))
+
+    def ensure_built(self):
+        """ Builds the index if it hasn't been built in this process yet. """
+        if not self.is_built:
+            self.build()
+
+    def clear(self):
+        """ Empties the index. It will be rebuilt on the next lookup. """
+        self.coords = {}
+        self.cells = {}
+        self.zone_versions = {}
+        self.builds += 1
+        self.is_built = False
+
+    def zone_version(self, zone):
+        """
+        Returns a value that changes every time a room in the zone is added,
+        removed or edited.
+        """
+        return (self.builds, self.zone_versions.get(zone_key(zone), 0))
+
+    def _touch(self, zone):
+        self.zone_versions[zone] = self.zone_versions.get(zone, 0) + 1
+
+    def _add(self, cell):
+        self._touch(cell.zone)
+        self.cells[cell.room_id] = cell
+        self.coords.setdefault((cell.zone, cell.x, cell.y), set()).add(cell.room_id)
+
+    def _discard(self, room_id):
+        cell = self.cells.pop(room_id, None)
+        if cell:
+            self._touch(cell.zone)
+            coord = (cell.zone, cell.x, cell.y)
+            ids = self.coords.get(coord)
+            if ids:
+                ids.discard(room_id)
+                if not ids:
+                    del self.coords[coord]
+        return cell
+
+    def update_room(self, room):
+        """
+        Adds the room to the index or refreshes its snapshot. Call this any
+        time a value stored on the room's MapCell is changed.
+        """
+        if not self.is_built or not room or not room.id:
+            # the full build will pick the room up
+            return
+        if room.typeclass_path in _UNINDEXED_TYPECLASSES:
+            return
+        self._discard(room.id)
+        self._add(make_cell(room))
+
+    def remove_room(self, room):
+        """ Removes a room from the index. """
+        if room and room.id:
+            self._discard(room.id)
+
+    def move_room(self, room_id, zone, x, y, outdoor=None):
+        """
+        Moves a room's snapshot to new coordinates (and zone) without
+        loading the room, for code that writes the values straight to the
+        database, like the coordinate worm.
+        """
+        cell = self.cells.get(room_id)
+        if cell:
+            self._discard(room_id)
+            if outdoor is None:
+                outdoor = cell.outdoor
+            self._add(cell._replace(zone=zone_key(zone), x=x, y=y, outdoor=outdoor))
+
+    def add_cells(self, cells):
+        """
+        Adds (or replaces) the snapshots of rooms created straight in the
+        database without loading them, like the rooms of a room grid.
+        """
+        if not self.is_built:
+            # the full build will pick the rooms up
+            return
+        for cell in cells:
+            self._discard(cell.room_id)
+            self._add(cell)
+
+    def set_exits(self, room_id, exits):
+        """
+        Replaces the exit names stored for a room without reloading the rest
+        of its snapshot.
+        """
+        cell = self.cells.get(room_id)
+        if cell:
+            self._touch(cell.zone)
+            self.cells[room_id] = cell._replace(exits=tuple(exits))
+
+    def get_cell(self, room_id):
+        """ Returns the MapCell for a room id, or None. """
+        self.ensure_built()
+        return self.cells.get(room_id)
+
+    def room_ids_at(self, zone, x, y):
+        """ Returns the set of room ids at the given zone & coordinates. """
+        self.ensure_built()
+        return self.coords.get((zone_key(zone), x, y), set())
+
+    def cell_at(self, zone, x, y):
+        """ Returns the MapCell at the coordinates (lowest id wins), or None. """
+        ids = self.room_ids_at(zone, x, y)
+        if ids:
+            return self.cells[min(ids)]
+        return None
+
+    def neighbors(self, zone, x, y):
+        """
+        Returns a list of (room id, direction) for every room on the eight
+        coordinates around x, y in the zone, ordered by direction.
+        """
+        self.ensure_built()
+        zone = zone_key(zone)
+        coords = self.coords
+        found = []
+        for direction, (dx, dy) in CARDINAL_OFFSETS.items():
+            ids = coords.get((zone, x + dx, y + dy))
+            if ids:
+                found.extend((room_id, direction) for room_id in sorted(ids))
+        return found
+
+    def room_ids_in_zone(self, zone, outdoor=None):
+        """
+        Returns the ids of every indexed room in the zone. If outdoor is True
+        or False, only outdoor or indoor rooms are returned.
+        """
+        self.ensure_built()
+        zone = zone_key(zone)
+        return [room_id for room_id, cell in self.cells.items()
+                if cell.zone == zone and (outdoor is None or cell.outdoor == outdoor)]
+
+    def zones(self, outdoor=None):
+        """
+        Returns the set of zones in the index. If outdoor is True or False,
+        only zones with outdoor or indoor rooms are returned.
+        """
+        self.ensure_built()
+        return {cell.zone for cell in self.cells.values()
+                if outdoor is None or cell.outdoor == outdoor}
+
+    def window(self, zone, x, y, radius):
+        """
+        Yields (cell, dx, dy) for every indexed room within a square of
+        `radius` rooms around x, y in the zone.
+        """
+        self.ensure_built()
+        zone = zone_key(zone)
+        coords = self.coords
+        cells = self.cells
+        for dy in range(radius, -radius - 1, -1):
+            for dx in range(-radius, radius + 1):
+                ids = coords.get((zone, x + dx, y + dy))
+                if ids:
+                    yield cells[min(ids)], dx, dy
+
+
+# the index shared by everything in this process
+ROOM_INDEX = RoomIndex()
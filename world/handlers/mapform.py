@@ -47,3 +47,7 @@ FORM = """
                                                   |                                                 
 -----------------------------------------------------------------------------------------------------------
 """
+
+# the parsed form template. Room.return_appearance builds every room map from
+# this dict instead of reloading the form from this file on every look
+MAPFORM = {'FORMCHAR': FORMCHAR, 'TABLECHAR': TABLECHAR, 'FORM': FORM}
@@ -13,8 +13,31 @@
     
 import numpy as np
 import random
-from evennia.utils.logger import log_file
-    
+from world.handlers.game_log import get_log
+
+DICE_LOG = get_log('dice.log')
+
+# one generator is shared by everything in this process. Creating a new
+# generator seeds it from the OS, which is far too slow to do for every roll.
+_RNG = np.random.default_rng()
+
+
+def seed(value=None):
+    """
+    Reseeds the shared generator. Passing the same value makes every roll after
+    it repeat exactly, which is handy for replaying combat in tests. Passing
+    None reseeds from the OS.
+    """
+    global _RNG
+    _RNG = np.random.default_rng(value)
+    DICE_LOG.info("Random number generator reseeded with: {}", value)
+
+
+def get_rng():
+    """ Returns the shared NumPy generator for anything needing its own draws. """
+    return _RNG
+
+
 # simplest distribution curve based check
 def distro_return_a_roll_sans_crit(number):
     """
@@ -27,7 +50,31 @@ def distro_return_a_roll_sans_crit(number):
     200 or 300.
     Ability scores and item durability are a good use for this function.
     """
-    roll = int(np.random.default_rng().normal(loc=number, scale=number/10))
-    log_file("Distribution roller. Input: {number} Output: {roll}")
+    roll = int(_RNG.normal(loc=number, scale=number/10))
+    DICE_LOG.debug("Distribution roller. Input: {} Output: {}", number, roll)
     return roll
-        
\ No newline at end of file
+
+
+def distro_return_rolls_sans_crit(numbers):
+    """
+    Batched version of distro_return_a_roll_sans_crit. Takes in a list (or
+    array) of numbers and returns a list of rolls, one per number, drawn in a
+    single call. Use this when rolling several things at once, like a new
+    character's ability scores or every attack in a combat round.
+    """
+    means = np.asarray(numbers, dtype=float)
+    rolls = _RNG.normal(loc=means, scale=means/10).astype(int).tolist()
+    DICE_LOG.debug("Distribution roller. Inputs: {} Outputs: {}", numbers, rolls)
+    return rolls
+
+
+def dice_rolls(sides, count=1, size=None):
+    """
+    Rolls `count` dice with `sides` sides and returns their total. If size is
+    given, returns a list of that many totals instead, drawn in a single call.
+    """
+    totals = _RNG.integers(1, sides + 1, size=(size or 1, count)).sum(axis=1)
+    DICE_LOG.debug("Dice roller. {}d{} x {}: {}", count, sides, size or 1, totals)
+    if size is None:
+        return int(totals[0])
+    return totals.tolist()
@@ -0,0 +1,313 @@
+# coding=utf-8
+"""
+Room Grid
+This file contains the bulk builder for laying out a whole block of outdoor
+rooms at once: a rectangle (or any shape, from a mask) of rooms with their
+coordinates, zone, map symbol and biome ratios set, joined to each other by
+exits both ways in every direction.
+Digging each room makes Room.at_object_creation save every trait, Attribute
+and exit one query at a time. Instead, the first room of the grid is created
+the normal way and used as the template for the rest: its Attributes, tags
+and locks are copied onto every other room with bulk inserts, one
+transaction per chunk of rooms. The exits are made the same way from the
+first exit.
+    grid = RoomGrid.rectangle(10, -5, 100, 100, zone='Northern Forest',
+                              name='A Dark Forest', biome_ratios={'forest': 1})
+    grid.run()
+    grid = RoomGrid.from_mask(["XXX.", ".XXX"], 10, -5, zone='Northern Forest')
+The passes are generators that yield (stage, done) after every chunk, for
+running as a builder job (see builder_jobs.py). They create objects, so the
+job has to run on the reactor (threaded=False). finish() adds the new rooms
+to the room index once the job stops.
+"""
+from world.handlers.biomes import BIOME_CATALOG
+from world.handlers.map_index import (CARDINAL_OFFSETS, DIRECTION_ALIASES, ROOM_INDEX,
+                                      make_cell, zone_key)
+from world.handlers.db_utils import chunks
+from world.handlers.game_log import get_log
+
+BUILD_LOG = get_log('room_build_debug.log')
+
+ROOM_TYPECLASS = 'typeclasses.rooms.Room'
+EXIT_TYPECLASS = 'typeclasses.exits.Exit'
+# rooms (or exits) created per transaction
+GRID_CHUNK_SIZE = 500
+# the biggest grid that can be built in one go
+MAX_GRID_ROOMS = 40000
+# the directions rooms are joined in without diagonals
+STRAIGHT_DIRECTIONS = ('north', 'east', 'south', 'west')
+# mask characters that mark a room, anything else is left empty
+MASK_ROOM_SYMBOLS = ('X', 'x', '#')
+
+_ATTRIBUTE_FIELDS = ('db_key', 'db_category', 'db_value', 'db_strvalue',
+                     'db_lock_storage', 'db_model', 'db_attrtype')
+
+
+def _bulk_create(model, objs, **match):
+    """
+    bulk_create() that makes sure the objects come back with their ids.
+    Backends that can't return them from a bulk insert (MySQL/MariaDB) have
+    the new rows looked up by id afterwards: everything past the last id
+    before the insert matching `match`, in insert order. Must be called in a
+    transaction.
+    """
+    from django.db import connections, router
+    from django.db.models import Max
+    database = router.db_for_write(model)
+    if connections[database].features.can_return_rows_from_bulk_insert:
+        return model.objects.bulk_create(objs)
+    last_id = model.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+    model.objects.bulk_create(objs)
+    ids = list(model.objects.filter(id__gt=last_id, **match).order_by('id').values_list(
+        'id', flat=True))
+    if len(ids) != len(objs):
+        raise RuntimeError(f"Expected {len(objs)} new {model.__name__} rows, found {len(ids)}.")
+    for obj, new_id in zip(objs, ids):
+        obj.id = new_id
+    return objs
+
+
+def parse_mask(mask):
+    """
+    Returns the (column, row) of every room in a mask, a list of strings
+    with one row per string, the top row being the north edge.
+    """
+    return [(column, row) for row, line in enumerate(mask)
+            for column, char in enumerate(line) if char in MASK_ROOM_SYMBOLS]
+
+
+class RoomGrid(object):
+    """
+    A block of outdoor rooms to create.
+    Args:
+        coords (list): the (x, y) of every room, the first being the template
+        zone (str): the zone of the rooms
+        name (str): what to call every room
+        biome_ratios (dict): biome key -> ratio, None for the default biomes
+        map_symbol (list): the rooms' map symbol, None for the default
+        diagonals (bool): join the rooms diagonally as well as straight
+        lockstring (str): extra locks for the rooms and exits
+        chunk_size (int): how many rooms (or exits) to create per transaction
+    """
+    def __init__(self, coords, zone, name='The Wilderness', biome_ratios=None,
+                 map_symbol=None, diagonals=True, lockstring=None,
+                 chunk_size=GRID_CHUNK_SIZE):
+        if not coords:
+            raise ValueError("A room grid needs at least one room.")
+        if len(coords) > MAX_GRID_ROOMS:
+            raise ValueError(f"A room grid can't have more than {MAX_GRID_ROOMS} rooms.")
+        unknown = set(biome_ratios or {}) - set(BIOME_CATALOG)
+        if unknown:
+            raise ValueError("Unknown biomes: " + ", ".join(sorted(unknown)))
+        self.coords = list(dict.fromkeys(coords))
+        self.zone = zone
+        self.name = name
+        self.biome_ratios = biome_ratios
+        self.map_symbol = map_symbol
+        self.directions = tuple(CARDINAL_OFFSETS) if diagonals else STRAIGHT_DIRECTIONS
+        self.lockstring = lockstring
+        self.chunk_size = chunk_size
+        # (x, y) -> id of the room created there
+        self.room_ids = {}
+        # room id -> the directions of the exits created in it
+        self.exit_keys = {}
+        self.template = None
+        self.exits_created = 0
+
+    @classmethod
+    def rectangle(cls, x, y, width, height, **kwargs):
+        """ A width by height grid with its north west corner at x, y. """
+        return cls([(x + column, y - row) for row in range(height) for column in range(width)],
+                   **kwargs)
+
+    @classmethod
+    def from_mask(cls, mask, x, y, **kwargs):
+        """ A grid shaped like a mask (see parse_mask), its top left corner at x, y. """
+        return cls([(x + column, y - row) for column, row in parse_mask(mask)], **kwargs)
+
+    def __len__(self):
+        return len(self.coords)
+
+    def collisions(self):
+        """ Returns the coordinates in the grid that already have a room in the zone. """
+        return [(x, y) for x, y in self.coords if ROOM_INDEX.room_ids_at(self.zone, x, y)]
+
+    def links(self):
+        """
+        Returns (from coords, direction, to coords) for every exit joining
+        the grid's rooms. Every link has its way back in the list too.
+        """
+        placed = set(self.coords)
+        links = []
+        for x, y in self.coords:
+            for direction in self.directions:
+                dx, dy = CARDINAL_OFFSETS[direction]
+                if (x + dx, y + dy) in placed:
+                    links.append(((x, y), direction, (x + dx, y + dy)))
+        return links
+
+    def _create_template(self):
+        """ Creates the first room the normal way, for the others to copy. """
+        from evennia import create_object
+        x, y = self.coords[0]
+        room = create_object(ROOM_TYPECLASS, self.name, locks=self.lockstring)
+        with room.traits.batch():
+            room.traits.xcord.base = x
+            room.traits.ycord.base = y
+        info = dict(room.db.info or {})
+        info['zone'] = self.zone
+        info['outdoor room'] = True
+        room.db.info = info
+        if self.map_symbol is not None:
+            room.db.map_symbol = list(self.map_symbol)
+        if self.biome_ratios is not None:
+            room.biomes.clear()
+            for key, ratio in self.biome_ratios.items():
+                room.biomes.set_ratio(key, ratio)
+        ROOM_INDEX.update_room(room)
+        self.template = room
+        self.room_ids[(x, y)] = room.id
+        return room
+
+    def build_rooms(self):
+        """
+        Creates the rooms, copying the template's Attributes, tags and locks.
+        Yields ('rooms', rooms created) after every chunk.
+        """
+        from django.db import transaction
+        from evennia.objects.models import ObjectDB
+        from evennia.typeclasses.attributes import Attribute
+        from evennia.utils.dbserialize import from_pickle, to_pickle
+        template = self._create_template()
+        yield 'rooms', 1
+        rows = list(Attribute.objects.filter(objectdb__id=template.id).values(*_ATTRIBUTE_FIELDS))
+        # the traits hold the coordinates, so each room gets its own copy.
+        # Everything else is the same for every room, so only pickled once.
+        traits_row = next((row for row in rows
+                           if row['db_key'] == 'traits' and row['db_category'] is None), None)
+        traits = from_pickle(traits_row['db_value']) if traits_row else None
+        for row in rows:
+            row['db_value'] = to_pickle(from_pickle(row['db_value']))
+        tag_ids = list(ObjectDB.db_tags.through.objects.filter(
+            objectdb_id=template.id).values_list('tag_id', flat=True))
+        attribute_link = ObjectDB.db_attributes.through
+        tag_link = ObjectDB.db_tags.through
+
+        created = 1
+        for chunk in chunks(self.coords[1:], self.chunk_size):
+            with transaction.atomic():
+                rooms = _bulk_create(ObjectDB, [
+                    ObjectDB(db_key=self.name, db_typeclass_path=template.typeclass_path,
+                             db_home_id=template.db_home_id,
+                             db_lock_storage=template.db_lock_storage,
+                             db_cmdset_storage=template.db_cmdset_storage)
+                    for _ in chunk], db_key=self.name, db_typeclass_path=template.typeclass_path)
+                attributes, owners = [], []
+                for room, (x, y) in zip(rooms, chunk):
+                    for row in rows:
+                        values = dict(row)
+                        if row is traits_row:
+                            values['db_value'] = to_pickle(self._place_traits(traits, x, y))
+                        attributes.append(Attribute(**values))
+                        owners.append(room.id)
+                attributes = _bulk_create(Attribute, attributes)
+                attribute_link.objects.bulk_create([
+                    attribute_link(objectdb_id=room_id, attribute_id=attribute.id)
+                    for room_id, attribute in zip(owners, attributes)])
+                tag_link.objects.bulk_create([
+                    tag_link(objectdb_id=room.id, tag_id=tag_id)
+                    for room in rooms for tag_id in tag_ids])
+            for room, coords in zip(rooms, chunk):
+                self.room_ids[coords] = room.id
+            created += len(chunk)
+            yield 'rooms', created
+        BUILD_LOG.info("Room grid created {} rooms in zone {}.", created, self.zone)
+
+    @staticmethod
+    def _place_traits(traits, x, y):
+        """ Returns a copy of the template's trait data moved to x, y. """
+        placed = dict(traits)
+        for trait, coord in (('xcord', x), ('ycord', y)):
+            if trait in placed:
+                placed[trait] = dict(placed[trait], base=coord)
+        return placed
+
+    def build_exits(self):
+        """
+        Creates the exits between the rooms. The first is created the normal
+        way and the rest copy its locks. Yields ('exits', exits created)
+        after every chunk.
+        """
+        from django.db import transaction
+        from evennia import create_object
+        from evennia.objects.models import ObjectDB
+        from evennia.typeclasses.tags import Tag
+        links = [(self.room_ids[start], direction, self.room_ids[end])
+                 for start, direction, end in self.links()
+                 if start in self.room_ids and end in self.room_ids]
+        if not links:
+            return
+        room_id, direction, destination_id = links[0]
+        rooms = ObjectDB.objects.in_bulk([room_id, destination_id])
+        first = create_object(EXIT_TYPECLASS, direction, rooms[room_id], locks=self.lockstring,
+                              destination=rooms[destination_id],
+                              aliases=[DIRECTION_ALIASES[direction]])
+        self._created_exit(room_id, direction)
+        yield 'exits', self.exits_created
+        # every direction's alias is the same Tag, shared by all exits
+        alias_tags = {
+            direction: Tag.objects.get_or_create(db_key=alias, db_category=None,
+                                                 db_tagtype='alias', db_model='objectdb')[0].id
+            for direction, alias in DIRECTION_ALIASES.items()}
+        tag_link = ObjectDB.db_tags.through
+
+        for chunk in chunks(links[1:], self.chunk_size):
+            with transaction.atomic():
+                exits = _bulk_create(ObjectDB, [
+                    ObjectDB(db_key=direction, db_typeclass_path=first.typeclass_path,
+                             db_location_id=room_id, db_destination_id=destination_id,
+                             db_home_id=room_id, db_lock_storage=first.db_lock_storage,
+                             db_cmdset_storage=first.db_cmdset_storage)
+                    for room_id, direction, destination_id in chunk],
+                    db_typeclass_path=first.typeclass_path, db_location__isnull=False)
+                tag_link.objects.bulk_create([
+                    tag_link(objectdb_id=exit.id, tag_id=alias_tags[direction])
+                    for exit, (room_id, direction, destination_id) in zip(exits, chunk)])
+            for room_id, direction, destination_id in chunk:
+                self._created_exit(room_id, direction)
+            yield 'exits', self.exits_created
+        BUILD_LOG.info("Room grid created {} exits in zone {}.", self.exits_created, self.zone)
+
+    def _created_exit(self, room_id, direction):
+        self.exit_keys.setdefault(room_id, []).append(direction)
+        self.exits_created += 1
+
+    def steps(self):
+        """ Both passes, one after the other. """
+        yield from self.build_rooms()
+        yield from self.build_exits()
+
+    def finish(self, cancelled=False):
+        """
+        Adds the rooms created (as many as were, if the job was cancelled)
+        to the room index, and lets the template room see its new exits.
+        """
+        if self.template is None:
+            return
+        self.template.contents_cache.init()
+        cell = make_cell(self.template)
+        ROOM_INDEX.add_cells(
+            cell._replace(room_id=room_id, zone=zone_key(self.zone), x=x, y=y,
+                          exits=tuple(self.exit_keys.get(room_id, ())))
+            for (x, y), room_id in self.room_ids.items())
+
+    def run(self, progress=None):
+        """
+        Builds the whole grid in one go, calling progress(stage, done) after
+        each chunk. Returns the number of rooms created.
+        """
+        for stage, done in self.steps():
+            if progress:
+                progress(stage, done)
+        self.finish()
+        return len(self.room_ids)
@@ -62,6 +62,28 @@ Example:
         def traits(self):
             return TraitHandler(self)
     ```
+**Batching Changes**
+    Every change to a trait normally saves the handler's whole Attribute.
+    When changing a lot of traits at once (creating an object, applying a
+    tick to every gauge, etc), wrap the changes in `batch()` and they will be
+    saved together, once, when the block ends. Batches can be nested; only
+    the outermost one saves.
+    Example:
+        ```python
+        >>> with obj.traits.batch():
+        ...     obj.traits.hp.current += 5
+        ...     obj.traits.sp.current += 5
+        ```
+**Bulk Queries**
+    `TraitHandler.bulk_values()` reads the same traits from many objects in
+    one database query, without loading the objects or their handlers, and
+    returns them as NumPy columns.
+    Example:
+        ```python
+        >>> values = TraitHandler.bulk_values(rooms, ('xcord', 'ycord'))
+        >>> values['id'], values['xcord'], values['ycord']
+        (array([12, 15]), array([0., 1.]), array([3., 3.]))
+        ```
 **Trait Configuration**
     `Trait` objects can be configured as one of three basic types with
     increasingly complex behavior.
@@ -220,10 +242,24 @@ Example:
 from evennia.utils.dbserialize import _SaverDict
 from evennia.utils import logger, lazy_property
 from functools import total_ordering, reduce
+from contextlib import contextmanager
+from copy import deepcopy
+import numpy as np
 
 TRAIT_TYPES = ('static', 'counter', 'gauge')
 RANGE_TRAITS = ('counter', 'gauge')
 
+# marks a trait that has no 'current' value stored yet
+_UNSET = object()
+
+
+class _BatchDict(dict):
+    """
+    Trait data held in memory rather than in an Attribute: either by a
+    TraitHandler batch (and saved when the batch ends) or read by a bulk
+    query.
+    """
+
 
 class TraitException(Exception):
     """Base exception class raised by `Trait` objects.
@@ -244,8 +280,12 @@ class TraitHandler(object):
         if not obj.attributes.has(db_attribute):
             obj.attributes.add(db_attribute, {})
 
+        self.obj = obj
+        self.db_attribute = db_attribute
         self.attr_dict = obj.attributes.get(db_attribute)
         self.cache = {}
+        self.batch_depth = 0
+        self.sorted_keys = None
 
     def __len__(self):
         """Return number of Traits in 'attr_dict'."""
@@ -253,7 +293,8 @@ class TraitHandler(object):
 
     def __setattr__(self, key, value):
         """Returns error message if trait objects are assigned directly."""
-        if key in ('attr_dict', 'cache'):
+        if key in ('obj', 'db_attribute', 'attr_dict', 'cache', 'batch_depth',
+                   'sorted_keys'):
             super(TraitHandler, self).__setattr__(key, value)
         else:
             raise TraitException(
@@ -287,7 +328,7 @@ class TraitHandler(object):
             if trait not in self.attr_dict:
                 return None
             data = self.attr_dict[trait]
-            self.cache[trait] = Trait(data)
+            self.cache[trait] = Trait(data, handler=self)
         return self.cache[trait]
 
     def add(self, key, name, type='static',
@@ -308,7 +349,10 @@ class TraitHandler(object):
             if max:
                 trait.update(dict(max=max))
 
+            if self.batch_depth:
+                trait = _BatchDict(deepcopy(trait))
             self.attr_dict[key] = trait
+            self.sorted_keys = None
         else:
             raise TraitException("Invalid trait type specified.")
 
@@ -320,12 +364,87 @@ class TraitHandler(object):
         if trait in self.cache:
             del self.cache[trait]
         del self.attr_dict[trait]
+        self.sorted_keys = None
 
     def clear(self):
         """Remove all Traits from the handler's parent object."""
         for trait in list(self.all):
             self.remove(trait)
 
+    @contextmanager
+    def batch(self):
+        """
+        Context manager that holds every change made to the handler's traits
+        in memory and saves them to the database once, when the block ends
+        (even if it ends with an exception). Nested batches are saved by the
+        outermost one.
+        """
+        if not self.batch_depth:
+            self._detach()
+        self.batch_depth += 1
+        try:
+            yield self
+        finally:
+            self.batch_depth -= 1
+            if not self.batch_depth:
+                self._save()
+
+    def _detach(self):
+        """Swaps the stored trait data for in-memory copies."""
+        attr_dict = self.attr_dict
+        self.attr_dict = {
+            key: _BatchDict(data.deserialize() if hasattr(data, 'deserialize')
+                            else deepcopy(data))
+            for key, data in attr_dict.items()}
+        for key, trait in self.cache.items():
+            trait._rebind(self.attr_dict[key])
+
+    def _save(self):
+        """Saves the in-memory trait data in one write and reattaches to it."""
+        self.obj.attributes.add(self.db_attribute,
+                                {key: dict(data) for key, data in self.attr_dict.items()})
+        self.attr_dict = self.obj.attributes.get(self.db_attribute)
+        for key, trait in self.cache.items():
+            trait._rebind(self.attr_dict[key])
+
+    @staticmethod
+    def bulk_values(objs_or_ids, keys, db_attribute='traits', value='actual'):
+        """
+        Reads traits from many objects in a single database query.
+        Args:
+            objs_or_ids (QuerySet or list): a queryset of objects, or a list
+                of objects and/or object ids
+            keys (list): the trait keys to read, e.g. ('xcord', 'ycord')
+            db_attribute (str): the DB attribute the traits are stored in
+            value (str): the trait property to read, 'actual' by default.
+                'base', 'mod' and 'current' also work.
+        Returns:
+            (dict): 'id' -> array of the object ids (ascending) that have the
+            db_attribute, plus trait key -> float array of the values in the
+            same order. Objects missing a trait get NaN.
+        """
+        from evennia.typeclasses.attributes import Attribute
+        from evennia.utils.dbserialize import from_pickle
+        attributes = Attribute.objects.filter(db_key=db_attribute,
+                                              db_category__isnull=True)
+        if hasattr(objs_or_ids, 'model'):
+            attributes = attributes.filter(objectdb__in=objs_or_ids)
+        else:
+            ids = [obj if isinstance(obj, int) else obj.id for obj in objs_or_ids]
+            attributes = attributes.filter(objectdb__id__in=ids)
+        rows = sorted(attributes.values_list('objectdb__id', 'db_value'),
+                      key=lambda row: row[0])
+        values = {'id': np.array([row[0] for row in rows], dtype=np.int64)}
+        for key in keys:
+            values[key] = np.full(len(rows), np.nan)
+        for index, (obj_id, stored) in enumerate(rows):
+            stored = from_pickle(stored) or {}
+            for key in keys:
+                data = stored.get(key)
+                if data:
+                    values[key][index] = getattr(Trait(_BatchDict(data)), value)
+        return values
+
     @property
     def all(self):
         """Return a list of all trait keys in this TraitHandler."""
@@ -334,7 +453,46 @@ class TraitHandler(object):
     @property
     def all_dict(self):
         """Return a dict of all traits in this TraitHandler."""
-        return {k: v for k, v in sorted(self.attr_dict.items(), key=lambda item: (item[1]['base'] + item[1]['mod']), reverse=True)}
+        attr_dict = self.attr_dict
+        return {k: attr_dict[k] for k in self._sorted_keys()}
+
+    def top(self, count=None, nonzero=False):
+        """
+        Returns a dict of the traits with the largest `base`+`mod` values,
+        largest first.
+        Args:
+            count (int): how many traits to return, all of them if None
+            nonzero (bool): skip traits whose `base`+`mod` is zero
+        """
+        attr_dict = self.attr_dict
+        top = {}
+        for key in self._sorted_keys():
+            if count is not None and len(top) >= count:
+                break
+            data = attr_dict[key]
+            if nonzero and not data['base'] + data['mod']:
+                continue
+            top[key] = data
+        return top
+
+    def filter(self, predicate):
+        """
+        Returns a dict, in all_dict order, of the traits whose data dict the
+        predicate returns True for.
+        """
+        attr_dict = self.attr_dict
+        return {k: attr_dict[k] for k in self._sorted_keys() if predicate(attr_dict[k])}
+
+    def _sorted_keys(self):
+        """
+        Returns the trait keys sorted by `base`+`mod`, largest first. The order
+        is cached until a trait is added or removed or a base/mod is changed.
+        """
+        if self.sorted_keys is None:
+            self.sorted_keys = [k for k, v in sorted(
+                self.attr_dict.items(), key=lambda item: (item[1]['base'] + item[1]['mod']),
+                reverse=True)]
+        return self.sorted_keys
 
 
 @total_ordering
@@ -342,15 +500,25 @@ class Trait(object):
     """Represents an object or Character trait.
     Note:
         See module docstring for configuration details.
+        A Trait keeps its own copy of the values in its data dict and caches
+        the values worked out from them (bounds, `actual`, etc). Both are
+        refreshed whenever a value is written through the Trait's properties,
+        so always change traits through the Trait (or TraitHandler) rather
+        than editing the stored dict directly.
     """
-    def __init__(self, data):
+    __slots__ = ('_data', '_type', '_base', '_mod', '_min', '_max',
+                 '_current', '_cache', '_handler')
+    _keys = ('name', 'type', 'base', 'mod',
+             'current', 'min', 'max', 'extra')
+
+    def __init__(self, data, handler=None):
         if not 'name' in data:
             raise TraitException(
                 "Required key not found in trait data: 'name'")
         if not 'type' in data:
             raise TraitException(
                 "Required key not found in trait data: 'type'")
-        self._type = data['type']
+        super(Trait, self).__setattr__('_type', data['type'])
         if not 'base' in data:
             data['base'] = 0
         if not 'mod' in data:
@@ -362,12 +530,17 @@ class Trait(object):
         if 'max' not in data:
             data['max'] = 'base' if self._type == 'gauge' else None
 
-        self._data = data
-        self._keys = ('name', 'type', 'base', 'mod',
-                      'current', 'min', 'max', 'extra')
-        self._locked = True
-
-        if not isinstance(data, _SaverDict):
+        set_slot = super(Trait, self).__setattr__
+        set_slot('_data', data)
+        set_slot('_base', data['base'])
+        set_slot('_mod', data['mod'])
+        set_slot('_min', data['min'])
+        set_slot('_max', data['max'])
+        set_slot('_current', data.get('current', _UNSET))
+        set_slot('_cache', None)
+        set_slot('_handler', handler)
+
+        if not isinstance(data, (_SaverDict, _BatchDict)):
             logger.log_warn(
                 'Non-persistent {} class loaded.'.format(
                     type(self).__name__
@@ -417,6 +590,9 @@ class Trait(object):
 
     def __getattr__(self, key):
         """Access extra parameters as attributes."""
+        if key in Trait.__slots__:
+            # a slot that hasn't been filled in yet, not an extra parameter
+            raise AttributeError(key)
         if key in self._data['extra']:
             return self._data['extra'][key]
         else:
@@ -429,20 +605,16 @@ class Trait(object):
         """Set extra parameters as attributes.
         Arbitrary attributes set on a Trait object will be
         stored in the 'extra' key of the `_data` attribute.
-        This behavior is enabled by setting the instance
-        variable `_locked` to True.
         """
         propobj = getattr(self.__class__, key, None)
         if isinstance(propobj, property):
             if propobj.fset is None:
                 raise AttributeError("can't set attribute")
             propobj.fset(self, value)
+        elif key in Trait.__slots__ or key == '_keys':
+            raise AttributeError("can't set attribute")
         else:
-            if (self.__dict__.get('_locked', False) and
-                    key not in ('_keys',)):
-                self._data['extra'][key] = value
-            else:
-                super(Trait, self).__setattr__(key, value)
+            self._data['extra'][key] = value
 
     def __delattr__(self, key):
         """Delete extra parameters as attributes."""
@@ -546,12 +718,7 @@ class Trait(object):
     @property
     def actual(self):
         """The "actual" value of the trait."""
-        if self._type == 'gauge':
-            return self.current
-        elif self._type == 'counter':
-            return self._mod_current()
-        else:
-            return self._mod_base()
+        return (self._cache or self._resolve())[4]
 
     @property
     def base(self):
@@ -560,25 +727,25 @@ class Trait(object):
             The setter for this property will enforce any range bounds set
             on this `Trait`.
         """
-        return self._data['base']
+        return self._base
 
     @base.setter
     def base(self, amount):
-        if self._data.get('max', None) == 'base':
-            self._data['base'] = amount
+        if self._max == 'base':
+            self._write('base', amount)
         if type(amount) in (int, float):
-            self._data['base'] = self._enforce_bounds(amount)
+            self._write('base', self._enforce_bounds(amount))
 
     @property
     def mod(self):
         """The trait's modifier."""
-        return self._data['mod']
+        return self._mod
 
     @mod.setter
     def mod(self, amount):
         if type(amount) in (int, float):
-            delta = amount - self._data['mod']
-            self._data['mod'] = amount
+            delta = amount - self._mod
+            self._write('mod', amount)
             if self._type == 'gauge':
                 if delta >= 0:
                     # apply increases to current
@@ -591,7 +758,7 @@ class Trait(object):
     def min(self):
         """The lower bound of the range."""
         if self._type in RANGE_TRAITS:
-            return self._data['min']
+            return self._min
         else:
             raise AttributeError(
                 "static 'Trait' object has no attribute 'min'.")
@@ -599,9 +766,9 @@ class Trait(object):
     @min.setter
     def min(self, amount):
         if self._type in RANGE_TRAITS:
-            if amount is None: self._data['min'] = amount
+            if amount is None: self._write('min', amount)
             elif type(amount) in (int, float):
-                self._data['min'] = amount if amount < self.base else self.base
+                self._write('min', amount if amount < self._base else self._base)
         else:
             raise AttributeError(
                 "static 'Trait' object has no attribute 'min'.")
@@ -615,10 +782,10 @@ class Trait(object):
             `mod`+`base` properties.
         """
         if self._type in RANGE_TRAITS:
-            if self._data['max'] == 'base':
-                return self._mod_base()
+            if self._max == 'base':
+                return (self._cache or self._resolve())[2]
             else:
-                return self._data['max']
+                return self._max
         else:
             raise AttributeError(
                 "static 'Trait' object has no attribute 'max'.")
@@ -627,9 +794,9 @@ class Trait(object):
     def max(self, value):
         if self._type in RANGE_TRAITS:
             if value == 'base' or value is None:
-                self._data['max'] = value
+                self._write('max', value)
             elif type(value) in (int, float):
-                self._data['max'] = value if value > self.base else self.base
+                self._write('max', value if value > self._base else self._base)
         else:
             raise AttributeError(
                 "static 'Trait' object has no attribute 'max'.")
@@ -637,16 +804,13 @@ class Trait(object):
     @property
     def current(self):
         """The `current` value of the `Trait`."""
-        if self._type == 'gauge':
-            return self._data.get('current', self._mod_base())
-        else:
-            return self._data.get('current', self.base)
+        return (self._cache or self._resolve())[3]
 
     @current.setter
     def current(self, value):
         if self._type in RANGE_TRAITS:
             if type(value) in (int, float):
-                self._data['current'] = self._enforce_bounds(value)
+                self._write('current', self._enforce_bounds(value))
         else:
             raise AttributeError(
                 "'current' property is read-only on static 'Trait'.")
@@ -734,19 +898,65 @@ class Trait(object):
 
     # Private members
 
+    def _rebind(self, data):
+        """
+        Points the trait at a new copy of its data (holding the same values),
+        used by TraitHandler.batch().
+        """
+        super(Trait, self).__setattr__('_data', data)
+
+    def _write(self, key, value):
+        """Stores a value in the trait data and clears the cached values."""
+        self._data[key] = value
+        set_slot = super(Trait, self).__setattr__
+        set_slot('_' + key, value)
+        set_slot('_cache', None)
+        if key in ('base', 'mod') and self._handler is not None:
+            # the handler's sorted order may have changed
+            self._handler.sorted_keys = None
+
+    def _resolve(self):
+        """
+        Works out the trait's bounds and values from base, mod, min, max and
+        current, and caches them until one of those is written again.
+        Returns:
+            (tuple): (lower bound, upper bound, mod+base, current, actual)
+        """
+        base, mod = self._base, self._mod
+        if self._type in RANGE_TRAITS:
+            low = self._min
+            high = mod + base if self._max == 'base' else self._max
+        else:
+            low = high = None
+        mod_base = self._clamp(mod + base, low, high)
+        current = self._current
+        if current is _UNSET:
+            current = mod_base if self._type == 'gauge' else base
+        if self._type == 'gauge':
+            actual = current
+        elif self._type == 'counter':
+            actual = self._clamp(mod + current, low, high)
+        else:
+            actual = mod_base
+        cache = (low, high, mod_base, current, actual)
+        super(Trait, self).__setattr__('_cache', cache)
+        return cache
+
+    @staticmethod
+    def _clamp(value, low, high):
+        if low is not None and value <= low:
+            return low
+        if high is not None and value >= high:
+            return high
+        return value
+
     def _mod_base(self):
-        return self._enforce_bounds(self.mod + self.base)
+        return (self._cache or self._resolve())[2]
 
     def _mod_current(self):
-        return self._enforce_bounds(self.mod + self.current)
+        return self._enforce_bounds(self._mod + self.current)
 
     def _enforce_bounds(self, value):
         """Ensures that incoming value falls within trait's range."""
-        if self._type in RANGE_TRAITS:
-            if self.min is not None and value <= self.min:
-                return self.min
-            if self._data['max'] == 'base' and value >= self.mod + self.base:
-                return self.mod + self.base
-            if self.max is not None and value >= self.max:
-                return self.max
-        return value
\ No newline at end of file
+        low, high = (self._cache or self._resolve())[:2]
+        return self._clamp(value, low, high)
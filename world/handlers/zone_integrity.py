@@ -0,0 +1,219 @@
+# coding=utf-8
+"""
+Zone Integrity
+This file contains the scanner that checks a whole zone (or every zone) for
+building mistakes in one pass, rather than a room at a time in the sculpting
+menu. It looks for:
+    collisions - more than one room on the same coordinates
+    one way exits - a cardinal exit whose destination has no exit back
+    wrong direction - a cardinal exit that doesn't lead to the room its
+        direction says it should, going by the coordinates
+    mismatched returns - an exit back that isn't the opposite direction
+    missing exits - a room next to another (by coordinates) without an exit
+        toward it
+The coordinates come from the room index and the exits are read from the
+database a chunk of rooms per query, so no rooms are loaded:
+    report = scan_zone('Northern Forest')
+    caller.msg(report.format())
+The report also holds a fix plan, the exits that would put the one way and
+missing exits right, which fix_steps() creates (as a builder job).
+"""
+from world.handlers.map_index import (CARDINAL_OFFSETS, DIRECTION_ALIASES, OPPOSITE_DIRECTIONS,
+                                      ROOM_INDEX, zone_key)
+from world.handlers.db_utils import chunks
+from world.handlers.game_log import get_log
+
+BUILD_LOG = get_log('room_build_debug.log')
+
+# how many problems of each kind the report lists before summarizing
+REPORT_LIMIT = 20
+# rooms without a zone (indoor rooms, building & town entrances) and combat
+# subsections aren't laid out on a shared grid, so they can't be scanned
+UNSCANNED_ZONES = (None, ('Combat Room',))
+
+
+def read_exits(room_ids):
+    """
+    Returns a dict of room id -> list of (exit id, key, destination id) for
+    the exits in the rooms.
+    """
+    from evennia.objects.models import ObjectDB
+    exits = {}
+    for chunk in chunks(sorted(room_ids)):
+        rows = ObjectDB.objects.filter(
+            db_location__id__in=chunk, db_destination__isnull=False).values_list(
+            'id', 'db_key', 'db_location__id', 'db_destination__id')
+        for exit_id, key, room_id, destination_id in rows:
+            exits.setdefault(room_id, []).append((exit_id, key.lower(), destination_id))
+    return exits
+
+
+class ZoneReport(object):
+    """
+    The problems found in a zone. Each list holds tuples:
+        collisions: (x, y, [room ids])
+        one_way: (exit id, room id, direction, destination id)
+        wrong_direction: (exit id, room id, direction, destination id, (dx, dy))
+        mismatched_returns: (exit id, room id, direction, destination id, back exit key)
+        missing_exits: (room id, direction, adjacent room id)
+    fix_plan is a list of (room id, direction, destination id) exits to create.
+    """
+    def __init__(self, zone, room_count=0, exit_count=0):
+        self.zone = zone
+        self.room_count = room_count
+        self.exit_count = exit_count
+        self.collisions = []
+        self.one_way = []
+        self.wrong_direction = []
+        self.mismatched_returns = []
+        self.missing_exits = []
+        self.fix_plan = []
+
+    def __bool__(self):
+        return bool(self.collisions or self.one_way or self.wrong_direction
+                    or self.mismatched_returns or self.missing_exits)
+
+    def format(self, limit=REPORT_LIMIT):
+        """ Returns the report as text for a builder. """
+        lines = [f"|yZone {self.zone}:|n {self.room_count} rooms, {self.exit_count} exits."]
+        sections = (
+            ("Coordinate collisions", self.collisions,
+             lambda x, y, ids: f"{x}, {y}: " + ", ".join(f"#{room_id}" for room_id in ids)),
+            ("One way exits", self.one_way,
+             lambda exit_id, room_id, direction, to_id:
+             f"#{room_id} {direction} -> #{to_id} (exit #{exit_id})"),
+            ("Exits disagreeing with coordinates", self.wrong_direction,
+             lambda exit_id, room_id, direction, to_id, offset:
+             f"#{room_id} {direction} -> #{to_id} is {offset[0]:+}, {offset[1]:+} away"),
+            ("Mismatched return exits", self.mismatched_returns,
+             lambda exit_id, room_id, direction, to_id, back:
+             f"#{room_id} {direction} -> #{to_id} returns by {back}"),
+            ("Missing exits", self.missing_exits,
+             lambda room_id, direction, to_id: f"#{room_id} has no {direction} exit to #{to_id}"),
+        )
+        for title, problems, describe in sections:
+            lines.append(f"  |y{title}:|n {len(problems)}")
+            for problem in problems[:limit]:
+                lines.append("    " + describe(*problem))
+            if len(problems) > limit:
+                lines.append(f"    ...and {len(problems) - limit} more.")
+        if self.fix_plan:
+            lines.append(f"  |yFix plan:|n create {len(self.fix_plan)} exits.")
+        return "\n".join(lines)
+
+
+def scan_zone(zone, room_ids=None):
+    """
+    Checks every indexed room in the zone (or just the given room ids in
+    it). Returns a ZoneReport. Raises ValueError for the UNSCANNED_ZONES.
+    """
+    zone = zone_key(zone)
+    if zone in UNSCANNED_ZONES:
+        raise ValueError(f"Rooms in the zone {zone} aren't on a shared grid and can't be checked.")
+    if room_ids is None:
+        room_ids = ROOM_INDEX.room_ids_in_zone(zone)
+    cells = ROOM_INDEX.cells
+    exits = read_exits(room_ids)
+    report = ZoneReport(zone, len(room_ids), sum(len(room_exits) for room_exits in exits.values()))
+    # exits leading out of the zone need the other side's exits to check for a way back
+    inside = set(room_ids)
+    outside = {destination_id for room_exits in exits.values()
+               for exit_id, key, destination_id in room_exits if destination_id not in inside}
+    if outside:
+        exits.update(read_exits(outside))
+
+    placed = {}
+    for room_id in room_ids:
+        cell = cells[room_id]
+        placed.setdefault((cell.x, cell.y), []).append(room_id)
+    report.collisions = sorted((x, y, sorted(ids)) for (x, y), ids in placed.items()
+                               if len(ids) > 1)
+    crowded = {room_id for x, y, ids in report.collisions for room_id in ids}
+
+    planned = set()
+
+    def plan(room_id, direction, destination_id):
+        if (room_id, direction) not in planned:
+            planned.add((room_id, direction))
+            report.fix_plan.append((room_id, direction, destination_id))
+
+    for room_id in sorted(room_ids):
+        cell = cells[room_id]
+        room_exits = exits.get(room_id, [])
+        directions = {key for exit_id, key, destination_id in room_exits}
+        for exit_id, direction, destination_id in room_exits:
+            offset = CARDINAL_OFFSETS.get(direction)
+            if offset is None:
+                continue
+            back_keys = [key for back_id, key, back_to in exits.get(destination_id, [])
+                         if back_to == room_id]
+            destination = cells.get(destination_id)
+            if destination is not None and destination.zone == zone:
+                actual = (destination.x - cell.x, destination.y - cell.y)
+                if actual != offset:
+                    report.wrong_direction.append(
+                        (exit_id, room_id, direction, destination_id, actual))
+                    continue
+            if not back_keys:
+                report.one_way.append((exit_id, room_id, direction, destination_id))
+                back = OPPOSITE_DIRECTIONS[direction]
+                taken = {key for back_id, key, back_to in exits.get(destination_id, [])}
+                if destination is not None and back not in taken:
+                    plan(destination_id, back, room_id)
+            elif OPPOSITE_DIRECTIONS[direction] not in back_keys:
+                report.mismatched_returns.append(
+                    (exit_id, room_id, direction, destination_id, back_keys[0]))
+        if room_id in crowded:
+            # can't tell which room an exit should lead to or from
+            continue
+        for neighbor_id, direction in ROOM_INDEX.neighbors(zone, cell.x, cell.y):
+            if direction not in directions and neighbor_id not in crowded:
+                report.missing_exits.append((room_id, direction, neighbor_id))
+                plan(room_id, direction, neighbor_id)
+
+    BUILD_LOG.info("Scanned zone {}: {} rooms, {} collisions, {} one way, {} wrong direction, "
+                   "{} mismatched, {} missing exits.", zone, report.room_count,
+                   len(report.collisions), len(report.one_way), len(report.wrong_direction),
+                   len(report.mismatched_returns), len(report.missing_exits))
+    return report
+
+
+def scan_world(zones=None):
+    """
+    Checks every zone in the room index (or the given zones), but the
+    UNSCANNED_ZONES. Returns a list of reports.
+    """
+    ROOM_INDEX.ensure_built()
+    # sort the rooms into zones in one pass over the index
+    by_zone = {}
+    for room_id, cell in ROOM_INDEX.cells.items():
+        by_zone.setdefault(cell.zone, []).append(room_id)
+    if zones is None:
+        zones = sorted(by_zone, key=str)
+    return [scan_zone(zone, by_zone.get(zone_key(zone), [])) for zone in zones
+            if zone_key(zone) not in UNSCANNED_ZONES]
+
+
+def fix_steps(fix_plan, chunk_size=100):
+    """
+    Creates the exits in a report's fix plan. A generator that yields
+    ('fixing', exits created) after every chunk, for running as a builder job
+    (on the reactor, as it creates objects).
+    """
+    from evennia import create_object
+    from evennia.objects.models import ObjectDB
+    done = 0
+    for chunk in chunks(fix_plan, chunk_size):
+        rooms = ObjectDB.objects.in_bulk({room_id for plan in chunk for room_id in (plan[0], plan[2])})
+        for room_id, direction, destination_id in chunk:
+            room, destination = rooms.get(room_id), rooms.get(destination_id)
+            if room is None or destination is None:
+                continue
+            if any(exit.key.lower() == direction for exit in room.exits):
+                # built since the scan
+                continue
+            create_object('typeclasses.exits.Exit', key=direction, location=room,
+                          destination=destination, aliases=[DIRECTION_ALIASES[direction]])
+            done += 1
+        yield 'fixing', done
+    BUILD_LOG.info("Zone fix plan created {} exits.", done)
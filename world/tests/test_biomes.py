@@ -0,0 +1,45 @@
+# coding=utf-8
+"""
+Tests for the biome handler. Run with `evennia test --settings settings.py world`.
+"""
+from evennia.utils.test_resources import BaseEvenniaTest
+from world.handlers.biomes import BiomeHandler
+
+
+class TestBiomeMigration(BaseEvenniaTest):
+    def setUp(self):
+        super().setUp()
+        # biomes as rooms stored them before the catalog: every biome in full
+        self.obj1.attributes.add('biome', {
+            'forest': {'name': 'Forest', 'type': 'static', 'base': 0.6, 'mod': 0,
+                       'extra': {}},
+            'road': {'name': 'Road', 'type': 'static', 'base': 0.3, 'mod': 0.1,
+                     'extra': {'condition': 0.5, 'quality': .75, 'width': 5,
+                               'road_type': 'pavement_stones'}},
+            'swamp': {'name': 'Swamp', 'type': 'static', 'base': 0, 'mod': 0,
+                      'extra': {}},
+            'lava': {'name': 'Lava', 'type': 'static', 'base': 1, 'mod': 0},
+        })
+
+    def test_migrates_old_biome_attribute(self):
+        biomes = BiomeHandler(self.obj1)
+        self.assertFalse(self.obj1.attributes.has('biome'))
+        self.assertEqual(self.obj1.attributes.get('biome_ratios'), {'forest': 0.6, 'road': 0.4})
+        # only the extra values that differ from the catalog are kept
+        self.assertEqual(self.obj1.attributes.get('biome_extras'), {'road': {'condition': 0.5}})
+        self.assertEqual(self.obj1.attributes.get('vegetation'), 0)
+        self.assertEqual(biomes.forest.base, 0.6)
+        self.assertEqual(biomes.road.condition, 0.5)
+        self.assertEqual(biomes.road.quality, .75)
+        self.assertEqual(biomes.swamp.base, 0)
+
+    def test_migrates_once(self):
+        BiomeHandler(self.obj1).set_ratio('fields', 0.2)
+        biomes = BiomeHandler(self.obj1)
+        self.assertEqual(biomes.ratio('fields'), 0.2)
+        self.assertEqual(biomes.ratio('road'), 0.4)
+
+    def test_new_room_has_no_biomes(self):
+        biomes = BiomeHandler(self.obj2)
+        self.assertEqual(self.obj2.attributes.get('biome_ratios'), {})
+        self.assertEqual(biomes.ratio('forest'), 0)
@@ -0,0 +1,68 @@
+# coding=utf-8
+"""
+Tests for the combat handler. Run with `evennia test --settings settings.py world`.
+"""
+from unittest.mock import patch
+from evennia import create_script
+from evennia.utils.test_resources import BaseEvenniaTest
+from world.handlers.combat_scheduler import COMBAT_SCHEDULER
+from world.handlers.combat_messages import CombatMessageBuffer
+
+
+class TestCombatHandler(BaseEvenniaTest):
+    def setUp(self):
+        super().setUp()
+        for character in (self.char1, self.char2):
+            character.db.info = {'Default Attack': 'punch', 'In Combat': False,
+                                 'Position': 'standing'}
+        self.handler = create_script('world.handlers.combat_handler.CombatHandler',
+                                     obj=self.room1)
+
+    def tearDown(self):
+        self.handler.stop()
+        super().tearDown()
+
+    def test_room(self):
+        self.assertEqual(self.handler.room, self.room1)
+
+    def test_add_character(self):
+        self.handler.add_character(self.char1)
+        self.handler.add_character(self.char2)
+        self.assertTrue(self.char1.db.info['In Combat'])
+        self.assertEqual(set(self.handler.state.characters), {self.char1.id, self.char2.id})
+
+    def test_setup_battlefield(self):
+        self.handler.add_character(self.char1)
+        self.handler.add_character(self.char2)
+        battlefield = self.handler.state.battlefield_map
+        self.assertIsNotNone(battlefield)
+        self.assertIn(self.char1, battlefield)
+        self.assertEqual(battlefield.position(self.char2), (0, 0))
+        self.assertIs(self.handler.setup_battlefield(), battlefield)
+        self.assertEqual(self.handler.move_character(self.char1, 'north'), (0, 1))
+        self.assertEqual(battlefield.distance(self.char1, self.char2), 1)
+
+    def test_resolve_round(self):
+        self.handler.add_character(self.char1)
+        self.handler.add_character(self.char2)
+        self.handler.add_action('kick', self.char1)
+        batch = self.handler.resolve_round()
+        self.assertEqual(len(batch), 2)
+        self.assertEqual(batch.actions[0], 'kick')
+        self.assertEqual(self.handler.state.round_count, 2)
+        self.assertEqual(len(self.handler.state.messages), 0)
+
+    def test_failed_flush_clears_messages(self):
+        self.handler.add_character(self.char1)
+        self.handler.add_character(self.char2)
+        with patch.object(CombatMessageBuffer, 'flush', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.handler.resolve_round()
+        self.assertEqual(len(self.handler.state.messages), 0)
+
+    def test_scheduler_runs_rounds(self):
+        self.handler.add_character(self.char1)
+        self.handler.add_character(self.char2)
+        for _ in range(COMBAT_SCHEDULER.slot_count):
+            COMBAT_SCHEDULER.tick()
+        self.assertEqual(self.handler.state.round_count, 2)
@@ -0,0 +1,62 @@
+# coding=utf-8
+"""
+Tests for the coordinate worm. Run with `evennia test --settings settings.py world`.
+"""
+from evennia.objects.models import ObjectDB
+from evennia.utils import create
+from evennia.utils.test_resources import BaseEvenniaTest
+from world.handlers.coordinate_worm import CoordinateWorm
+from world.handlers.map_index import ROOM_INDEX
+
+
+class TestCoordinateWorm(BaseEvenniaTest):
+    def setUp(self):
+        super().setUp()
+        ROOM_INDEX.clear()
+        # start -east-> east_room -North-> north_room, plus an up exit the
+        # worm doesn't follow
+        self.start, self.east_room, self.north_room, self.upstairs = [
+            create.create_object('typeclasses.rooms.Room', key=f"Worm Room {number}")
+            for number in range(4)]
+        with self.start.traits.batch():
+            self.start.traits.xcord.base = 3
+            self.start.traits.ycord.base = 4
+        self.start.db.info = {'non-combat room': False, 'outdoor room': True,
+                              'zone': 'Worm Zone'}
+        for location, key, destination in ((self.start, 'east', self.east_room),
+                                           (self.east_room, 'west', self.start),
+                                           (self.east_room, 'North', self.north_room),
+                                           (self.north_room, 'up', self.upstairs)):
+            create.create_object('typeclasses.exits.Exit', key=key, location=location,
+                                 destination=destination)
+
+    def tearDown(self):
+        ROOM_INDEX.clear()
+        super().tearDown()
+
+    def reloaded(self, room):
+        return ObjectDB.objects.get(id=room.id)
+
+    def test_explore(self):
+        worm = CoordinateWorm(self.start)
+        list(worm.explore())
+        self.assertEqual(worm.coords, {self.start.id: (3, 4), self.east_room.id: (4, 4),
+                                       self.north_room.id: (4, 5)})
+
+    def test_saves_loaded_and_stored_rooms(self):
+        # the north room isn't loaded, so it is written straight to the database
+        self.north_room.flush_from_cache(force=True)
+        self.assertIsNone(ObjectDB.get_cached_instance(self.north_room.id))
+        self.assertEqual(CoordinateWorm(self.start).run(), 3)
+        for room, coords in ((self.east_room, (4, 4)), (self.north_room, (4, 5))):
+            room = self.reloaded(room)
+            self.assertEqual((room.traits.xcord.base, room.traits.ycord.base), coords)
+            self.assertEqual(room.db.info['zone'], 'Worm Zone')
+            self.assertTrue(room.db.info['outdoor room'])
+            cell = ROOM_INDEX.get_cell(room.id)
+            self.assertEqual((cell.zone, cell.x, cell.y), ('Worm Zone',) + coords)
+        # the rest of the rooms' traits are left alone
+        self.assertEqual(self.reloaded(self.north_room).traits.size.base, 10000)
+        upstairs = self.reloaded(self.upstairs)
+        self.assertEqual(upstairs.db.info['zone'], 'The Outdoors')
+        self.assertEqual((upstairs.traits.xcord.base, upstairs.traits.ycord.base), (0, 0))
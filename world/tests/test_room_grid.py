@@ -0,0 +1,69 @@
+# coding=utf-8
+"""
+Tests for the room grid builder. Run with `evennia test --settings settings.py world`.
+"""
+from unittest.mock import patch
+from django.db import connections, router
+from evennia.objects.models import ObjectDB
+from evennia.utils.test_resources import BaseEvenniaTest
+from world.handlers.map_index import ROOM_INDEX
+from world.handlers.room_grid import RoomGrid
+
+ZONE = 'Grid Zone'
+
+
+class TestRoomGrid(BaseEvenniaTest):
+    def setUp(self):
+        super().setUp()
+        ROOM_INDEX.clear()
+
+    def tearDown(self):
+        ROOM_INDEX.clear()
+        super().tearDown()
+
+    def build(self):
+        # a chunk size of 2 spreads the rooms and exits over several transactions
+        grid = RoomGrid.rectangle(10, -5, 3, 2, zone=ZONE, name='Test Wilds',
+                                  biome_ratios={'forest': 1}, chunk_size=2)
+        self.assertEqual(grid.run(), 6)
+        return grid
+
+    def check_rooms(self, grid):
+        for (x, y), room_id in grid.room_ids.items():
+            room = ObjectDB.objects.get(id=room_id)
+            self.assertEqual(room.typeclass_path, 'typeclasses.rooms.Room')
+            self.assertEqual(room.key, 'Test Wilds')
+            self.assertEqual((room.traits.xcord.base, room.traits.ycord.base), (x, y))
+            self.assertEqual(room.db.info['zone'], ZONE)
+            self.assertEqual(room.biomes.ratio('forest'), 1)
+            cell = ROOM_INDEX.get_cell(room_id)
+            self.assertEqual((cell.zone, cell.x, cell.y), (ZONE, x, y))
+
+    def check_exits(self, grid):
+        # 3x2 rooms: 4 east-west, 3 north-south & 4 diagonal pairs, both ways
+        self.assertEqual(grid.exits_created, 22)
+        room_ids = list(grid.room_ids.values())
+        exits = ObjectDB.objects.filter(db_location__id__in=room_ids,
+                                        db_destination__isnull=False)
+        self.assertEqual(exits.count(), 22)
+        corner = ObjectDB.objects.get(id=grid.room_ids[(10, -5)])
+        corner.contents_cache.init()
+        by_key = {exit.key: exit for exit in corner.exits}
+        self.assertEqual(set(by_key), {'east', 'south', 'southeast'})
+        self.assertEqual(by_key['east'].destination.id, grid.room_ids[(11, -5)])
+        self.assertEqual(by_key['southeast'].destination.id, grid.room_ids[(11, -6)])
+        self.assertIn('se', by_key['southeast'].aliases.all())
+        self.assertEqual(set(ROOM_INDEX.get_cell(corner.id).exits), set(by_key))
+
+    def test_builds_rooms_and_exits(self):
+        grid = self.build()
+        self.check_rooms(grid)
+        self.check_exits(grid)
+
+    def test_backend_without_returned_ids(self):
+        # MySQL/MariaDB don't give back the ids of bulk inserted rows
+        features = type(connections[router.db_for_write(ObjectDB)].features)
+        with patch.object(features, 'can_return_rows_from_bulk_insert', False):
+            grid = self.build()
+        self.check_rooms(grid)
+        self.check_exits(grid)
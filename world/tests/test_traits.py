@@ -0,0 +1,103 @@
+# coding=utf-8
+"""
+Tests for the trait handler. Run with `evennia test --settings settings.py world`.
+"""
+import math
+from unittest.mock import patch
+from evennia.objects.models import ObjectDB
+from evennia.utils import create
+from evennia.utils.test_resources import BaseEvenniaTest
+from world.handlers.traits import Trait, TraitHandler
+
+
+class TestTrait(BaseEvenniaTest):
+    def setUp(self):
+        super().setUp()
+        self.traits = TraitHandler(self.obj1)
+        self.traits.add('hp', 'Health', type='gauge', base=10)
+        self.traits.add('str', 'Strength', base=5)
+
+    def stored(self, key):
+        return self.obj1.attributes.get('traits')[key]
+
+    def test_resolve_is_cached(self):
+        hp = self.traits.hp
+        with patch.object(Trait, '_resolve', autospec=True,
+                          side_effect=Trait._resolve) as resolve:
+            self.assertEqual(hp.actual, 10)
+            self.assertEqual(hp.current, 10)
+            self.assertEqual(hp.max, 10)
+            self.assertEqual(resolve.call_count, 1)
+            hp.mod = 5
+            resolve.reset_mock()
+            self.assertEqual(hp.max, 15)
+            self.assertEqual(hp.actual, 15)
+            self.assertEqual(resolve.call_count, 1)
+
+    def test_writes_refresh_cache_and_store(self):
+        hp = self.traits.hp
+        self.assertEqual(hp.actual, 10)
+        hp.current -= 25
+        self.assertEqual(hp.actual, 0)
+        self.assertEqual(self.stored('hp')['current'], 0)
+        hp.base = 20
+        hp.fill_gauge()
+        self.assertEqual(hp.actual, 20)
+        self.assertEqual(self.stored('hp')['base'], 20)
+        self.assertEqual(self.traits.str.actual, 5)
+
+    def test_nested_batch_saves_once(self):
+        hp, strength = self.traits.hp, self.traits.str
+        hp.current = 8
+        with patch.object(self.obj1.attributes, 'add',
+                          wraps=self.obj1.attributes.add) as add:
+            with self.traits.batch():
+                with self.traits.batch():
+                    hp.current -= 3
+                    strength.mod = 2
+                self.assertEqual(self.stored('hp')['current'], 8)
+                self.traits.add('dex', 'Dexterity', base=4)
+            self.assertEqual(add.call_count, 1)
+        self.assertEqual(self.stored('hp')['current'], 5)
+        self.assertEqual(self.stored('str')['mod'], 2)
+        self.assertEqual(self.stored('dex')['base'], 4)
+        self.assertEqual(strength.actual, 7)
+        hp.current += 1
+        self.assertEqual(self.stored('hp')['current'], 6)
+
+    def test_batch_saves_on_error(self):
+        with self.assertRaises(RuntimeError):
+            with self.traits.batch():
+                self.traits.hp.current = 4
+                raise RuntimeError
+        self.assertEqual(self.stored('hp')['current'], 4)
+
+
+class TestBulkValues(BaseEvenniaTest):
+    def setUp(self):
+        super().setUp()
+        self.rooms = []
+        for number in range(3):
+            room = create.create_object('typeclasses.rooms.Room', key=f"Bulk Room {number}")
+            with room.traits.batch():
+                room.traits.xcord.base = number
+                room.traits.ycord.base = -number
+                room.traits.elev.base = 100 + number
+                room.traits.size.mod = number
+            self.rooms.append(room)
+
+    def test_reads_columns_in_one_query(self):
+        ids = [room.id for room in reversed(self.rooms)]
+        with self.assertNumQueries(1):
+            values = TraitHandler.bulk_values(ids, ('xcord', 'ycord', 'elev', 'size'))
+        self.assertEqual(list(values['id']), sorted(ids))
+        self.assertEqual(list(values['xcord']), [0, 1, 2])
+        self.assertEqual(list(values['ycord']), [0, -1, -2])
+        self.assertEqual(list(values['elev']), [100, 101, 102])
+        self.assertEqual(list(values['size']), [10000, 10001, 10002])
+
+    def test_queryset_and_missing_traits(self):
+        rooms = ObjectDB.objects.filter(id__in=[room.id for room in self.rooms])
+        values = TraitHandler.bulk_values(rooms, ('xcord', 'nope'), value='base')
+        self.assertEqual(list(values['xcord']), [0, 1, 2])
+        self.assertTrue(all(math.isnan(value) for value in values['nope']))
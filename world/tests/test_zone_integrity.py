@@ -0,0 +1,74 @@
+# coding=utf-8
+"""
+Tests for the zone integrity scanner. Run with `evennia test --settings settings.py world`.
+"""
+from evennia.utils import create
+from evennia.utils.test_resources import BaseEvenniaTest
+from world.handlers.map_index import ROOM_INDEX
+from world.handlers.zone_integrity import fix_steps, scan_world, scan_zone
+
+ZONE = 'Check Zone'
+
+
+class TestScanZone(BaseEvenniaTest):
+    def setUp(self):
+        super().setUp()
+        self.rooms = {}
+        for name, (x, y) in (('a', (0, 0)), ('b', (1, 0)), ('one_way', (5, 5)),
+                             ('dead_end', (6, 5)), ('far', (20, 20)), ('farther', (22, 20)),
+                             ('crowd1', (10, 10)), ('crowd2', (10, 10))):
+            room = create.create_object('typeclasses.rooms.Room', key=f"Check {name}")
+            with room.traits.batch():
+                room.traits.xcord.base = x
+                room.traits.ycord.base = y
+            room.db.info = {'non-combat room': False, 'outdoor room': True, 'zone': ZONE}
+            self.rooms[name] = room
+        self.exits = {}
+        for name, location, key, destination in (
+                ('a_east', 'a', 'east', 'b'), ('b_west', 'b', 'West', 'a'),
+                ('a_up', 'a', 'up', 'far'),
+                ('one_way', 'one_way', 'east', 'dead_end'),
+                ('far_east', 'far', 'east', 'farther'), ('farther_west', 'farther', 'west', 'far')):
+            self.exits[name] = create.create_object(
+                'typeclasses.exits.Exit', key=key, location=self.rooms[location],
+                destination=self.rooms[destination])
+        # rebuild the index from the rooms as they are in the database
+        ROOM_INDEX.clear()
+
+    def tearDown(self):
+        ROOM_INDEX.clear()
+        super().tearDown()
+
+    def room_id(self, name):
+        return self.rooms[name].id
+
+    def test_finds_problems(self):
+        room_id, exit_id = self.room_id, lambda name: self.exits[name].id
+        report = scan_zone(ZONE)
+        self.assertEqual(report.room_count, 8)
+        self.assertEqual(report.collisions,
+                         [(10, 10, sorted([room_id('crowd1'), room_id('crowd2')]))])
+        self.assertEqual(report.one_way, [
+            (exit_id('one_way'), room_id('one_way'), 'east', room_id('dead_end'))])
+        self.assertEqual(report.wrong_direction, [
+            (exit_id('far_east'), room_id('far'), 'east', room_id('farther'), (2, 0)),
+            (exit_id('farther_west'), room_id('farther'), 'west', room_id('far'), (-2, 0))])
+        self.assertEqual(report.mismatched_returns, [])
+        self.assertEqual(report.missing_exits, [(room_id('dead_end'), 'west', room_id('one_way'))])
+        self.assertEqual(report.fix_plan, [(room_id('dead_end'), 'west', room_id('one_way'))])
+        self.assertTrue(report)
+
+    def test_fix_plan(self):
+        list(fix_steps(scan_zone(ZONE).fix_plan))
+        self.assertEqual([exit.destination for exit in self.rooms['dead_end'].exits],
+                         [self.rooms['one_way']])
+        report = scan_zone(ZONE)
+        self.assertEqual(report.one_way, [])
+        self.assertEqual(report.missing_exits, [])
+
+    def test_unscanned_zones(self):
+        with self.assertRaises(ValueError):
+            scan_zone(None)
+        with self.assertRaises(ValueError):
+            scan_zone(['Combat Room'])
+        self.assertIn(ZONE, [report.zone for report in scan_world()])